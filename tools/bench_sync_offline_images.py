@@ -0,0 +1,702 @@
+#!/usr/bin/env python3
+"""BENCHMARKS FOR tools/sync_offline_images.py.
+
+SCENARIOS
+- heuristic: _looks_like_text_document WITH NUMPY, WITH THE PURE PIL FALLBACK AND WITH THE
+  ORIGINAL PER-PIXEL PYTHON LOOP (REFERENCE). CHECKS THAT ALL THREE AGREE AND REPORTS SPEEDUPS.
+- pipeline: FULL SYNC (SEARCH + SCORE + DOWNLOAD + COMMIT) OF A SANDBOX COPY OF THE DATASET, ONE WORKER.
+- pipeline-parallel: SAME WITH --workers 4 AND --parallel-providers.
+- pipeline-photos: PARALLEL RUN WITHOUT ARASAAC, SO EVERY WINNER GOES THROUGH THE PHOTO CHECKS.
+- pipeline-faulty: PARALLEL RUN AGAINST A SLOW PROVIDER SERVER THAT ALSO FAILS AND THROTTLES.
+- pipeline-probe: SAME AS pipeline-photos WITH --probe: A RANGE REQUEST READS EACH TOP CANDIDATE'S
+  HEADER (SIZE, FORMAT) BEFORE ANY FULL DOWNLOAD. THE STAND-IN SERVER ANSWERS Range WITH 206.
+
+PIPELINE SCENARIOS NEVER TOUCH THE NETWORK: A LOCAL STAND-IN SERVER (SEPARATE PROCESS) ANSWERS THE
+ARASAAC, PEXELS, OPENVERSE, WIKIMEDIA AND GOOGLE CSE APIS AND SERVES THE IMAGE BYTES. RESPONSES ARE
+SYNTHESIZED DETERMINISTICALLY FROM THE QUERY UNLESS --fixtures POINTS AT RECORDED ONES:
+<fixtures>/<provider>/<slug of the search term>.json, WHERE "{BASE}" IS REPLACED BY THE SERVER URL
+(USE IT IN IMAGE URLS SO DOWNLOADS STAY LOCAL). EACH SCENARIO RUNS IN ITS OWN PROCESS SO PEAK RSS
+IS PER SCENARIO.
+
+OUTPUT IS A JSON REPORT (STDOUT OR --output) TAGGED WITH THE GIT COMMIT, SO RUNS CAN BE COMPARED
+ACROSS COMMITS (--baseline ADDS THE RELATIVE CHANGE OF EVERY NUMERIC METRIC).
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import datetime as dt
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+from urllib.request import urlopen
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import sync_offline_images as sync  # noqa: E402
+
+try:
+    import resource
+except Exception:  # pragma: no cover - not available on windows
+    resource = None
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+BENCH_PROVIDERS = ["arasaac", "pexels", "openverse", "wikimedia", "google_cse"]
+IMAGE_CACHE_SIZE = 512
+
+
+def _log(message: str) -> None:
+    print(message, file=sys.stderr)
+
+
+def _reference_pixel_counts(image: Any) -> Tuple[int, int, int, int, int]:
+    # ORIGINAL IMPLEMENTATION, KEPT HERE AS THE CORRECTNESS AND SPEED BASELINE.
+    pixels = list(getattr(image, "get_flattened_data", image.getdata)())
+    white = 0
+    dark = 0
+    colorful = 0
+    gray = 0
+    for r, g, b in pixels:
+        if r > 235 and g > 235 and b > 235:
+            white += 1
+        if r < 50 and g < 50 and b < 50:
+            dark += 1
+        if max(r, g, b) - min(r, g, b) > 35:
+            colorful += 1
+        if abs(r - g) < 12 and abs(g - b) < 12 and abs(r - b) < 12:
+            gray += 1
+    return len(pixels), white, dark, colorful, gray
+
+
+def _synthetic_image(kind: str, seed: int, size: Tuple[int, int]) -> bytes:
+    from PIL import ImageDraw
+
+    rng = random.Random(seed)
+    width, height = size
+    if kind == "document":
+        image = sync.Image.new("RGB", size, (250, 250, 248))
+        draw = ImageDraw.Draw(image)
+        for line in range(12, height - 12, 18):
+            x = 20
+            while x < width - 40:
+                word = rng.randint(12, 60)
+                draw.rectangle((x, line, x + word, line + 8), fill=(20, 20, 25))
+                x += word + rng.randint(6, 14)
+    elif kind == "scan":
+        base = rng.randint(90, 200)
+        image = sync.Image.new("RGB", size, (base, base, base))
+        draw = ImageDraw.Draw(image)
+        for _ in range(200):
+            shade = rng.randint(0, 255)
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.ellipse((x, y, x + 30, y + 30), fill=(shade, shade, shade))
+    elif kind == "pictogram":
+        image = sync.Image.new("RGBA", size, (255, 255, 255, 0))
+        draw = ImageDraw.Draw(image)
+        for _ in range(6):
+            color = (rng.randrange(256), rng.randrange(256), rng.randrange(256), 255)
+            x, y = rng.randrange(width // 2), rng.randrange(height // 2)
+            draw.ellipse((x, y, x + rng.randint(60, width // 2), y + rng.randint(60, height // 2)), fill=color)
+    else:
+        image = sync.Image.new("RGB", size)
+        draw = ImageDraw.Draw(image)
+        for _ in range(400):
+            color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+            x, y = rng.randrange(width), rng.randrange(height)
+            draw.rectangle((x, y, x + rng.randint(10, 200), y + rng.randint(10, 200)), fill=color)
+
+    output = BytesIO()
+    image.save(output, format="JPEG" if kind == "photo" else "PNG", quality=90)
+    return output.getvalue()
+
+
+def _time_calls(fn: Callable[[Any], Any], inputs: List[Any], repeat: int) -> Tuple[float, List[Any]]:
+    results: List[Any] = []
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        started = time.perf_counter()
+        results = [fn(value) for value in inputs]
+        best = min(best, time.perf_counter() - started)
+    return best, results
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # LINUX REPORTS KILOBYTES, MACOS BYTES.
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _bench_heuristic(args: argparse.Namespace) -> Dict[str, Any]:
+    if sync.Image is None:
+        raise SystemExit("[ERROR] EL BENCHMARK heuristic NECESITA PILLOW")
+
+    kinds = ["photo", "document", "scan"]
+    blobs = [
+        _synthetic_image(kinds[index % len(kinds)], index, (args.width, args.height))
+        for index in range(args.images)
+    ]
+    thumbnails = []
+    for blob in blobs:
+        image = sync.Image.open(BytesIO(blob)).convert("RGB")
+        image.thumbnail((256, 256))
+        thumbnails.append(image)
+
+    numpy_module = sync.np
+    timings: Dict[str, float] = {}
+    counts: Dict[str, List[Any]] = {}
+
+    timings["reference_counts"], counts["reference"] = _time_calls(_reference_pixel_counts, thumbnails, args.repeat)
+    try:
+        sync.np = None
+        timings["pil_counts"], counts["pil"] = _time_calls(sync._text_document_pixel_counts, thumbnails, args.repeat)
+        timings["pil_end_to_end"], verdicts_pil = _time_calls(sync._looks_like_text_document, blobs, args.repeat)
+    finally:
+        sync.np = numpy_module
+
+    verdicts_numpy: List[Any] = []
+    if numpy_module is not None:
+        timings["numpy_counts"], counts["numpy"] = _time_calls(
+            sync._text_document_pixel_counts, thumbnails, args.repeat
+        )
+        timings["numpy_end_to_end"], verdicts_numpy = _time_calls(sync._looks_like_text_document, blobs, args.repeat)
+
+    mismatches = sum(
+        1
+        for name, values in counts.items()
+        if name != "reference"
+        for reference, value in zip(counts["reference"], values)
+        if reference != value
+    )
+    if verdicts_numpy and verdicts_numpy != verdicts_pil:
+        mismatches += 1
+
+    per_image = {name: value / len(blobs) * 1000 for name, value in timings.items()}
+    speedups = {
+        f"{name}_vs_reference": timings["reference_counts"] / timings[name]
+        for name in ("pil_counts", "numpy_counts")
+        if timings.get(name)
+    }
+    return {
+        "images": len(blobs),
+        "imageSize": [args.width, args.height],
+        "numpyAvailable": numpy_module is not None,
+        "documentsDetected": sum(1 for verdict in verdicts_pil if verdict),
+        "msPerImage": per_image,
+        "speedup": speedups,
+        "mismatches": mismatches,
+        "peakRssMb": _peak_rss_mb(),
+    }
+
+
+# LOCAL STAND-IN PROVIDER SERVER
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # HEADERS AND BODY GO OUT AS SEPARATE WRITES; WITH NAGLE EVERY RESPONSE WOULD STALL ~40 MS.
+    disable_nagle_algorithm = True
+    server: "StandInServer"
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        parsed = urlparse(self.path)
+        parts = [unquote(part) for part in parsed.path.strip("/").split("/") if part]
+        params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+        if parts == ["__stats"]:
+            self._send_json(200, self.server.snapshot_stats())
+            return
+        if parts == ["__reset"]:
+            self.server.reset_stats()
+            self._send_json(200, {})
+            return
+
+        provider = parts[0] if parts else ""
+        self.server.count(provider)
+        fault = self.server.fault(provider)
+        if fault == 429:
+            self.server.count("throttled")
+            self._send_bytes(429, b"", "text/plain", {"Retry-After": "1"})
+            return
+        if fault == 500:
+            self.server.count("errors")
+            self._send_bytes(500, b"", "text/plain")
+            return
+
+        if provider == "img" and len(parts) >= 3:
+            kind, image_id = parts[1], parts[2].rsplit(".", 1)[0]
+            self._send_image(*self.server.image(kind, image_id))
+            return
+        if provider == "arasaac_static" and len(parts) >= 2:
+            self._send_image(*self.server.image("pictogram", parts[1]))
+            return
+        payload = self.server.api_response(provider, parts[1:], params)
+        if payload is None:
+            self._send_json(404, [])
+            return
+        self._send_bytes(200, payload.encode("utf-8"), "application/json")
+
+    def _send_image(self, body: bytes, mime: str) -> None:
+        # SINGLE "bytes=START-END" RANGES ONLY, WHICH IS WHAT THE SYNC PROBE ASKS FOR.
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", str(self.headers.get("Range") or "").strip())
+        if match is None or int(match.group(1)) >= len(body):
+            self._send_bytes(200, body, mime)
+            return
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(body) - 1), len(body) - 1)
+        self.server.count("ranges")
+        content_range = {"Content-Range": f"bytes {start}-{end}/{len(body)}"}
+        self._send_bytes(206, body[start : end + 1], mime, content_range)
+
+    def _send_json(self, status: int, payload: Any) -> None:
+        self._send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def _send_bytes(self, status: int, body: bytes, mime: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", mime)
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StandInServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config: Dict[str, Any]) -> None:
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.base_url = f"http://127.0.0.1:{self.server_address[1]}"
+        self.config = config
+        self.fixtures = Path(config["fixtures"]) if config.get("fixtures") else None
+        self._images: Dict[Tuple[str, str], Tuple[bytes, str]] = {}
+        self._stats: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._rng = random.Random(config.get("seed", 0))
+
+    def count(self, key: str) -> None:
+        with self._lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def snapshot_stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats = {}
+
+    def fault(self, provider: str) -> int:
+        # API CALLS ARE DELAYED AND MAY FAIL; IMAGE DOWNLOADS ONLY GET THE LATENCY.
+        latency = self.config.get("latency_ms", 0) + self._uniform(0, self.config.get("jitter_ms", 0))
+        if latency > 0:
+            time.sleep(latency / 1000)
+        if provider in {"img", "arasaac_static"}:
+            return 0
+        roll = self._uniform(0, 1)
+        if roll < self.config.get("throttle_rate", 0):
+            return 429
+        if roll < self.config.get("throttle_rate", 0) + self.config.get("error_rate", 0):
+            return 500
+        return 0
+
+    def _uniform(self, low: float, high: float) -> float:
+        with self._lock:
+            return self._rng.uniform(low, high)
+
+    def image(self, kind: str, image_id: str) -> Tuple[bytes, str]:
+        key = (kind, image_id)
+        with self._lock:
+            cached = self._images.get(key)
+        if cached is not None:
+            return cached
+        seed = zlib.crc32(f"{kind}/{image_id}".encode("utf-8"))
+        if kind == "pictogram":
+            body, mime = _synthetic_image("pictogram", seed, (500, 500)), "image/png"
+        else:
+            body, mime = _synthetic_image("photo", seed, (self.config["width"], self.config["height"])), "image/jpeg"
+        with self._lock:
+            if len(self._images) >= IMAGE_CACHE_SIZE:
+                self._images.pop(next(iter(self._images)))
+            self._images[key] = (body, mime)
+        return body, mime
+
+    def api_response(self, provider: str, path_parts: List[str], params: Dict[str, str]) -> Optional[str]:
+        term = {
+            "arasaac": path_parts[-1] if path_parts else "",
+            "pexels": params.get("query", ""),
+            "openverse": params.get("q", ""),
+            "wikimedia": params.get("gsrsearch", ""),
+            "google_cse": params.get("q", ""),
+        }.get(provider)
+        if term is None:
+            return None
+        if self.fixtures is not None:
+            recorded = self.fixtures / provider / f"{sync._slug(term) or 'empty'}.json"
+            if recorded.is_file():
+                return recorded.read_text(encoding="utf-8").replace("{BASE}", self.base_url)
+        payload = _synthetic_api_payload(provider, term, self.base_url, self.config)
+        return None if payload is None else json.dumps(payload)
+
+
+def _synthetic_api_payload(provider: str, term: str, base_url: str, config: Dict[str, Any]) -> Any:
+    # SHAPED LIKE THE REAL APIS, WITH TITLES THAT REUSE THE QUERY SO SCORING HAS REAL WORK TO DO.
+    rng = random.Random(zlib.crc32(f"{provider}/{term}".encode("utf-8")))
+    count = config["results"]
+    width, height = config["width"], config["height"]
+    words = term.split()
+    title = " ".join(words[:2]) if words else term
+    ids = [f"{zlib.crc32(f'{provider}/{term}/{index}'.encode('utf-8')):08x}" for index in range(count)]
+
+    if provider == "arasaac":
+        if rng.random() < 0.1:
+            return None
+        return [
+            {"_id": int(image_id, 16) % 10_000_000, "keywords": [{"keyword": title.lower()}, {"keyword": "objeto"}]}
+            for image_id in ids
+        ]
+    if provider == "pexels":
+        return {
+            "photos": [
+                {
+                    "id": image_id,
+                    "width": width,
+                    "height": height,
+                    "url": f"{base_url}/page/{image_id}",
+                    "alt": f"{title} photo",
+                    "photographer": "BENCH",
+                    "src": {"large2x": f"{base_url}/img/pexels/{image_id}.jpeg"},
+                }
+                for image_id in ids
+            ]
+        }
+    if provider == "openverse":
+        return {
+            "results": [
+                {
+                    "url": f"{base_url}/img/openverse/{image_id}.jpg",
+                    "mimetype": "image/jpeg",
+                    "width": width,
+                    "height": height,
+                    "license": "by",
+                    "license_version": "4.0",
+                    "title": f"{title} {rng.choice(['object', 'photo', 'closeup', 'home'])}",
+                    "tags": [{"name": word} for word in words[:3]],
+                    "creator": "BENCH",
+                    "foreign_landing_url": f"{base_url}/page/{image_id}",
+                }
+                for image_id in ids
+            ]
+        }
+    if provider == "wikimedia":
+        return {
+            "query": {
+                "pages": {
+                    image_id: {
+                        "title": f"File:{title} {index}.jpg",
+                        "imageinfo": [
+                            {
+                                "thumburl": f"{base_url}/img/wikimedia/{image_id}.jpg",
+                                "mime": "image/jpeg",
+                                "thumbwidth": width,
+                                "thumbheight": height,
+                                "extmetadata": {
+                                    "LicenseShortName": {"value": "CC BY-SA 4.0"},
+                                    "Artist": {"value": "BENCH"},
+                                    "ImageDescription": {"value": f"{title} object"},
+                                },
+                            }
+                        ],
+                        "categories": [{"title": f"Category:{title}"}],
+                    }
+                    for index, image_id in enumerate(ids)
+                }
+            }
+        }
+    return {
+        "items": [
+            {
+                "link": f"{base_url}/img/google_cse/{image_id}.jpg",
+                "mime": "image/jpeg",
+                "title": f"{title} image",
+                "displayLink": "bench.local",
+                "image": {"width": width, "height": height, "contextLink": f"{base_url}/page/{image_id}"},
+            }
+            for image_id in ids
+        ]
+    }
+
+
+def _serve_stand_in(config: Dict[str, Any], ready: Any) -> None:
+    server = StandInServer(config)
+    ready.put(server.base_url)
+    server.serve_forever()
+
+
+def _server_request(base_url: str, path: str) -> Dict[str, Any]:
+    with urlopen(f"{base_url}{path}", timeout=10) as response:
+        return json.loads(response.read().decode("utf-8"))
+
+
+# PIPELINE SCENARIOS
+
+PIPELINE_SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "pipeline": {"sync_args": ["--workers", "1"], "server": {}},
+    "pipeline-parallel": {"sync_args": ["--workers", "4", "--parallel-providers"], "server": {}},
+    "pipeline-photos": {
+        "sync_args": ["--workers", "4", "--providers", "pexels,openverse,wikimedia,google_cse"],
+        "server": {},
+    },
+    "pipeline-probe": {
+        "sync_args": ["--workers", "4", "--probe", "--providers", "pexels,openverse,wikimedia,google_cse"],
+        "server": {},
+    },
+    "pipeline-faulty": {
+        "sync_args": ["--workers", "4", "--parallel-providers", "--breaker-cooldown", "2"],
+        "server": {"latency_ms": 40, "jitter_ms": 40, "error_rate": 0.05, "throttle_rate": 0.03},
+    },
+}
+
+
+def _run_pipeline_child(base_url: str, sync_args: List[str], items: int, queue: Any) -> None:
+    # RUNS IN A FRESH PROCESS: COUNTERS ARE WRAPPED AROUND THE REAL FUNCTIONS, NOTHING IS STUBBED.
+    sandbox = Path(tempfile.mkdtemp(prefix="bench-sync-"))
+    try:
+        (sandbox / "assets" / "data").mkdir(parents=True)
+        shutil.copy(REPO_ROOT / "assets" / "data" / "lectoescritura_dataset.json", sandbox / "assets" / "data")
+        os.environ.update(
+            PEXELS_API_KEY="bench",
+            GOOGLE_CSE_API_KEY="bench",
+            GOOGLE_CSE_CX="bench",
+            no_proxy="127.0.0.1,localhost",
+            NO_PROXY="127.0.0.1,localhost",
+        )
+        for provider in BENCH_PROVIDERS:
+            sync.PROVIDER_ENDPOINTS[provider] = f"{base_url}/{provider}/"
+        sync.PROVIDER_ENDPOINTS["arasaac_static"] = f"{base_url}/arasaac_static/"
+
+        scored = itertools.count()
+        score_candidate = sync._score_candidate
+
+        def counted_score(*call_args: Any, **call_kwargs: Any) -> float:
+            next(scored)
+            return score_candidate(*call_args, **call_kwargs)
+
+        heuristic_lock = threading.Lock()
+        heuristic = {"calls": 0, "seconds": 0.0}
+        looks_like_text_document = sync._looks_like_text_document
+
+        def timed_heuristic(*call_args: Any, **call_kwargs: Any) -> bool:
+            started = time.perf_counter()
+            try:
+                return looks_like_text_document(*call_args, **call_kwargs)
+            finally:
+                with heuristic_lock:
+                    heuristic["calls"] += 1
+                    heuristic["seconds"] += time.perf_counter() - started
+
+        statuses: Dict[str, int] = {}
+        commit_item_result = sync._commit_item_result
+
+        def counted_commit(*call_args: Any, **call_kwargs: Any) -> str:
+            status = commit_item_result(*call_args, **call_kwargs)
+            statuses[status] = statuses.get(status, 0) + 1
+            return status
+
+        sync._score_candidate = counted_score
+        sync._looks_like_text_document = timed_heuristic
+        sync._commit_item_result = counted_commit
+
+        argv = [
+            "--root",
+            str(sandbox),
+            "--providers",
+            ",".join(BENCH_PROVIDERS),
+            "--no-cache",
+            "--sleep",
+            "0",
+            "--limit",
+            str(items),
+            "--report",
+            str(sandbox / "run_report.json"),
+        ]
+        for provider in BENCH_PROVIDERS:
+            argv += ["--rate-limit", f"{provider}=0"]
+        argv += sync_args
+
+        started = time.perf_counter()
+        with open(os.devnull, "w", encoding="utf-8") as devnull, contextlib.redirect_stdout(devnull):
+            exit_code = sync.main(argv)
+        elapsed = time.perf_counter() - started
+
+        run_report = json.loads((sandbox / "run_report.json").read_text(encoding="utf-8"))
+        processed = statuses.get("updated", 0) + statuses.get("failed", 0)
+        candidates = next(scored)
+        queue.put(
+            {
+                "exitCode": exit_code,
+                "seconds": round(elapsed, 3),
+                "itemsProcessed": processed,
+                "itemsUpdated": statuses.get("updated", 0),
+                "itemsFailed": statuses.get("failed", 0),
+                "itemsPerSecond": round(processed / elapsed, 3) if elapsed else 0.0,
+                "candidatesScored": candidates,
+                "candidatesPerSecond": round(candidates / elapsed, 1) if elapsed else 0.0,
+                "heuristicCalls": heuristic["calls"],
+                "heuristicSeconds": round(heuristic["seconds"], 4),
+                "heuristicMsPerCall": round(heuristic["seconds"] / heuristic["calls"] * 1000, 3)
+                if heuristic["calls"]
+                else 0.0,
+                "peakRssMb": _peak_rss_mb(),
+                "stageSeconds": {name: stage["totalSeconds"] for name, stage in run_report["stages"].items()},
+                "bytes": run_report["bytes"],
+            }
+        )
+    finally:
+        shutil.rmtree(sandbox, ignore_errors=True)
+
+
+def _bench_pipeline(name: str, args: argparse.Namespace) -> Dict[str, Any]:
+    if sync.Image is None:
+        raise SystemExit("[ERROR] LOS BENCHMARKS pipeline NECESITAN PILLOW")
+    scenario = PIPELINE_SCENARIOS[name]
+    config = {
+        "fixtures": args.fixtures,
+        "width": args.width,
+        "height": args.height,
+        "results": args.results,
+        "seed": args.seed,
+        "latency_ms": args.latency_ms,
+        "jitter_ms": args.jitter_ms,
+        "error_rate": args.error_rate,
+        "throttle_rate": args.throttle_rate,
+    }
+    config.update(scenario["server"])
+
+    context = multiprocessing.get_context("spawn")
+    ready = context.Queue()
+    server = context.Process(target=_serve_stand_in, args=(config, ready), daemon=True)
+    server.start()
+    try:
+        base_url = ready.get(timeout=30)
+        results = context.Queue()
+        child = context.Process(target=_run_pipeline_child, args=(base_url, scenario["sync_args"], args.items, results))
+        child.start()
+        outcome = results.get(timeout=args.timeout)
+        child.join()
+        outcome["serverRequests"] = _server_request(base_url, "/__stats")
+    finally:
+        server.terminate()
+        server.join()
+
+    outcome["serverConfig"] = {key: value for key, value in config.items() if key != "fixtures"}
+    outcome["syncArgs"] = scenario["sync_args"]
+    return outcome
+
+
+SCENARIOS: Dict[str, Callable[[argparse.Namespace], Dict[str, Any]]] = {
+    "heuristic": _bench_heuristic,
+}
+for _name in PIPELINE_SCENARIOS:
+    SCENARIOS[_name] = lambda args, _name=_name: _bench_pipeline(_name, args)
+
+
+def _git_commit() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = bool(
+            subprocess.run(
+                ["git", "status", "--porcelain", "--", "tools"], cwd=REPO_ROOT, capture_output=True, text=True
+            ).stdout.strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": "", "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+def _relative_changes(current: Any, baseline: Any) -> Any:
+    # SAME SHAPE AS THE REPORT, WITH (CURRENT - BASELINE) / BASELINE FOR EVERY NUMERIC LEAF.
+    if isinstance(current, dict) and isinstance(baseline, dict):
+        changes = {key: _relative_changes(value, baseline[key]) for key, value in current.items() if key in baseline}
+        return {key: value for key, value in changes.items() if value is not None and value != {}}
+    numeric = (int, float)
+    if isinstance(current, numeric) and isinstance(baseline, numeric) and not isinstance(current, bool):
+        return round((current - baseline) / baseline, 4) if baseline else None
+    return None
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="BENCHMARKS FOR sync_offline_images.py")
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), default=[])
+    parser.add_argument("--images", type=int, default=60)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=960)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--items", type=int, default=60, help="ÍTEMS A SINCRONIZAR EN LOS ESCENARIOS pipeline")
+    parser.add_argument("--results", type=int, default=8, help="RESULTADOS POR BÚSQUEDA DEL SERVIDOR LOCAL")
+    parser.add_argument("--fixtures", default="", help="RESPUESTAS GRABADAS: <DIR>/<proveedor>/<término>.json")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="FRACCIÓN DE RESPUESTAS 500 DE LAS APIS")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="FRACCIÓN DE RESPUESTAS 429 DE LAS APIS")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=900, help="SEGUNDOS MÁXIMOS POR ESCENARIO")
+    parser.add_argument("--baseline", default="", help="INFORME ANTERIOR CON EL QUE COMPARAR")
+    parser.add_argument("--output", default="", help="RUTA DEL INFORME JSON (POR DEFECTO STDOUT)")
+    args = parser.parse_args()
+
+    report: Dict[str, Any] = {
+        "generatedAt": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "git": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpuCount": os.cpu_count(),
+        "scenarios": {},
+    }
+    for name in args.scenario or sorted(SCENARIOS):
+        _log(f"[BENCH] {name}")
+        report["scenarios"][name] = SCENARIOS[name](args)
+
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        report["changeVsBaseline"] = {
+            "baselineCommit": baseline.get("git", {}).get("commit", ""),
+            "scenarios": _relative_changes(report["scenarios"], baseline.get("scenarios", {})),
+        }
+
+    payload = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        Path(args.output).write_text(payload + "\n", encoding="utf-8")
+    else:
+        print(payload)
+
+    failed = any(
+        result.get("mismatches") or result.get("exitCode") for result in report["scenarios"].values()
+    )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
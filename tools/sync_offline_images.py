@@ -19,33 +19,139 @@ SUPPORTED PROVIDERS
 from __future__ import annotations
 
 import argparse
+import contextlib
 import datetime as dt
+import email.utils
+import gzip
+import hashlib
 import html
+import http.client
+import itertools
 from io import BytesIO
 import json
 import os
+import random
 import re
+import shutil
 import socket
+import stat
+import sqlite3
+import ssl
+import struct
 import sys
+import tempfile
+import threading
 import time
 import unicodedata
+import zlib
+from collections import Counter, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional
+from typing import Any, Callable, Deque, Dict, FrozenSet, Iterable, Iterator, List, Optional, Tuple, Union
 from urllib.error import HTTPError, URLError
-from urllib.parse import quote, urlencode, urlparse
-from urllib.request import Request, urlopen
+from urllib.parse import quote, urlencode, urljoin, urlparse
+from urllib.request import Request, getproxies, proxy_bypass, urlopen
 
 try:
-    from PIL import Image
+    from PIL import Image, ImageChops
 except Exception:  # pragma: no cover - optional dependency
     Image = None
+    ImageChops = None
+
+try:
+    import numpy as np
+except Exception:  # pragma: no cover - optional dependency
+    np = None
 
 USER_AGENT = "LECTOESCRITURA-APP-IMAGE-SYNC/1.0"
+# PROVIDER API BASE URLS IN ONE PLACE, SO tools/bench_sync_offline_images.py CAN POINT THEM AT ITS
+# LOCAL STAND-IN SERVER.
+PROVIDER_ENDPOINTS = {
+    "arasaac": "https://api.arasaac.org/v1/pictograms/es/search/",
+    "arasaac_static": "https://static.arasaac.org/pictograms/",
+    "arasaac_catalog": "https://api.arasaac.org/v1/pictograms/all/es",
+    "pexels": "https://api.pexels.com/v1/search",
+    "openverse": "https://api.openverse.org/v1/images/",
+    "wikimedia": "https://commons.wikimedia.org/w/api.php",
+    "google_cse": "https://www.googleapis.com/customsearch/v1",
+}
 DEFAULT_TIMEOUT = 20
+DEFAULT_CONNECT_TIMEOUT = 10
+DEFAULT_HTTP_POOL_SIZE = 4
+HTTP_MAX_REDIRECTS = 5
+HTTP_REDIRECT_CODES = {301, 302, 303, 307, 308}
 DEFAULT_MIN_WIDTH = 640
 DEFAULT_MIN_HEIGHT = 480
 DEFAULT_MAX_BYTES = 8 * 1024 * 1024
+DEFAULT_WORKERS = 1
+DEFAULT_PROVIDER_CONCURRENCY = 2
+DEFAULT_CACHE_DIR = ".cache/sync_offline_images"
+DEFAULT_CACHE_TTL_HOURS = 24 * 7
+DEFAULT_CACHE_MAX_MB = 256
+DEFAULT_JOURNAL_COMPACT_EVERY = 50
+DEFAULT_RETRY_BACKOFF_MINUTES = 30
+DEFAULT_RETRY_BACKOFF_MAX_HOURS = 24
+RUN_STATE_MAX_REJECTED_URLS = 50
+# SECRETS NEVER BECOME PART OF A CACHE KEY, SO ROTATING A KEY KEEPS THE CACHE VALID.
+CACHE_KEY_EXCLUDED_PARAMS = {"key"}
+# REQUESTS PER SECOND AND BURST PER PROVIDER API (0 RPS = NO BUCKET, SERVER HINTS STILL APPLY).
+DEFAULT_RATE_LIMITS = {
+    "arasaac": (4.0, 8.0),
+    "pexels": (2.0, 4.0),
+    "openverse": (1.0, 3.0),
+    "wikimedia": (5.0, 10.0),
+    "google_cse": (1.0, 2.0),
+}
+RATE_LIMIT_STATUS_CODES = {429, 503}
+RATE_LIMIT_MAX_RETRIES = 3
+RATE_LIMIT_BASE_BACKOFF = 1.0
+RATE_LIMIT_MAX_BACKOFF = 60.0
+DEFAULT_BREAKER_FAILURES = 3
+DEFAULT_BREAKER_SLOW_SECONDS = 8.0
+DEFAULT_BREAKER_COOLDOWN = 60.0
+# RESPONSES THAT SAY NOTHING ABOUT PROVIDER HEALTH (NO RESULTS / THROTTLED BY DESIGN).
+BREAKER_NEUTRAL_STATUS_CODES = {404, 429}
+METRIC_LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "sync_offline_images"
+DEFAULT_REPORT_NAME = "run_report.json"
+CANDIDATE_STORE_NAME = "candidates.sqlite"
+# ONLY THIS TOOL READS THE dHASH INDEX: IT LIVES IN THE CACHE, OUTSIDE THE BUNDLED assets/.
+HASH_INDEX_NAME = "image_hashes.json"
+# ROWS PULLED FROM THE LOCAL CORPUS PER QUERY VARIANT BEFORE SCORING (BEST BM25 FIRST).
+LOCAL_SEARCH_LIMIT = 60
+ARASAAC_CATALOG_NAME = "arasaac_catalog_es.json.gz"
+ARASAAC_CATALOG_VERSION = 1
+# THE FULL CATALOG IS ONE LARGE RESPONSE, SO IT GETS A LONGER READ TIMEOUT THAN A SEARCH.
+ARASAAC_CATALOG_TIMEOUT = 180
 ALLOWED_MIME = {"image/jpeg", "image/png", "image/webp"}
+# SOME CDNS SERVE IMAGES AS A GENERIC BINARY TYPE; THOSE ARE NOT REJECTED BY CONTENT-TYPE.
+GENERIC_BINARY_MIME = {"application/octet-stream", "binary/octet-stream"}
+DOWNLOAD_CHUNK_BYTES = 64 * 1024
+# BYTES ASKED FOR (HTTP Range) WHEN PROBING A CANDIDATE; ENOUGH FOR A JPEG FRAME HEADER AFTER ITS EXIF BLOCK.
+PROBE_BYTES = 32 * 1024
+DEFAULT_DUPLICATE_DISTANCE = 5
+# A CLEAN CANDIDATE SCORING THIS HIGH (E.G. AN EXACT ARASAAC MATCH) ENDS THE SEARCH WITH --early-exit.
+DEFAULT_CONFIDENCE_THRESHOLD = 25.0
+# STORED FILES ARE NAMED AFTER THE FIRST 16 HEX DIGITS OF THEIR SHA-256 (CONTENT-ADDRESSED BLOBS).
+BLOB_NAME_LENGTH = 16
+BLOB_NAME_RE = re.compile(r"^[0-9a-f]{16}$")
+DEFAULT_OPTIMIZE_MAX_SIZE = 1024
+DEFAULT_OPTIMIZE_FORMAT = "webp"
+DEFAULT_OPTIMIZE_QUALITY = 80
+# "keep" RE-ENCODES IN THE FILE'S OWN FORMAT.
+OPTIMIZE_FORMATS = {"webp": "WEBP", "jpeg": "JPEG", "keep": ""}
+OPTIMIZE_FORMAT_EXT = {"webp": ".webp", "jpeg": ".jpg", "keep": ""}
+OPTIMIZE_FORMAT_MIME = {"WEBP": "image/webp", "JPEG": "image/jpeg", "PNG": "image/png"}
+OPTIMIZE_RECORD_FIELDS = (
+    "originalWidth",
+    "originalHeight",
+    "originalBytes",
+    "optimizedWidth",
+    "optimizedHeight",
+    "optimizedBytes",
+    "optimizedAt",
+)
 CATEGORY_HINTS = {
     "COSAS DE CASA": "HOME OBJECT",
     "COMIDA": "FOOD",
@@ -261,8 +367,13 @@ ARASAAC_QUERY_ALIASES = {
 }
 
 
+_LOG_LOCK = threading.Lock()
+
+
 def _log(message: str) -> None:
-    print(message)
+    # WORKER THREADS LOG CONCURRENTLY; KEEP EACH LINE WHOLE.
+    with _LOG_LOCK:
+        print(message, flush=True)
 
 
 def _deaccent(text: str) -> str:
@@ -285,16 +396,102 @@ def _normalized_text(value: str) -> str:
     return re.sub(r"\\s+", " ", _deaccent(value).lower()).strip()
 
 
+@lru_cache(maxsize=4096)
+def _token_pattern(normalized_token: str) -> "re.Pattern[str]":
+    return re.compile(rf"(^|[^a-z0-9]){re.escape(normalized_token)}([^a-z0-9]|$)")
+
+
 def _contains_token(text: str, token: str) -> bool:
     normalized_token = _normalized_text(token)
     if not text or not normalized_token:
         return False
-    pattern = rf"(^|[^a-z0-9]){re.escape(normalized_token)}([^a-z0-9]|$)"
-    return re.search(pattern, text) is not None
+    return _token_pattern(normalized_token).search(text) is not None
+
+
+class TokenMatcher:
+    # PRECOMPILED MATCHER FOR A FIXED TOKEN SET. SAME SEMANTICS AS _contains_token (WHOLE TOKEN
+    # BETWEEN NON [a-z0-9] BOUNDARIES), BUT ONE PASS OVER THE TEXT FINDS EVERY HIT: TOKENS ARE
+    # INDEXED BY THEIR FIRST WORD, AND A HIT CAN ONLY START WHERE A WORD OF THE TEXT STARTS.
+    __slots__ = ("tokens", "_multiplicity", "_by_head", "_irregular")
+
+    def __init__(self, tokens: Iterable[str]) -> None:
+        self._multiplicity: Dict[str, int] = {}
+        self._by_head: Dict[str, List[str]] = {}
+        self._irregular: List[str] = []
+        for token in tokens:
+            normalized_token = _normalized_text(token)
+            if not normalized_token:
+                continue
+            if normalized_token in self._multiplicity:
+                self._multiplicity[normalized_token] += 1
+                continue
+            self._multiplicity[normalized_token] = 1
+            head = _WORD_RE.match(normalized_token)
+            if head is not None and head.start() == 0:
+                self._by_head.setdefault(head.group(), []).append(normalized_token)
+            else:
+                self._irregular.append(normalized_token)
+        self.tokens = tuple(self._multiplicity)
+
+    def hits(self, text: str) -> FrozenSet[str]:
+        if not text or not self._multiplicity:
+            return frozenset()
+        found = set()
+        by_head = self._by_head
+        if by_head:
+            text_length = len(text)
+            for word in _WORD_RE.finditer(text):
+                candidates = by_head.get(word.group())
+                if not candidates:
+                    continue
+                start = word.start()
+                for token in candidates:
+                    end = start + len(token)
+                    if text.startswith(token, start) and (end == text_length or not _is_word_char(text[end])):
+                        found.add(token)
+        for token in self._irregular:
+            if _token_pattern(token).search(text) is not None:
+                found.add(token)
+        return frozenset(found)
+
+    def count(self, text: str) -> int:
+        return self.count_hits(self.hits(text))
+
+    def count_hits(self, hits: FrozenSet[str]) -> int:
+        return sum(self._multiplicity[token] for token in hits)
+
+    def any(self, text: str) -> bool:
+        return bool(self.hits(text))
+
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+
+def _is_word_char(char: str) -> bool:
+    return ("a" <= char <= "z") or ("0" <= char <= "9")
+
+
+@lru_cache(maxsize=4096)
+def _cached_matcher(tokens: Tuple[str, ...]) -> TokenMatcher:
+    return TokenMatcher(tokens)
+
+
+def _token_matcher(tokens: Iterable[str]) -> TokenMatcher:
+    if isinstance(tokens, TokenMatcher):
+        return tokens
+    return _cached_matcher(tuple(tokens))
 
 
 def _contains_any(text: str, tokens: Iterable[str]) -> bool:
-    return any(_contains_token(text, token) for token in tokens)
+    return _token_matcher(tokens).any(text)
+
+
+NOISY_MATCHER = TokenMatcher(NOISY_TOKENS)
+HARD_REJECT_MATCHER = TokenMatcher(HARD_REJECT_TOKENS)
+PLACE_LIKE_MATCHER = TokenMatcher(PLACE_LIKE_TOKENS)
+INAPPROPRIATE_MATCHER = TokenMatcher(INAPPROPRIATE_TOKENS)
+EMPTY_MATCHER = TokenMatcher(())
+CATEGORY_KEYWORD_MATCHERS = {category: TokenMatcher(tokens) for category, tokens in CATEGORY_KEYWORDS.items()}
 
 
 def _dedupe_tokens(tokens: Iterable[str]) -> List[str]:
@@ -354,73 +551,171 @@ def _title_looks_narrative_or_catalog(title: str) -> bool:
     return False
 
 
-def _candidate_has_object_clues(item: Dict[str, Any], combined_text: str) -> bool:
-    category = str(item.get("category", "")).strip().upper()
-    category_tokens = CATEGORY_KEYWORDS.get(category, [])
-    hint_tokens = _item_hint_tokens(item)
-    return _contains_any(combined_text, category_tokens) or _contains_any(combined_text, hint_tokens)
+class ItemContext:
+    # PER-ITEM VALUES THE RANKING NEEDS FOR EVERY CANDIDATE, COMPUTED ONCE PER ITEM.
+    __slots__ = (
+        "item",
+        "item_id",
+        "word_key",
+        "category",
+        "main_word_matcher",
+        "category_hint_matcher",
+        "category_matcher",
+        "hint_matcher",
+        "core_hint_matcher",
+    )
 
+    def __init__(self, item: Dict[str, Any]) -> None:
+        main_word = _item_main_word(item)
+        self.item = item
+        self.item_id = str(item.get("id", "")).strip()
+        self.word_key = _deaccent(main_word).upper()
+        self.category = str(item.get("category", "")).strip().upper()
+        self.main_word_matcher = _token_matcher((_normalized_text(main_word),))
+        self.category_hint_matcher = _token_matcher((_normalized_text(CATEGORY_HINTS.get(self.category, "")),))
+        self.category_matcher = CATEGORY_KEYWORD_MATCHERS.get(self.category, EMPTY_MATCHER)
+        self.hint_matcher = _token_matcher(_item_hint_tokens(item))
+        self.core_hint_matcher = _token_matcher(_item_core_hint_tokens(item))
+
+
+class Candidate:
+    # ONE PROVIDER RESULT AS SEEN BY ONE ITEM. THE RAW DICT IS SHARED (QUERY CACHE), WHILE THE
+    # NORMALIZED TEXT, TOKEN HITS, QUERY AND SCORE LIVE HERE SO EACH IS COMPUTED ONCE.
+    __slots__ = (
+        "data",
+        "provider",
+        "title_text",
+        "combined_text",
+        "title_word_count",
+        "narrative_title",
+        "query",
+        "score",
+        "_hits",
+    )
 
-def _candidate_metadata_is_bad(item: Dict[str, Any], candidate: Dict[str, Any]) -> bool:
-    title = _normalized_text(str(candidate.get("title", "")))
-    combined = _candidate_combined_text(candidate)
-    provider = str(candidate.get("provider", "")).strip().lower()
+    def __init__(self, data: Dict[str, Any], query: str = "") -> None:
+        self.data = data
+        self.provider = str(data.get("provider", ""))
+        self.title_text = _normalized_text(str(data.get("title", "")))
+        self.combined_text = _candidate_combined_text(data)
+        self.title_word_count = len(_WORD_RE.findall(self.title_text))
+        self.narrative_title = _title_looks_narrative_or_catalog(self.title_text)
+        self.query = query
+        self.score = 0.0
+        self._hits: Dict[TokenMatcher, FrozenSet[str]] = {}
+
+    def hits(self, matcher: TokenMatcher) -> FrozenSet[str]:
+        found = self._hits.get(matcher)
+        if found is None:
+            found = matcher.hits(self.combined_text)
+            self._hits[matcher] = found
+        return found
+
+    def count(self, matcher: TokenMatcher) -> int:
+        return matcher.count_hits(self.hits(matcher))
 
-    if _contains_any(combined, HARD_REJECT_TOKENS):
+    def get(self, key: str, default: Any = None) -> Any:
+        return self.data.get(key, default)
+
+    def __getitem__(self, key: str) -> Any:
+        return self.data[key]
+
+
+def _as_item_context(item: Any) -> ItemContext:
+    return item if isinstance(item, ItemContext) else ItemContext(item)
+
+
+def _as_candidate(candidate: Any) -> Candidate:
+    return candidate if isinstance(candidate, Candidate) else Candidate(candidate)
+
+
+def _candidate_has_object_clues(context: ItemContext, candidate: Candidate) -> bool:
+    return bool(candidate.hits(context.category_matcher) or candidate.hits(context.hint_matcher))
+
+
+def _candidate_metadata_is_bad(item: Any, candidate: Any) -> bool:
+    context = _as_item_context(item)
+    candidate = _as_candidate(candidate)
+
+    if candidate.hits(HARD_REJECT_MATCHER):
         return True
 
-    if _contains_any(combined, INAPPROPRIATE_TOKENS):
+    if candidate.hits(INAPPROPRIATE_MATCHER):
         return True
 
-    if _title_looks_narrative_or_catalog(title):
+    if candidate.narrative_title:
         return True
 
-    if _contains_any(combined, PLACE_LIKE_TOKENS) and not _candidate_has_object_clues(item, combined):
+    if candidate.hits(PLACE_LIKE_MATCHER) and not _candidate_has_object_clues(context, candidate):
         return True
 
-    if provider != "arasaac":
-        item_word = _deaccent(_item_main_word(item)).upper()
-        if item_word in AMBIGUOUS_ITEM_WORDS:
-            hint_tokens = _item_core_hint_tokens(item)
-            if hint_tokens and not _contains_any(combined, hint_tokens):
+    if candidate.provider.strip().lower() != "arasaac":
+        if context.word_key in AMBIGUOUS_ITEM_WORDS:
+            if context.core_hint_matcher.tokens and not candidate.hits(context.core_hint_matcher):
                 return True
-        elif item_word in STRICT_HINT_WORDS:
-            hint_tokens = _item_hint_tokens(item)
-            if hint_tokens and not _contains_any(combined, hint_tokens):
+        elif context.word_key in STRICT_HINT_WORDS:
+            if context.hint_matcher.tokens and not candidate.hits(context.hint_matcher):
                 return True
 
     return False
 
 
-def _looks_like_text_document(image_bytes: bytes) -> bool:
+# PER-PIXEL THRESHOLDS OF THE DOCUMENT HEURISTIC, AS 0/255 LOOKUP TABLES FOR THE PIL PATH.
+# EVERY TEST REDUCES TO THE PER-PIXEL MAX/MIN CHANNEL: "ALL CHANNELS > 235" IS min > 235,
+# "ALL < 50" IS max < 50, AND "EVERY PAIRWISE DIFFERENCE < 12" IS max - min < 12.
+_WHITE_LUT = [255 if value > 235 else 0 for value in range(256)]
+_DARK_LUT = [255 if value < 50 else 0 for value in range(256)]
+_COLORFUL_LUT = [255 if value > 35 else 0 for value in range(256)]
+_GRAY_LUT = [255 if value < 12 else 0 for value in range(256)]
+
+
+def _text_document_pixel_counts(image: Any) -> Tuple[int, int, int, int, int]:
+    # RETURNS (TOTAL, WHITE, DARK, COLORFUL, GRAY) PIXEL COUNTS FOR AN RGB IMAGE.
+    if np is not None:
+        pixels = np.asarray(image)
+        red, green, blue = pixels[..., 0], pixels[..., 1], pixels[..., 2]
+        highest = np.maximum(np.maximum(red, green), blue)
+        lowest = np.minimum(np.minimum(red, green), blue)
+        spread = highest - lowest
+        return (
+            int(highest.size),
+            int(np.count_nonzero(lowest > 235)),
+            int(np.count_nonzero(highest < 50)),
+            int(np.count_nonzero(spread > 35)),
+            int(np.count_nonzero(spread < 12)),
+        )
+
+    # PURE PIL FALLBACK: lighter/darker GIVE THE PER-PIXEL MAX/MIN BANDS, A LOOKUP TABLE TURNS A
+    # BAND INTO A 0/255 MASK AND THE 255 BIN OF THE MASK HISTOGRAM IS ITS PIXEL COUNT.
+    red, green, blue = image.split()
+    highest = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    lowest = ImageChops.darker(ImageChops.darker(red, green), blue)
+    spread = ImageChops.subtract(highest, lowest)
+    width, height = image.size
+    return (
+        width * height,
+        lowest.point(_WHITE_LUT).histogram()[255],
+        highest.point(_DARK_LUT).histogram()[255],
+        spread.point(_COLORFUL_LUT).histogram()[255],
+        spread.point(_GRAY_LUT).histogram()[255],
+    )
+
+
+def _looks_like_text_document(image_source: Union[bytes, Path]) -> bool:
     if Image is None:
         return False
     try:
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
+        source = BytesIO(image_source) if isinstance(image_source, bytes) else image_source
+        with Image.open(source) as opened:
+            image = opened.convert("RGB")
         image.thumbnail((256, 256))
     except Exception:
         return False
 
-    pixels = list(image.getdata())
-    if not pixels:
+    total, white, dark, colorful, gray = _text_document_pixel_counts(image)
+    if not total:
         return False
 
-    total = len(pixels)
-    white = 0
-    dark = 0
-    colorful = 0
-    gray = 0
-
-    for r, g, b in pixels:
-        if r > 235 and g > 235 and b > 235:
-            white += 1
-        if r < 50 and g < 50 and b < 50:
-            dark += 1
-        if max(r, g, b) - min(r, g, b) > 35:
-            colorful += 1
-        if abs(r - g) < 12 and abs(g - b) < 12 and abs(r - b) < 12:
-            gray += 1
-
     white_ratio = white / total
     dark_ratio = dark / total
     colorful_ratio = colorful / total
@@ -433,20 +728,1021 @@ def _looks_like_text_document(image_bytes: bytes) -> bool:
     return False
 
 
+def _dhash(image_source: Union[bytes, Path]) -> Optional[int]:
+    # 64-BIT DIFFERENCE HASH: 9x8 GRAYSCALE, ONE BIT PER "LEFT PIXEL BRIGHTER THAN RIGHT" PAIR.
+    if Image is None:
+        return None
+    try:
+        source = BytesIO(image_source) if isinstance(image_source, bytes) else image_source
+        with Image.open(source) as opened:
+            image = opened.convert("RGBA")
+        # TRANSPARENT PICTOGRAMS ARE HASHED AS SEEN IN THE APP: OVER A WHITE BACKGROUND.
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        gray = Image.alpha_composite(background, image).convert("L").resize((9, 8), Image.Resampling.LANCZOS)
+    except Exception:
+        return None
+
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for column in range(8):
+            value = (value << 1) | int(pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+class PerceptualHashIndex:
+    # ONE dHASH PER ITEM. LOOKUPS USE MULTI-INDEX HASHING: THE 64 BITS ARE SPLIT INTO max_distance + 1
+    # BANDS AND, BY PIGEONHOLE, ANY HASH WITHIN max_distance BITS MATCHES AT LEAST ONE BAND EXACTLY.
+    # ONLY ITEMS SHARING A BAND BUCKET ARE COMPARED, NEVER THE WHOLE INDEX.
+    def __init__(self, max_distance: int = DEFAULT_DUPLICATE_DISTANCE) -> None:
+        self.max_distance = max(0, min(max_distance, 63))
+        band_count = self.max_distance + 1
+        edges = [round(index * 64 / band_count) for index in range(band_count + 1)]
+        self._bands = [(edges[index], edges[index + 1] - edges[index]) for index in range(band_count)]
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self._buckets: Dict[Tuple[int, int], set] = {}
+        self._lock = threading.Lock()
+
+    def _band_keys(self, value: int) -> List[Tuple[int, int]]:
+        return [(band, (value >> shift) & ((1 << width) - 1)) for band, (shift, width) in enumerate(self._bands)]
+
+    def add(self, item_id: str, value: int, stored_as: str) -> None:
+        with self._lock:
+            self._remove_locked(item_id)
+            self.entries[item_id] = {"hash": value, "storedAs": stored_as}
+            for key in self._band_keys(value):
+                self._buckets.setdefault(key, set()).add(item_id)
+
+    def remove(self, item_id: str) -> None:
+        with self._lock:
+            self._remove_locked(item_id)
+
+    def _remove_locked(self, item_id: str) -> None:
+        entry = self.entries.pop(item_id, None)
+        if entry is None:
+            return
+        for key in self._band_keys(entry["hash"]):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(item_id)
+                if not bucket:
+                    del self._buckets[key]
+
+    def find(self, value: int, exclude: str = "") -> List[Tuple[str, int]]:
+        with self._lock:
+            candidates = set()
+            for key in self._band_keys(value):
+                candidates.update(self._buckets.get(key, ()))
+            candidates.discard(exclude)
+            matches = [
+                (item_id, (self.entries[item_id]["hash"] ^ value).bit_count()) for item_id in candidates
+            ]
+        return sorted(
+            ((item_id, distance) for item_id, distance in matches if distance <= self.max_distance),
+            key=lambda match: (match[1], match[0]),
+        )
+
+    @classmethod
+    def load(cls, path: Path, max_distance: int = DEFAULT_DUPLICATE_DISTANCE) -> "PerceptualHashIndex":
+        index = cls(max_distance)
+        if not path.exists():
+            return index
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            return index
+        if not isinstance(raw, dict) or raw.get("algorithm") != "dhash64":
+            return index
+        for entry in raw.get("hashes", []):
+            try:
+                index.add(str(entry["itemId"]), int(str(entry["hash"]), 16), str(entry.get("storedAs", "")))
+            except (KeyError, TypeError, ValueError):
+                continue
+        return index
+
+    def save(self, path: Path) -> None:
+        with self._lock:
+            hashes = [
+                {"itemId": item_id, "hash": f"{entry['hash']:016x}", "storedAs": entry["storedAs"]}
+                for item_id, entry in sorted(self.entries.items())
+            ]
+        payload = {
+            "generatedAt": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "algorithm": "dhash64",
+            "hashes": hashes,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write_text(path, json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+
+
+def _backfill_image_hashes(index: PerceptualHashIndex, root: Path, items: Iterable[Dict[str, Any]]) -> int:
+    # HASH STORED ASSETS THAT ARE NEW TO THE INDEX OR WHOSE FILE CHANGED PATH SINCE THE LAST RUN.
+    updated = 0
+    for item in items:
+        item_id = str(item.get("id", "")).strip()
+        image_asset = str(item.get("imageAsset") or "").strip()
+        if not item_id:
+            continue
+        entry = index.entries.get(item_id)
+        if entry is not None and entry["storedAs"] == image_asset:
+            continue
+        value = _dhash(root / image_asset) if image_asset and (root / image_asset).is_file() else None
+        if value is None:
+            index.remove(item_id)
+            continue
+        index.add(item_id, value, image_asset)
+        updated += 1
+    return updated
+
+
+class HttpResponse:
+    # RESPONSE BOUND TO A POOLED CONNECTION. CLOSING IT HANDS THE CONNECTION BACK TO THE POOL
+    # WHEN THE BODY WAS READ COMPLETELY; OTHERWISE THE CONNECTION IS DROPPED.
+    def __init__(self, client: "HttpClient", pool_key: Any, conn: Any, response: Any, url: str) -> None:
+        self._client = client
+        self._pool_key = pool_key
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.status = int(getattr(response, "status", 200))
+        self.headers = response.headers
+        self._closed = False
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        try:
+            if amt is None:
+                return self._response.read()
+            data = self._response.read(amt)
+            # http.client RETURNS b"" WHEN THE PEER HANGS UP BEFORE Content-Length BYTES ARRIVED.
+            if not data and amt and getattr(self._response, "length", None):
+                raise http.client.IncompleteRead(b"", self._response.length)
+            return data
+        except http.client.HTTPException as err:
+            # TRUNCATED OR MALFORMED BODY (IncompleteRead, ...): THE CONNECTION IS UNUSABLE.
+            self.close(reusable=False)
+            raise URLError(err)
+
+    def close(self, reusable: Optional[bool] = None) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._conn is None:
+            self._response.close()
+            return
+        if reusable is None:
+            reusable = self._response.isclosed() and not self._response.will_close
+        self._response.close()
+        self._client._release(self._pool_key, self._conn, reusable)
+
+    def __enter__(self) -> "HttpResponse":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+
+class HttpClient:
+    # THREAD-SAFE KEEP-ALIVE CLIENT: IDLE CONNECTIONS ARE KEPT PER (SCHEME, HOST, PORT) AND AT MOST
+    # pool_size CONNECTIONS PER HOST ARE OPEN AT ONCE. WHEN AN ENV PROXY APPLIES, IT FALLS BACK
+    # TO urlopen SO PROXY SETUPS KEEP WORKING (WITHOUT REUSE).
+    def __init__(
+        self,
+        pool_size: int = DEFAULT_HTTP_POOL_SIZE,
+        timeout: float = DEFAULT_TIMEOUT,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+    ) -> None:
+        self.pool_size = max(1, pool_size)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._lock = threading.Lock()
+        self._idle: Dict[Any, List[Any]] = {}
+        self._slots: Dict[Any, threading.BoundedSemaphore] = {}
+        self._ssl_context = ssl.create_default_context()
+        self._proxies = getproxies()
+
+    def open(
+        self,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        timeout: Optional[float] = None,
+    ) -> HttpResponse:
+        request_headers = {"User-Agent": USER_AGENT}
+        if headers:
+            request_headers.update(headers)
+        read_timeout = self.timeout if timeout is None else timeout
+
+        for _ in range(HTTP_MAX_REDIRECTS + 1):
+            response = self._open_once(url, request_headers, read_timeout)
+            if response.status in HTTP_REDIRECT_CODES and response.headers.get("Location"):
+                location = urljoin(url, response.headers["Location"])
+                response.read()
+                response.close()
+                url = location
+                continue
+            if response.status >= 400:
+                body = response.read()
+                response.close()
+                reason = http.client.responses.get(response.status, "HTTP ERROR")
+                raise HTTPError(url, response.status, reason, response.headers, BytesIO(body))
+            return response
+        raise URLError(f"DEMASIADAS REDIRECCIONES: {url}")
+
+    def get(self, url: str, headers: Optional[Dict[str, str]] = None, timeout: Optional[float] = None) -> bytes:
+        with self.open(url, headers=headers, timeout=timeout) as response:
+            return response.read()
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn in connections:
+                conn.close()
+
+    def _open_once(self, url: str, headers: Dict[str, str], read_timeout: float) -> HttpResponse:
+        parsed = urlparse(url)
+        scheme = parsed.scheme.lower()
+        host = parsed.hostname or ""
+        if scheme not in {"http", "https"} or not host:
+            raise URLError(f"URL NO SOPORTADA: {url}")
+        if self._proxies.get(scheme) and not proxy_bypass(host):
+            return self._open_via_urllib(url, headers, read_timeout)
+
+        port = parsed.port or (443 if scheme == "https" else 80)
+        pool_key = (scheme, host, port)
+        path = parsed.path or "/"
+        if parsed.query:
+            path = f"{path}?{parsed.query}"
+
+        slot = self._slot(pool_key)
+        slot.acquire()
+        try:
+            conn, reused = self._checkout(pool_key)
+            try:
+                response = self._send(conn, path, headers, read_timeout)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError) as err:
+                conn.close()
+                if not reused:
+                    raise URLError(err)
+                # THE SERVER CLOSED AN IDLE KEEP-ALIVE CONNECTION: RETRY ONCE ON A FRESH ONE.
+                conn = self._connect(pool_key)
+                try:
+                    response = self._send(conn, path, headers, read_timeout)
+                except http.client.HTTPException as retry_err:
+                    conn.close()
+                    raise URLError(retry_err)
+                except Exception:
+                    conn.close()
+                    raise
+            except http.client.HTTPException as err:
+                # BadStatusLine, LineTooLong, ...: CALLERS ONLY HANDLE URLError/OSError.
+                conn.close()
+                raise URLError(err)
+            except Exception:
+                conn.close()
+                raise
+        except BaseException:
+            slot.release()
+            raise
+        return HttpResponse(self, pool_key, conn, response, url)
+
+    @staticmethod
+    def _send(conn: Any, path: str, headers: Dict[str, str], read_timeout: float) -> Any:
+        if conn.sock is not None:
+            conn.sock.settimeout(read_timeout)
+        conn.request("GET", path, headers=headers)
+        return conn.getresponse()
+
+    def _open_via_urllib(self, url: str, headers: Dict[str, str], read_timeout: float) -> HttpResponse:
+        try:
+            response = urlopen(Request(url, headers=headers), timeout=read_timeout)
+        except HTTPError as err:
+            # KEEP THE SAME CONTRACT AS THE POOLED PATH: open() RAISES FOR >= 400 ITSELF.
+            response = err
+        return HttpResponse(self, None, None, response, url)
+
+    def _slot(self, pool_key: Any) -> threading.BoundedSemaphore:
+        with self._lock:
+            slot = self._slots.get(pool_key)
+            if slot is None:
+                slot = threading.BoundedSemaphore(self.pool_size)
+                self._slots[pool_key] = slot
+            return slot
+
+    def _checkout(self, pool_key: Any) -> Any:
+        with self._lock:
+            idle = self._idle.get(pool_key)
+            if idle:
+                return idle.pop(), True
+        return self._connect(pool_key), False
+
+    def _connect(self, pool_key: Any) -> Any:
+        scheme, host, port = pool_key
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(host, port, timeout=self.connect_timeout, context=self._ssl_context)
+        else:
+            conn = http.client.HTTPConnection(host, port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.timeout)
+        return conn
+
+    def _release(self, pool_key: Any, conn: Any, reusable: bool) -> None:
+        if pool_key is None:
+            return
+        if reusable:
+            with self._lock:
+                self._idle.setdefault(pool_key, []).append(conn)
+        else:
+            conn.close()
+        self._slots[pool_key].release()
+
+
+_HTTP_CLIENT: Optional[HttpClient] = None
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+
+def _http_client() -> HttpClient:
+    global _HTTP_CLIENT
+    with _HTTP_CLIENT_LOCK:
+        if _HTTP_CLIENT is None:
+            _HTTP_CLIENT = HttpClient()
+        return _HTTP_CLIENT
+
+
+class CacheMissError(URLError):
+    pass
+
+
+class ResponseCache:
+    # PERSISTENT CACHE OF RAW PROVIDER RESPONSES, SHARED BY ALL WORKER THREADS.
+    def __init__(self, path: Path, ttl_seconds: float, max_bytes: int, cache_only: bool = False) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.cache_only = cache_only
+        self.hits = 0
+        self.misses = 0
+        self._writes_since_evict = 0
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, provider TEXT, url TEXT, status INTEGER, payload BLOB, "
+            "size INTEGER, created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed_at)")
+        self._conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl_seconds,))
+        self._conn.commit()
+        self._evict()
+
+    @staticmethod
+    def make_key(provider: str, url: str, params: Optional[Dict[str, Any]]) -> str:
+        clean_params = sorted(
+            (str(key), str(value))
+            for key, value in (params or {}).items()
+            if str(key) not in CACHE_KEY_EXCLUDED_PARAMS
+        )
+        raw = json.dumps([provider, url, clean_params], ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, payload, created_at FROM responses WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None or row[2] < now - self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return {"status": int(row[0]), "body": zlib.decompress(row[1]).decode("utf-8")}
+
+    def put(self, key: str, provider: str, url: str, status: int, body: str) -> None:
+        payload = zlib.compress(body.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, provider, url, status, payload, len(payload), now, now),
+            )
+            self._conn.commit()
+            self._writes_since_evict += 1
+            if self._writes_since_evict >= 50:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._writes_since_evict = 0
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # DROP LEAST RECENTLY USED ROWS UNTIL THE CACHE IS BACK UNDER 90% OF ITS BUDGET.
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at ASC").fetchall()
+        doomed: List[str] = []
+        for key, size in rows:
+            if total <= target:
+                break
+            doomed.append(key)
+            total -= int(size or 0)
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", [(key,) for key in doomed])
+        self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+_RESPONSE_CACHE: Optional[ResponseCache] = None
+
+
+class CandidateStore:
+    # EVERY CANDIDATE ANY PROVIDER EVER RETURNED, WITH AN FTS5 INDEX OVER ITS NORMALIZED METADATA
+    # (TITLE, SOURCE PAGE, DESCRIPTION/TAGS, CATEGORIES) AND THE QUERIES THAT FOUND IT.
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.added = 0
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        try:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS candidates ("
+                "id INTEGER PRIMARY KEY, image_url TEXT UNIQUE, provider TEXT, queries TEXT, payload TEXT, "
+                "first_seen REAL, last_seen REAL)"
+            )
+            # RAISES sqlite3.OperationalError ON SQLITE BUILDS WITHOUT FTS5.
+            self._conn.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS candidates_fts USING fts5("
+                "text, queries, tokenize = 'unicode61 remove_diacritics 2')"
+            )
+            self._conn.commit()
+        except sqlite3.Error:
+            self._conn.close()
+            raise
+
+    def add(self, provider: str, query: str, candidates: Iterable[Dict[str, Any]]) -> None:
+        now = time.time()
+        clean_query = _normalized_text(query)
+        with self._lock:
+            for raw in candidates:
+                image_url = str(raw.get("image_url", "")).strip()
+                if not image_url:
+                    continue
+                # KEYS STARTING WITH "_" (E.G. ARASAAC _relevance) ONLY MEAN SOMETHING FOR THE QUERY THAT MADE THEM.
+                payload = json.dumps(
+                    {key: value for key, value in raw.items() if not str(key).startswith("_")},
+                    ensure_ascii=False,
+                )
+                row = self._conn.execute(
+                    "SELECT id, queries FROM candidates WHERE image_url = ?",
+                    (image_url,),
+                ).fetchone()
+                if row is None:
+                    cursor = self._conn.execute(
+                        "INSERT INTO candidates (image_url, provider, queries, payload, first_seen, last_seen) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (image_url, provider, clean_query, payload, now, now),
+                    )
+                    row_id, queries = cursor.lastrowid, clean_query
+                    self.added += 1
+                else:
+                    row_id, queries = row
+                    if clean_query not in queries.split(" | "):
+                        queries = f"{queries} | {clean_query}" if queries else clean_query
+                    self._conn.execute(
+                        "UPDATE candidates SET queries = ?, payload = ?, last_seen = ? WHERE id = ?",
+                        (queries, payload, now, row_id),
+                    )
+                    self._conn.execute("DELETE FROM candidates_fts WHERE rowid = ?", (row_id,))
+                self._conn.execute(
+                    "INSERT INTO candidates_fts (rowid, text, queries) VALUES (?, ?, ?)",
+                    (row_id, _candidate_combined_text(raw), queries),
+                )
+            self._conn.commit()
+
+    def search(self, query: str, providers: Iterable[str], limit: int = LOCAL_SEARCH_LIMIT) -> List[Dict[str, Any]]:
+        # ANY WORD OF THE QUERY MAY MATCH; _score_candidate DECIDES WHAT IS ACTUALLY GOOD.
+        words = _WORD_RE.findall(_normalized_text(query))
+        provider_names = sorted({provider.strip().lower() for provider in providers})
+        if not words or not provider_names:
+            return []
+        match = " OR ".join(f'"{word}"' for word in dict.fromkeys(words))
+        placeholders = ", ".join("?" for _ in provider_names)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT candidates.payload FROM candidates_fts "
+                "JOIN candidates ON candidates.id = candidates_fts.rowid "
+                f"WHERE candidates_fts MATCH ? AND candidates.provider IN ({placeholders}) "
+                "ORDER BY bm25(candidates_fts), candidates.id LIMIT ?",
+                (match, *provider_names, limit),
+            ).fetchall()
+        output: List[Dict[str, Any]] = []
+        for (payload,) in rows:
+            try:
+                raw = json.loads(payload)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(raw, dict):
+                output.append(raw)
+        return output
+
+    def count(self) -> int:
+        with self._lock:
+            return int(self._conn.execute("SELECT COUNT(*) FROM candidates").fetchone()[0])
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class RateLimiter:
+    # TOKEN BUCKET FOR ONE PROVIDER, SHARED BY EVERY THREAD THAT CALLS IT. SERVER HINTS (Retry-After,
+    # EXHAUSTED QUOTA HEADERS) AND REPEATED 429/503 PUSH blocked_until FORWARD FOR ALL CALLERS; WHILE
+    # THROTTLED THE RATE IS HALVED AND THEN CREEPS BACK UP WITH EACH SUCCESSFUL RESPONSE.
+    def __init__(
+        self,
+        provider: str,
+        rate: float,
+        burst: float,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ) -> None:
+        self.provider = provider
+        self.base_rate = max(0.0, rate)
+        self.rate = self.base_rate
+        self.burst = max(1.0, burst)
+        self.waited_seconds = 0.0
+        self.throttled_responses = 0
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = self.burst
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._consecutive_throttles = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = self._clock()
+                if self.rate > 0:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self.rate <= 0 or self._tokens >= 1:
+                        self._tokens = max(0.0, self._tokens - 1)
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                self.waited_seconds += wait
+            self._sleep(wait)
+
+    def on_success(self, headers: Any) -> None:
+        with self._lock:
+            self._consecutive_throttles = 0
+            if self.base_rate > 0:
+                self.rate = min(self.base_rate, self.rate + self.base_rate * 0.05)
+        quota_wait = _quota_reset_delay(headers)
+        if quota_wait is not None:
+            self._block(quota_wait)
+
+    def on_throttled(self, headers: Any) -> float:
+        with self._lock:
+            self.throttled_responses += 1
+            self._consecutive_throttles += 1
+            if self.base_rate > 0:
+                self.rate = max(self.base_rate / 8, self.rate / 2)
+            backoff = min(RATE_LIMIT_MAX_BACKOFF, RATE_LIMIT_BASE_BACKOFF * 2 ** (self._consecutive_throttles - 1))
+        hint = _retry_after_delay(headers)
+        if hint is None:
+            hint = _quota_reset_delay(headers)
+        # JITTER KEEPS THREADS (AND PARALLEL RUNS) FROM RETRYING IN LOCKSTEP.
+        delay = hint + random.uniform(0, 0.1 * max(1.0, hint)) if hint is not None else random.uniform(backoff / 2, backoff)
+        self._block(delay)
+        return delay
+
+    def _block(self, seconds: float) -> None:
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, self._clock() + seconds)
+
+
+def _retry_after_delay(headers: Any) -> Optional[float]:
+    value = str((headers or {}).get("Retry-After", "") or "").strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=dt.timezone.utc)
+    return max(0.0, (retry_at - dt.datetime.now(dt.timezone.utc)).total_seconds())
+
+
+def _quota_reset_delay(headers: Any) -> Optional[float]:
+    # PEXELS SENDS X-Ratelimit-Remaining/X-Ratelimit-Reset (UNIX TIME); THE IETF DRAFT
+    # RateLimit-Remaining/RateLimit-Reset USES SECONDS. ONLY AN EXHAUSTED QUOTA BLOCKS.
+    headers = headers or {}
+    for prefix in ("X-Ratelimit-", "RateLimit-"):
+        remaining = str(headers.get(f"{prefix}Remaining", "") or "").strip()
+        reset = str(headers.get(f"{prefix}Reset", "") or "").strip()
+        if not remaining or not reset:
+            continue
+        try:
+            remaining_value = float(remaining)
+            reset_value = float(reset)
+        except ValueError:
+            continue
+        if remaining_value > 0:
+            return None
+        if reset_value > 1e9:
+            reset_value -= time.time()
+        return min(max(0.0, reset_value), 3600.0)
+    return None
+
+
+def _parse_rate_limits(specs: Iterable[str]) -> Dict[str, Tuple[float, float]]:
+    # "provider=rps[:burst]", E.G. "pexels=0.5:2" OR "wikimedia=0" (NO BUCKET).
+    limits = dict(DEFAULT_RATE_LIMITS)
+    for spec in specs:
+        provider, _, value = spec.partition("=")
+        provider = provider.strip().lower()
+        rate_text, _, burst_text = value.partition(":")
+        if not provider or not rate_text.strip():
+            raise ValueError(spec)
+        rate = float(rate_text)
+        limits[provider] = (rate, float(burst_text) if burst_text.strip() else max(1.0, rate))
+    return limits
+
+
+_RATE_LIMITERS: Dict[str, RateLimiter] = {}
+
+
+class ProviderUnavailableError(URLError):
+    pass
+
+
+class CircuitBreaker:
+    # CLOSED -> OPEN AFTER failure_threshold CONSECUTIVE FAILURES (CALLS SLOWER THAN slow_seconds COUNT
+    # AS FAILURES TOO). OPEN SKIPS THE PROVIDER FOR cooldown_seconds; THEN HALF_OPEN LETS A SINGLE
+    # PROBE THROUGH, WHOSE OUTCOME CLOSES OR RE-OPENS THE CIRCUIT. ALSO KEEPS THE HEALTH STATS.
+    def __init__(
+        self,
+        provider: str,
+        failure_threshold: int,
+        slow_seconds: float,
+        cooldown_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.provider = provider
+        self.failure_threshold = max(1, failure_threshold)
+        self.slow_seconds = slow_seconds
+        self.cooldown_seconds = max(0.0, cooldown_seconds)
+        self.state = "closed"
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.skipped = 0
+        self.times_opened = 0
+        self.latencies: List[float] = []
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open" and self._clock() - self._opened_at >= self.cooldown_seconds:
+                self.state = "half_open"
+            if self.state == "closed":
+                return True
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            self.skipped += 1
+            return False
+
+    def record(self, elapsed: float, ok: bool) -> None:
+        slow = ok and self.slow_seconds > 0 and elapsed >= self.slow_seconds
+        with self._lock:
+            self.calls += 1
+            self.latencies.append(elapsed)
+            if not ok:
+                self.failures += 1
+            if slow:
+                self.slow_calls += 1
+            probe = self._probing
+            self._probing = False
+            if ok and not slow:
+                self._consecutive = 0
+                self.state = "closed"
+                return
+            self._consecutive += 1
+            if not probe and (self.state != "closed" or self._consecutive < self.failure_threshold):
+                return
+            self.state = "open"
+            self._opened_at = self._clock()
+            self.times_opened += 1
+        reason = "LENTO" if slow else "FALLANDO"
+        _log(f"[WARN] PROVEEDOR {self.provider} {reason}: EN PAUSA {self.cooldown_seconds:.0f}s")
+
+    def latency_percentile(self, fraction: float) -> float:
+        with self._lock:
+            ordered = sorted(self.latencies)
+        if not ordered:
+            return 0.0
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+_CIRCUIT_BREAKERS: Dict[str, CircuitBreaker] = {}
+
+
+class RunMetrics:
+    # STAGE LATENCIES AS FIXED-BUCKET HISTOGRAMS (PER PROVIDER WHERE IT APPLIES), BYTES TRANSFERRED
+    # AND CACHE HITS/MISSES. SHARED BY ALL WORKER THREADS; CHEAP ENOUGH TO BE ALWAYS ON.
+    def __init__(self) -> None:
+        self.started_at = dt.datetime.now(dt.timezone.utc)
+        self._started = time.monotonic()
+        self._stages: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._bytes: Counter = Counter()
+        self._cache: Counter = Counter()
+        self._cache_only_misses: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float, provider: str = "") -> None:
+        with self._lock:
+            series = self._stages.get((stage, provider))
+            if series is None:
+                series = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(METRIC_LATENCY_BUCKETS) + 1)}
+                self._stages[(stage, provider)] = series
+            series["count"] += 1
+            series["sum"] += seconds
+            series["max"] = max(series["max"], seconds)
+            index = 0
+            while index < len(METRIC_LATENCY_BUCKETS) and seconds > METRIC_LATENCY_BUCKETS[index]:
+                index += 1
+            series["buckets"][index] += 1
+
+    @contextlib.contextmanager
+    def stage(self, stage: str, provider: str = "") -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, provider)
+
+    def add_bytes(self, kind: str, provider: str, size: int) -> None:
+        with self._lock:
+            self._bytes[(kind, provider)] += size
+
+    def cache_lookup(self, cache: str, provider: str, hit: bool) -> None:
+        with self._lock:
+            self._cache[(cache, provider, "hit" if hit else "miss")] += 1
+
+    def cache_only_miss(self, provider: str) -> None:
+        # A SEARCH SKIPPED UNDER --cache-only BECAUSE ITS RESPONSE WAS NOT CACHED.
+        with self._lock:
+            self._cache_only_misses[provider] += 1
+
+    def cache_only_misses(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(sorted(self._cache_only_misses.items()))
+
+    def stage_seconds(self, stage: str) -> float:
+        with self._lock:
+            return sum(series["sum"] for (name, _), series in self._stages.items() if name == stage)
+
+    @staticmethod
+    def _summary(series: Dict[str, Any]) -> Dict[str, Any]:
+        count = series["count"]
+        return {
+            "count": count,
+            "totalSeconds": round(series["sum"], 6),
+            "meanSeconds": round(series["sum"] / count, 6) if count else 0.0,
+            "maxSeconds": round(series["max"], 6),
+            "p50Seconds": round(RunMetrics._quantile(series, 0.5), 6),
+            "p95Seconds": round(RunMetrics._quantile(series, 0.95), 6),
+            "buckets": {
+                ("+Inf" if index == len(METRIC_LATENCY_BUCKETS) else str(METRIC_LATENCY_BUCKETS[index])): value
+                for index, value in enumerate(itertools.accumulate(series["buckets"]))
+            },
+        }
+
+    @staticmethod
+    def _quantile(series: Dict[str, Any], fraction: float) -> float:
+        # LINEAR INTERPOLATION INSIDE THE BUCKET, LIKE PROMETHEUS' histogram_quantile; CAPPED AT THE MAX.
+        target = fraction * series["count"]
+        if target <= 0:
+            return 0.0
+        seen = 0
+        lower = 0.0
+        for index, value in enumerate(series["buckets"]):
+            upper = METRIC_LATENCY_BUCKETS[index] if index < len(METRIC_LATENCY_BUCKETS) else series["max"]
+            if value and seen + value >= target:
+                return min(series["max"], lower + (upper - lower) * (target - seen) / value)
+            seen += value
+            lower = upper
+        return series["max"]
+
+    def report(self, extra: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            stages = {key: dict(series, buckets=list(series["buckets"])) for key, series in self._stages.items()}
+            transferred = dict(self._bytes)
+            cache = dict(self._cache)
+
+        stage_report: Dict[str, Any] = {}
+        for stage in sorted({name for name, _ in stages}):
+            labelled = {provider: series for (name, provider), series in stages.items() if name == stage}
+            total = {"count": 0, "sum": 0.0, "max": 0.0, "buckets": [0] * (len(METRIC_LATENCY_BUCKETS) + 1)}
+            for series in labelled.values():
+                total["count"] += series["count"]
+                total["sum"] += series["sum"]
+                total["max"] = max(total["max"], series["max"])
+                total["buckets"] = [left + right for left, right in zip(total["buckets"], series["buckets"])]
+            stage_report[stage] = self._summary(total)
+            by_provider = {provider: self._summary(series) for provider, series in labelled.items() if provider}
+            if by_provider:
+                stage_report[stage]["byProvider"] = dict(sorted(by_provider.items()))
+
+        bytes_report: Dict[str, Dict[str, int]] = {}
+        for (kind, provider), size in sorted(transferred.items()):
+            bytes_report.setdefault(kind, {})[provider or "total"] = size
+
+        cache_report: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        for cache_name, provider, _ in sorted(cache):
+            hits = cache.get((cache_name, provider, "hit"), 0)
+            misses = cache.get((cache_name, provider, "miss"), 0)
+            cache_report.setdefault(cache_name, {})[provider] = {
+                "hits": hits,
+                "misses": misses,
+                "hitRate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            }
+
+        finished_at = dt.datetime.now(dt.timezone.utc)
+        report = {
+            "startedAt": self.started_at.isoformat(),
+            "finishedAt": finished_at.isoformat(),
+            "durationSeconds": round(time.monotonic() - self._started, 3),
+        }
+        report.update(extra)
+        report.update(stages=stage_report, bytes=bytes_report, caches=cache_report)
+        report["cacheOnlyMisses"] = self.cache_only_misses()
+        return report
+
+    def prometheus_text(self, extra: Dict[str, Any]) -> str:
+        # TEXT EXPOSITION FORMAT, E.G. FOR THE node_exporter TEXTFILE COLLECTOR.
+        def labels(**values: str) -> str:
+            pairs = [f'{key}="{value}"' for key, value in values.items() if value != ""]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        with self._lock:
+            stages = {key: dict(series, buckets=list(series["buckets"])) for key, series in self._stages.items()}
+            transferred = dict(self._bytes)
+            cache = dict(self._cache)
+
+        name = f"{METRIC_PREFIX}_stage_seconds"
+        lines = [f"# HELP {name} DURATION OF EACH SYNC STAGE.", f"# TYPE {name} histogram"]
+        for (stage, provider), series in sorted(stages.items()):
+            for index, value in enumerate(itertools.accumulate(series["buckets"])):
+                bound = "+Inf" if index == len(METRIC_LATENCY_BUCKETS) else str(METRIC_LATENCY_BUCKETS[index])
+                lines.append(f"{name}_bucket{labels(stage=stage, provider=provider, le=bound)} {value}")
+            lines.append(f"{name}_sum{labels(stage=stage, provider=provider)} {series['sum']:.6f}")
+            lines.append(f"{name}_count{labels(stage=stage, provider=provider)} {series['count']}")
+
+        name = f"{METRIC_PREFIX}_bytes_total"
+        lines += [f"# HELP {name} BYTES RECEIVED.", f"# TYPE {name} counter"]
+        for (kind, provider), size in sorted(transferred.items()):
+            lines.append(f"{name}{labels(kind=kind, provider=provider)} {size}")
+
+        name = f"{METRIC_PREFIX}_cache_lookups_total"
+        lines += [f"# HELP {name} CACHE LOOKUPS BY RESULT.", f"# TYPE {name} counter"]
+        for (cache_name, provider, result), value in sorted(cache.items()):
+            lines.append(f"{name}{labels(cache=cache_name, provider=provider, result=result)} {value}")
+
+        name = f"{METRIC_PREFIX}_items"
+        lines += [f"# HELP {name} ITEMS BY OUTCOME IN THE LAST RUN.", f"# TYPE {name} gauge"]
+        for status, value in sorted(extra.get("items", {}).items()):
+            lines.append(f"{name}{labels(status=status)} {value}")
+
+        name = f"{METRIC_PREFIX}_rate_limit_wait_seconds"
+        lines += [f"# HELP {name} TIME SPENT WAITING FOR THE PROVIDER RATE LIMITER.", f"# TYPE {name} gauge"]
+        for provider, values in sorted(extra.get("rateLimits", {}).items()):
+            lines.append(f"{name}{labels(provider=provider)} {values['waitedSeconds']}")
+
+        name = f"{METRIC_PREFIX}_run_duration_seconds"
+        lines += [f"# TYPE {name} gauge", f"{name} {time.monotonic() - self._started:.3f}"]
+        name = f"{METRIC_PREFIX}_last_run_timestamp_seconds"
+        lines += [f"# TYPE {name} gauge", f"{name} {self.started_at.timestamp():.0f}"]
+        return "\n".join(lines) + "\n"
+
+
+_METRICS: Optional[RunMetrics] = None
+# PROVIDER REQUESTS THAT WENT PAST THE RESPONSE CACHE, COUNTED PER THREAD (SEE _search_provider_cached).
+_FETCH_STATE = threading.local()
+
+
+def _timed(stage: str, provider: str = "") -> Any:
+    metrics = _METRICS
+    return metrics.stage(stage, provider) if metrics is not None else contextlib.nullcontext()
+
+
+def _fetch_text(
+    provider: str,
+    url: str,
+    params: Optional[Dict[str, Any]] = None,
+    timeout: Optional[float] = None,
+    headers: Optional[Dict[str, str]] = None,
+    allow_not_found: bool = False,
+) -> Optional[str]:
+    # RETURNS None FOR A 404 WHEN allow_not_found IS SET; 404s ARE CACHED TOO.
+    full_url = f"{url}?{urlencode(params)}" if params else url
+    cache = _RESPONSE_CACHE
+    metrics = _METRICS
+    cache_key = ""
+    if cache is not None:
+        cache_key = ResponseCache.make_key(provider, url, params)
+        cached = cache.get(cache_key)
+        if metrics is not None:
+            metrics.cache_lookup("http", provider, cached is not None)
+        if cached is not None:
+            if cached["status"] == 404:
+                if allow_not_found:
+                    return None
+            else:
+                return cached["body"]
+        if cache.cache_only:
+            raise CacheMissError(f"SIN RESPUESTA EN CACHÉ (--cache-only): {url}")
+
+    _FETCH_STATE.requests = getattr(_FETCH_STATE, "requests", 0) + 1
+    limiter = _RATE_LIMITERS.get(provider)
+    breaker = _CIRCUIT_BREAKERS.get(provider)
+    attempt = 0
+    while True:
+        # CACHE HITS ABOVE ARE SERVED EVEN WHILE THE CIRCUIT IS OPEN.
+        if breaker is not None and not breaker.allow():
+            raise ProviderUnavailableError(f"PROVEEDOR {provider} EN PAUSA")
+        if limiter is not None:
+            limiter.acquire()
+        started = time.monotonic()
+        try:
+            with _http_client().open(full_url, headers=headers, timeout=timeout) as response:
+                body = response.read()
+                response_headers = response.headers
+            payload = body.decode("utf-8")
+        except HTTPError as err:
+            if metrics is not None:
+                metrics.observe("http", time.monotonic() - started, provider)
+            if breaker is not None:
+                breaker.record(time.monotonic() - started, ok=err.code in BREAKER_NEUTRAL_STATUS_CODES)
+            if err.code in RATE_LIMIT_STATUS_CODES and limiter is not None:
+                delay = limiter.on_throttled(err.headers)
+                if attempt < RATE_LIMIT_MAX_RETRIES:
+                    attempt += 1
+                    _log(f"[WARN] RATE LIMIT EN {provider} (HTTP {err.code}). REINTENTO EN {delay:.1f}s")
+                    continue
+            if err.code == 404 and allow_not_found:
+                if cache is not None:
+                    cache.put(cache_key, provider, url, 404, "")
+                return None
+            raise
+        except Exception:
+            if metrics is not None:
+                metrics.observe("http", time.monotonic() - started, provider)
+            if breaker is not None:
+                breaker.record(time.monotonic() - started, ok=False)
+            raise
+        if metrics is not None:
+            metrics.observe("http", time.monotonic() - started, provider)
+            metrics.add_bytes("api", provider, len(body))
+        if breaker is not None:
+            breaker.record(time.monotonic() - started, ok=True)
+        if limiter is not None:
+            limiter.on_success(response_headers)
+        break
+
+    if cache is not None:
+        cache.put(cache_key, provider, url, 200, payload)
+    return payload
+
+
 def _request_json(
     url: str,
     params: Dict[str, Any],
-    timeout: int = DEFAULT_TIMEOUT,
+    timeout: Optional[float] = None,
     headers: Optional[Dict[str, str]] = None,
+    provider: str = "",
 ) -> Dict[str, Any]:
-    full_url = f"{url}?{urlencode(params)}"
-    request_headers = {"User-Agent": USER_AGENT}
-    if headers:
-        request_headers.update(headers)
-    req = Request(full_url, headers=request_headers)
-    with urlopen(req, timeout=timeout) as response:
-        payload = response.read().decode("utf-8")
-    return json.loads(payload)
+    payload = _fetch_text(provider, url, params, timeout=timeout, headers=headers)
+    return json.loads(payload or "{}")
 
 
 def _infer_mime_from_url(url: str) -> Optional[str]:
@@ -498,7 +1794,7 @@ def _search_google_cse(
     limit: int,
 ) -> List[Dict[str, Any]]:
     data = _request_json(
-        "https://www.googleapis.com/customsearch/v1",
+        PROVIDER_ENDPOINTS["google_cse"],
         {
             "key": api_key,
             "cx": cx,
@@ -511,6 +1807,7 @@ def _search_google_cse(
             # LIMIT TO COMMON FREE-LICENSE FLAGS AVAILABLE IN CSE.
             "rights": "cc_publicdomain|cc_attribute|cc_sharealike",
         },
+        provider="google_cse",
     )
 
     output: List[Dict[str, Any]] = []
@@ -535,7 +1832,105 @@ def _search_google_cse(
     return output
 
 
-def _search_arasaac(query: str, limit: int) -> List[Dict[str, Any]]:
+class ArasaacCatalog:
+    # LOCAL INVERTED INDEX OF THE SPANISH ARASAAC CATALOG: DEACCENTED KEYWORD WORD -> PICTOGRAM IDS.
+    # BUILT BY THE arasaac-catalog SUBCOMMAND; _search_arasaac ANSWERS FROM IT WITHOUT THE NETWORK.
+    def __init__(
+        self,
+        keywords: Dict[str, List[str]],
+        index: Dict[str, List[str]],
+        generated_at: str = "",
+    ) -> None:
+        self.keywords = keywords
+        self.index = index
+        self.generated_at = generated_at
+
+    @classmethod
+    def from_entries(cls, entries: Iterable[Any]) -> "ArasaacCatalog":
+        keywords: Dict[str, List[str]] = {}
+        index: Dict[str, List[str]] = {}
+        for raw in entries:
+            if not isinstance(raw, dict):
+                continue
+            pictogram_id = str(raw.get("_id") or raw.get("id") or "").strip()
+            if not pictogram_id or pictogram_id in keywords:
+                continue
+            values: List[str] = []
+            words = set()
+            keywords_value = raw.get("keywords")
+            for keyword_item in keywords_value if isinstance(keywords_value, list) else []:
+                if not isinstance(keyword_item, dict):
+                    continue
+                keyword_text = str(keyword_item.get("keyword", "")).strip()
+                if keyword_text:
+                    values.append(keyword_text)
+                # PLURALS ARE SEARCHABLE (AS IN THE API) BUT ARE NOT KEYWORDS FOR THE RANKING.
+                for text in (keyword_text, str(keyword_item.get("plural") or "")):
+                    words.update(_WORD_RE.findall(_normalized_text(text)))
+            keywords[pictogram_id] = values
+            for word in sorted(words):
+                index.setdefault(word, []).append(pictogram_id)
+        return cls(keywords, index, dt.datetime.now(dt.timezone.utc).isoformat())
+
+    def lookup(self, term: str) -> List[Dict[str, Any]]:
+        # EVERY WORD OF THE TERM MUST APPEAR IN THE PICTOGRAM'S KEYWORDS. ENTRIES MIMIC THE API PAYLOAD.
+        words = _WORD_RE.findall(_normalized_text(term))
+        if not words:
+            return []
+        postings = [self.index.get(word, []) for word in words]
+        required = [set(posting) for posting in postings[1:]]
+        return [
+            {"_id": pictogram_id, "keywords": [{"keyword": keyword} for keyword in self.keywords.get(pictogram_id, [])]}
+            for pictogram_id in postings[0]
+            if all(pictogram_id in posting for posting in required)
+        ]
+
+    def age_hours(self) -> float:
+        try:
+            generated_at = dt.datetime.fromisoformat(self.generated_at)
+        except ValueError:
+            return float("inf")
+        return (dt.datetime.now(dt.timezone.utc) - generated_at).total_seconds() / 3600
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["ArasaacCatalog"]:
+        if not path.is_file():
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as handle:
+                raw = json.load(handle)
+        except (OSError, EOFError, json.JSONDecodeError):
+            return None
+        if not isinstance(raw, dict) or raw.get("version") != ARASAAC_CATALOG_VERSION:
+            return None
+        keywords = raw.get("pictograms")
+        index = raw.get("index")
+        if not isinstance(keywords, dict) or not isinstance(index, dict):
+            return None
+        return cls(keywords, index, str(raw.get("generatedAt", "")))
+
+    def save(self, path: Path) -> None:
+        payload = {
+            "version": ARASAAC_CATALOG_VERSION,
+            "generatedAt": self.generated_at,
+            "source": PROVIDER_ENDPOINTS["arasaac_catalog"],
+            "pictograms": self.keywords,
+            "index": self.index,
+        }
+        path.parent.mkdir(parents=True, exist_ok=True)
+        text = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+        _atomic_write_bytes(path, gzip.compress(text.encode("utf-8")))
+
+
+_ARASAAC_CATALOG: Optional[ArasaacCatalog] = None
+
+
+def _arasaac_catalog_path(root: Path, cache_dir: str) -> Path:
+    return root / cache_dir / ARASAAC_CATALOG_NAME
+
+
+def _arasaac_search_terms(query: str) -> List[str]:
+    # ARASAAC IS ONLY ASKED FOR THE FIRST WORD OF THE QUERY (DEACCENTED) PLUS ITS ALIASES.
     clean_query = re.sub(r"\s+", " ", query).strip().lower()
     if not clean_query:
         return []
@@ -548,26 +1943,33 @@ def _search_arasaac(query: str, limit: int) -> List[Dict[str, Any]]:
     for alias in ARASAAC_QUERY_ALIASES.get(normalized_token, []):
         if alias not in search_terms:
             search_terms.append(alias)
+    return search_terms
+
+
+def _search_arasaac(query: str, limit: int) -> List[Dict[str, Any]]:
+    search_terms = _arasaac_search_terms(query)
+    if not search_terms:
+        return []
+    normalized_token = search_terms[0]
 
+    catalog = _ARASAAC_CATALOG
     raw_entries: Dict[str, Dict[str, Any]] = {}
     for search_term in search_terms:
-        url = f"https://api.arasaac.org/v1/pictograms/es/search/{quote(search_term.lower())}"
-        req = Request(url, headers={"User-Agent": USER_AGENT})
-        try:
-            with urlopen(req, timeout=DEFAULT_TIMEOUT) as response:
-                payload = response.read().decode("utf-8")
-        except HTTPError as err:
-            if err.code == 404:
+        if catalog is not None:
+            items = catalog.lookup(search_term)
+        else:
+            url = f"{PROVIDER_ENDPOINTS['arasaac']}{quote(search_term.lower())}"
+            payload = _fetch_text("arasaac", url, allow_not_found=True)
+            if payload is None:
                 continue
-            raise
 
-        try:
-            items = json.loads(payload)
-        except json.JSONDecodeError:
-            continue
+            try:
+                items = json.loads(payload)
+            except json.JSONDecodeError:
+                continue
 
-        if not isinstance(items, list):
-            continue
+            if not isinstance(items, list):
+                continue
 
         for raw in items:
             if not isinstance(raw, dict):
@@ -613,7 +2015,7 @@ def _search_arasaac(query: str, limit: int) -> List[Dict[str, Any]]:
 
         title = keywords[0] if keywords else normalized_token
         description = " ".join(keywords)
-        image_url = f"https://static.arasaac.org/pictograms/{pictogram_id}/{pictogram_id}_500.png"
+        image_url = f"{PROVIDER_ENDPOINTS['arasaac_static']}{pictogram_id}/{pictogram_id}_500.png"
 
         ranked.append(
             {
@@ -625,7 +2027,7 @@ def _search_arasaac(query: str, limit: int) -> List[Dict[str, Any]]:
                 "attribution": "ARASAAC",
                 "license": "CC BY-NC-SA 4.0",
                 "mime": "image/png",
-                # KEEP ZERO TO BYPASS MIN-WIDTH FILTER FOR PICTOGRAMS.
+                # SIZE UNKNOWN UNTIL PROBED OR DOWNLOADED (0); PICTOGRAMS SKIP THE SIZE FILTER ANYWAY.
                 "width": 0,
                 "height": 0,
                 "_relevance": relevance,
@@ -638,7 +2040,7 @@ def _search_arasaac(query: str, limit: int) -> List[Dict[str, Any]]:
 
 def _search_pexels(query: str, api_key: str, limit: int) -> List[Dict[str, Any]]:
     data = _request_json(
-        "https://api.pexels.com/v1/search",
+        PROVIDER_ENDPOINTS["pexels"],
         {
             "query": query,
             "per_page": min(max(limit, 1), 80),
@@ -646,6 +2048,7 @@ def _search_pexels(query: str, api_key: str, limit: int) -> List[Dict[str, Any]]
             "size": "large",
         },
         headers={"Authorization": api_key},
+        provider="pexels",
     )
 
     output: List[Dict[str, Any]] = []
@@ -685,7 +2088,7 @@ def _search_pexels(query: str, api_key: str, limit: int) -> List[Dict[str, Any]]
 
 def _search_openverse(query: str, limit: int) -> List[Dict[str, Any]]:
     data = _request_json(
-        "https://api.openverse.org/v1/images/",
+        PROVIDER_ENDPOINTS["openverse"],
         {
             "q": query,
             "page_size": min(max(limit, 1), 20),
@@ -693,6 +2096,7 @@ def _search_openverse(query: str, limit: int) -> List[Dict[str, Any]]:
             # COMMERCIAL FILTER REDUCES RISK OF NON-FREE OR UNCLEAR LICENSES.
             "license_type": "commercial",
         },
+        provider="openverse",
     )
 
     output: List[Dict[str, Any]] = []
@@ -743,7 +2147,7 @@ def _search_openverse(query: str, limit: int) -> List[Dict[str, Any]]:
 
 def _search_wikimedia(query: str, limit: int) -> List[Dict[str, Any]]:
     data = _request_json(
-        "https://commons.wikimedia.org/w/api.php",
+        PROVIDER_ENDPOINTS["wikimedia"],
         {
             "action": "query",
             "format": "json",
@@ -756,6 +2160,7 @@ def _search_wikimedia(query: str, limit: int) -> List[Dict[str, Any]]:
             "iiurlwidth": 1280,
             "cllimit": 25,
         },
+        provider="wikimedia",
     )
 
     pages = data.get("query", {}).get("pages", {})
@@ -808,10 +2213,181 @@ def _search_wikimedia(query: str, limit: int) -> List[Dict[str, Any]]:
     return output
 
 
-def _download_binary(url: str, timeout: int = DEFAULT_TIMEOUT) -> bytes:
-    req = Request(url, headers={"User-Agent": USER_AGENT})
-    with urlopen(req, timeout=timeout) as response:
-        return response.read()
+def _download_binary(url: str, timeout: Optional[float] = None) -> bytes:
+    return _http_client().get(url, timeout=timeout)
+
+
+class DownloadRejectedError(OSError):
+    pass
+
+
+def _image_header_info(data: bytes) -> Optional[Tuple[str, int, int]]:
+    # FORMAT AND PIXEL SIZE FROM THE FIRST BYTES OF A PNG, JPEG OR WEBP FILE. None WHEN THE BYTES ARE
+    # SOMETHING ELSE OR THE HEADER IS NOT INSIDE THEM.
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        if len(data) < 24 or data[12:16] != b"IHDR":
+            return None
+        width, height = struct.unpack(">II", data[16:24])
+        return "image/png", width, height
+
+    if data.startswith(b"\xff\xd8"):
+        offset = 2
+        while offset + 4 <= len(data):
+            if data[offset] != 0xFF:
+                return None
+            marker = data[offset + 1]
+            if marker == 0xFF:
+                offset += 1
+                continue
+            if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+                offset += 2
+                continue
+            # SOF0..SOF15 CARRY THE FRAME SIZE; C4 (DHT), C8 (JPG) AND CC (DAC) SHARE THE RANGE BUT DO NOT.
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                if offset + 9 > len(data):
+                    return None
+                height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+                return "image/jpeg", width, height
+            if marker in (0xD9, 0xDA):
+                return None
+            offset += 2 + struct.unpack(">H", data[offset + 2 : offset + 4])[0]
+        return None
+
+    if len(data) >= 30 and data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            width = 1 + int.from_bytes(data[24:27], "little")
+            height = 1 + int.from_bytes(data[27:30], "little")
+        elif chunk == b"VP8L" and data[20] == 0x2F:
+            bits = int.from_bytes(data[21:25], "little")
+            width = (bits & 0x3FFF) + 1
+            height = ((bits >> 14) & 0x3FFF) + 1
+        elif chunk == b"VP8 ":
+            width, height = (value & 0x3FFF for value in struct.unpack("<HH", data[26:30]))
+        else:
+            return None
+        return "image/webp", width, height
+    return None
+
+
+def _probe_image(url: str, provider: str = "", timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    # ONLY THE FIRST PROBE_BYTES ARE REQUESTED. A SERVER THAT IGNORES Range SENDS THE WHOLE FILE: THE SAME
+    # PREFIX IS READ AND THE CONNECTION IS DROPPED. RETURNS None WHEN THE SIZE CANNOT BE TOLD FROM IT.
+    with _timed("probe", provider):
+        with _http_client().open(url, headers={"Range": f"bytes=0-{PROBE_BYTES - 1}"}, timeout=timeout) as response:
+            content_type = str(response.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+            data = response.read(PROBE_BYTES)
+    if _METRICS is not None:
+        _METRICS.add_bytes("probe", provider, len(data))
+    if content_type and content_type not in ALLOWED_MIME and content_type not in GENERIC_BINARY_MIME:
+        # REJECTED BY _candidate_is_valid, AS THE DOWNLOAD WOULD BE.
+        return {"mime": content_type, "width": 0, "height": 0}
+    info = _image_header_info(data)
+    if info is None:
+        return None
+    return {"mime": info[0], "width": info[1], "height": info[2]}
+
+
+def _download_to_temp(
+    url: str,
+    temp_dir: Path,
+    max_bytes: int,
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
+    # STREAMS THE BODY TO A TEMP FILE AND GIVES UP AS SOON AS IT IS KNOWN TO BE TOO BIG OR NOT AN
+    # IMAGE, SO OVERSIZED CANDIDATES COST ONE HEADER ROUND TRIP INSTEAD OF THE WHOLE FILE.
+    with _http_client().open(url, timeout=timeout) as response:
+        content_length = str(response.headers.get("Content-Length") or "").strip()
+        if content_length.isdigit() and int(content_length) > max_bytes:
+            raise DownloadRejectedError(f"IMAGEN DEMASIADO GRANDE ({content_length} bytes, CONTENT-LENGTH)")
+
+        content_type = str(response.headers.get("Content-Type") or "").split(";", 1)[0].strip().lower()
+        if content_type and content_type not in ALLOWED_MIME and content_type not in GENERIC_BINARY_MIME:
+            raise DownloadRejectedError(f"TIPO DE CONTENIDO NO PERMITIDO ({content_type})")
+
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        handle, temp_name = tempfile.mkstemp(dir=str(temp_dir), prefix="download-", suffix=".part")
+        temp_path = Path(temp_name)
+        size = 0
+        digest = hashlib.sha256()
+        header_info: Optional[Tuple[str, int, int]] = None
+        try:
+            with os.fdopen(handle, "wb") as output:
+                while True:
+                    chunk = response.read(DOWNLOAD_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    if not size:
+                        header_info = _image_header_info(chunk)
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise DownloadRejectedError(f"IMAGEN DEMASIADO GRANDE (MÁS DE {max_bytes} bytes)")
+                    digest.update(chunk)
+                    output.write(chunk)
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+    return {
+        "path": temp_path,
+        "size": size,
+        "mime": content_type if content_type in ALLOWED_MIME else "",
+        "sha256": digest.hexdigest(),
+        # REAL PIXEL SIZE FROM THE FILE HEADER; 0 WHEN IT WAS NOT IN THE FIRST CHUNK.
+        "width": header_info[1] if header_info else 0,
+        "height": header_info[2] if header_info else 0,
+    }
+
+
+def _file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(DOWNLOAD_CHUNK_BYTES), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _is_blob_path(path: Path) -> bool:
+    return bool(BLOB_NAME_RE.match(path.stem))
+
+
+def _blob_locations(root: Path, source_map: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    # DIGEST -> STORED PATH. BOTH THE STORED FILE'S DIGEST AND THE DIGEST OF THE ORIGINAL DOWNLOAD
+    # (sourceSha256, KEPT THROUGH OPTIMIZATION) POINT AT THE FILE, SO A RE-DOWNLOAD OF AN OPTIMIZED
+    # IMAGE IS STILL RECOGNISED AS UNCHANGED.
+    locations: Dict[str, str] = {}
+    for record in source_map.values():
+        stored_as = str(record.get("storedAs") or "")
+        if not stored_as or not (root / stored_as).is_file():
+            continue
+        for key in ("sha256", "sourceSha256"):
+            if record.get(key):
+                locations.setdefault(str(record[key]), stored_as)
+    return locations
+
+
+def _move_into_place(temp_path: Path, destination: Path) -> None:
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        os.replace(temp_path, destination)
+    except OSError:
+        # DIFFERENT FILESYSTEM: COPY NEXT TO THE DESTINATION FIRST SO THE FINAL RENAME STAYS ATOMIC.
+        staging = destination.with_name(f".{destination.name}.part")
+        shutil.copyfile(temp_path, staging)
+        os.replace(staging, destination)
+        temp_path.unlink(missing_ok=True)
+
+
+def _clean_stale_downloads(temp_dir: Path, max_age_seconds: float = 24 * 3600) -> None:
+    if not temp_dir.exists():
+        return
+    cutoff = time.time() - max_age_seconds
+    for leftover in temp_dir.glob("download-*.part"):
+        try:
+            if leftover.stat().st_mtime < cutoff:
+                leftover.unlink()
+        except OSError:
+            continue
 
 
 def _build_query(item: Dict[str, Any]) -> str:
@@ -879,40 +2455,29 @@ def _item_main_word(item: Dict[str, Any]) -> str:
     return str(item.get("id", "")).strip()
 
 
-def _score_candidate(candidate: Dict[str, Any], item: Dict[str, Any], query: str) -> float:
+def _score_candidate(candidate: Any, item: Any, query: str) -> float:
+    candidate = _as_candidate(candidate)
+    context = _as_item_context(item)
     score = 0.0
-    title = _normalized_text(str(candidate.get("title", "")))
-    combined = _candidate_combined_text(candidate)
-
-    main_word = _normalized_text(_item_main_word(item))
-    category = str(item.get("category", "")).strip().upper()
-    hint = _normalized_text(CATEGORY_HINTS.get(category, ""))
-    category_keywords = CATEGORY_KEYWORDS.get(category, [])
-    word_hint_tokens = _item_hint_tokens(item)
 
-    if main_word and _contains_token(combined, main_word):
+    if candidate.hits(context.main_word_matcher):
         score += 8.0
-    if hint and _contains_token(combined, hint):
+    if candidate.hits(context.category_hint_matcher):
         score += 3.5
-    for token in category_keywords:
-        if _contains_token(combined, token):
-            score += 1.25
-    for token in word_hint_tokens:
-        if _contains_token(combined, token):
-            score += 3.0
-    for token in NOISY_TOKENS:
-        if _contains_token(combined, token):
-            score -= 1.0
-    if _contains_any(combined, HARD_REJECT_TOKENS):
+    # ALL WEIGHTS ABOVE ARE MULTIPLES OF 0.25, SO COUNT * WEIGHT EQUALS THE OLD REPEATED ADDITION.
+    score += 1.25 * candidate.count(context.category_matcher)
+    score += 3.0 * candidate.count(context.hint_matcher)
+    score -= 1.0 * candidate.count(NOISY_MATCHER)
+    if candidate.hits(HARD_REJECT_MATCHER):
         score -= 12.0
-    if _contains_any(combined, INAPPROPRIATE_TOKENS):
+    if candidate.hits(INAPPROPRIATE_MATCHER):
         score -= 20.0
-    if _contains_any(combined, PLACE_LIKE_TOKENS) and not _candidate_has_object_clues(item, combined):
+    if candidate.hits(PLACE_LIKE_MATCHER) and not _candidate_has_object_clues(context, candidate):
         score -= 8.0
-    if _title_looks_narrative_or_catalog(title):
+    if candidate.narrative_title:
         score -= 7.0
 
-    title_word_count = len(re.findall(r"[a-z0-9]+", title))
+    title_word_count = candidate.title_word_count
     if 1 <= title_word_count <= 8:
         score += 1.4
     elif title_word_count > 14:
@@ -923,7 +2488,7 @@ def _score_candidate(candidate: Dict[str, Any], item: Dict[str, Any], query: str
     megapixels = (width * height) / 1_000_000
     score += min(megapixels, 3.0)
 
-    provider = str(candidate.get("provider", ""))
+    provider = candidate.provider
     if provider == "google_cse":
         score += 2.0
     elif provider == "arasaac":
@@ -933,12 +2498,166 @@ def _score_candidate(candidate: Dict[str, Any], item: Dict[str, Any], query: str
     elif provider == "wikimedia":
         score += 1.0
 
-    if _normalized_text(query) in combined:
+    if _normalized_text(query) in candidate.combined_text:
         score += 1.0
 
     return score
 
 
+# THE FEATURES OF _score_candidate AS MATRIX COLUMNS, WITH ITS HAND-TUNED WEIGHTS AS DEFAULTS. THE FIRST
+# BLOCK ONLY HOLDS MULTIPLES OF 0.25 TIMES SMALL COUNTS, SO ITS DOT PRODUCT IS EXACT IN ANY ORDER; THE
+# REST (1.4, MEGAPIXELS, 2.8, ...) ARE ADDED ONE BY ONE IN THE SCALAR ORDER, SO SCORES MATCH BIT FOR BIT.
+EXACT_SCORING_FEATURES = (
+    "main_word",
+    "category_hint",
+    "category_keyword",
+    "item_hint",
+    "noisy",
+    "hard_reject",
+    "inappropriate",
+    "place_without_clues",
+    "narrative_title",
+)
+SCORING_PROVIDERS = ("google_cse", "arasaac", "pexels", "wikimedia")
+SCORING_FEATURES = EXACT_SCORING_FEATURES + (
+    "short_title",
+    "long_title",
+    "megapixels",
+    *(f"provider_{provider}" for provider in SCORING_PROVIDERS),
+    "query_match",
+)
+DEFAULT_SCORING_WEIGHTS = {
+    "main_word": 8.0,
+    "category_hint": 3.5,
+    "category_keyword": 1.25,
+    "item_hint": 3.0,
+    "noisy": -1.0,
+    "hard_reject": -12.0,
+    "inappropriate": -20.0,
+    "place_without_clues": -8.0,
+    "narrative_title": -7.0,
+    "short_title": 1.4,
+    "long_title": -3.5,
+    "megapixels": 1.0,
+    "provider_google_cse": 2.0,
+    "provider_arasaac": 15.0,
+    "provider_pexels": 2.8,
+    "provider_wikimedia": 1.0,
+    "query_match": 1.0,
+}
+MEGAPIXELS_CAP = 3.0
+
+
+def _load_scoring_weights(path: Path) -> Dict[str, float]:
+    # JSON OBJECT {FEATURE: WEIGHT}. FEATURES LEFT OUT KEEP THEIR DEFAULT; UNKNOWN NAMES ARE AN ERROR.
+    raw = json.loads(path.read_text(encoding="utf-8"))
+    if not isinstance(raw, dict):
+        raise ValueError("SE ESPERABA UN OBJETO JSON {CARACTERÍSTICA: PESO}")
+    unknown = sorted(set(raw) - set(SCORING_FEATURES))
+    if unknown:
+        raise ValueError(f"CARACTERÍSTICAS DESCONOCIDAS: {', '.join(unknown)}")
+    weights = dict(DEFAULT_SCORING_WEIGHTS)
+    for name, value in raw.items():
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"PESO NO NUMÉRICO PARA {name}")
+        weights[name] = float(value)
+    return weights
+
+
+def _candidate_features(candidate: Candidate, context: ItemContext, query: str) -> List[float]:
+    title_word_count = candidate.title_word_count
+    width = int(candidate.get("width", 0) or 0)
+    height = int(candidate.get("height", 0) or 0)
+    return [
+        float(bool(candidate.hits(context.main_word_matcher))),
+        float(bool(candidate.hits(context.category_hint_matcher))),
+        float(candidate.count(context.category_matcher)),
+        float(candidate.count(context.hint_matcher)),
+        float(candidate.count(NOISY_MATCHER)),
+        float(bool(candidate.hits(HARD_REJECT_MATCHER))),
+        float(bool(candidate.hits(INAPPROPRIATE_MATCHER))),
+        float(bool(candidate.hits(PLACE_LIKE_MATCHER)) and not _candidate_has_object_clues(context, candidate)),
+        float(candidate.narrative_title),
+        float(1 <= title_word_count <= 8),
+        float(title_word_count > 14),
+        min((width * height) / 1_000_000, MEGAPIXELS_CAP),
+        *(float(candidate.provider == provider) for provider in SCORING_PROVIDERS),
+        float(_normalized_text(query) in candidate.combined_text),
+    ]
+
+
+class BatchScorer:
+    # SCORES MANY (CANDIDATE, ITEM, QUERY) TRIPLES AT ONCE: ONE FEATURE ROW PER TRIPLE AND ONE MATRIX
+    # PRODUCT FOR THE WHOLE BATCH. WITH THE DEFAULT WEIGHTS IT RETURNS EXACTLY WHAT _score_candidate DOES.
+    def __init__(self, weights: Optional[Dict[str, float]] = None) -> None:
+        if np is None:
+            raise RuntimeError("LA PUNTUACIÓN POR LOTES NECESITA NUMPY (pip install numpy)")
+        self.weights = {**DEFAULT_SCORING_WEIGHTS, **(weights or {})}
+        self.vector = np.array([self.weights[name] for name in SCORING_FEATURES], dtype=np.float64)
+
+    def features(self, triples: Iterable[Tuple[Candidate, ItemContext, str]]) -> "np.ndarray":
+        rows = [_candidate_features(candidate, context, query) for candidate, context, query in triples]
+        return np.array(rows, dtype=np.float64).reshape(len(rows), len(SCORING_FEATURES))
+
+    def score_matrix(self, matrix: "np.ndarray") -> "np.ndarray":
+        weights = self.vector
+        exact = len(EXACT_SCORING_FEATURES)
+        short_title, long_title, megapixels = exact, exact + 1, exact + 2
+        providers = slice(exact + 3, exact + 3 + len(SCORING_PROVIDERS))
+        query_match = len(SCORING_FEATURES) - 1
+        scores = matrix[:, :exact] @ weights[:exact]
+        scores = scores + (matrix[:, short_title] * weights[short_title] + matrix[:, long_title] * weights[long_title])
+        scores = scores + matrix[:, megapixels] * weights[megapixels]
+        scores = scores + matrix[:, providers] @ weights[providers]
+        return scores + matrix[:, query_match] * weights[query_match]
+
+    def score(self, triples: Iterable[Tuple[Candidate, ItemContext, str]]) -> "np.ndarray":
+        return self.score_matrix(self.features(triples))
+
+
+def _search_provider(
+    provider: str,
+    query: str,
+    pexels_api_key: str,
+    google_api_key: str,
+    google_cx: str,
+    per_provider_limit: int,
+) -> List[Dict[str, Any]]:
+    provider = provider.strip().lower()
+    if not provider:
+        return []
+
+    try:
+        if provider == "arasaac":
+            return _search_arasaac(query, per_provider_limit)
+        if provider == "pexels":
+            if not pexels_api_key:
+                _log("[SKIP] PEXELS SIN API KEY. USA ENV PEXELS_API_KEY.")
+                return []
+            return _search_pexels(query, pexels_api_key, per_provider_limit)
+        if provider == "google_cse":
+            if not google_api_key or not google_cx:
+                _log("[SKIP] GOOGLE CSE SIN API KEY/CX. USA ENV GOOGLE_CSE_API_KEY Y GOOGLE_CSE_CX.")
+                return []
+            return _search_google_cse(query, google_api_key, google_cx, per_provider_limit)
+        if provider == "openverse":
+            return _search_openverse(query, per_provider_limit)
+        if provider == "wikimedia":
+            return _search_wikimedia(query, per_provider_limit)
+        _log(f"[SKIP] PROVEEDOR DESCONOCIDO: {provider}")
+    except ProviderUnavailableError:
+        # THE CIRCUIT BREAKER ALREADY LOGGED WHEN IT OPENED.
+        pass
+    except CacheMissError:
+        # EXPECTED UNDER --cache-only: COUNTED AND REPORTED ONCE IN THE SUMMARY.
+        if _METRICS is not None:
+            _METRICS.cache_only_miss(provider)
+    except (HTTPError, URLError, TimeoutError, socket.timeout, OSError) as err:
+        # 429/503 WERE ALREADY RETRIED BY THE PROVIDER'S RateLimiter IN _fetch_text.
+        _log(f"[WARN] ERROR EN PROVEEDOR {provider}: {err}")
+    return []
+
+
 def _iter_candidates(
     providers: Iterable[str],
     query: str,
@@ -948,39 +2667,15 @@ def _iter_candidates(
     per_provider_limit: int,
 ) -> Iterable[Dict[str, Any]]:
     for provider in providers:
-        provider = provider.strip().lower()
-        if not provider:
-            continue
-
-        try:
-            if provider == "arasaac":
-                for candidate in _search_arasaac(query, per_provider_limit):
-                    yield candidate
-            elif provider == "pexels":
-                if not pexels_api_key:
-                    _log("[SKIP] PEXELS SIN API KEY. USA ENV PEXELS_API_KEY.")
-                    continue
-                for candidate in _search_pexels(query, pexels_api_key, per_provider_limit):
-                    yield candidate
-            elif provider == "google_cse":
-                if not google_api_key or not google_cx:
-                    _log("[SKIP] GOOGLE CSE SIN API KEY/CX. USA ENV GOOGLE_CSE_API_KEY Y GOOGLE_CSE_CX.")
-                    continue
-                for candidate in _search_google_cse(query, google_api_key, google_cx, per_provider_limit):
-                    yield candidate
-            elif provider == "openverse":
-                for candidate in _search_openverse(query, per_provider_limit):
-                    yield candidate
-            elif provider == "wikimedia":
-                for candidate in _search_wikimedia(query, per_provider_limit):
-                    yield candidate
-            else:
-                _log(f"[SKIP] PROVEEDOR DESCONOCIDO: {provider}")
-        except (HTTPError, URLError, TimeoutError, socket.timeout, OSError) as err:
-            if isinstance(err, HTTPError) and err.code == 429:
-                _log(f"[WARN] RATE LIMIT EN {provider}. ESPERANDO 2.5s...")
-                time.sleep(2.5)
-            _log(f"[WARN] ERROR EN PROVEEDOR {provider}: {err}")
+        for candidate in _search_provider(
+            provider,
+            query,
+            pexels_api_key,
+            google_api_key,
+            google_cx,
+            per_provider_limit,
+        ):
+            yield candidate
 
 
 def _candidate_is_valid(
@@ -1001,10 +2696,13 @@ def _candidate_is_valid(
         return False
     if mime not in ALLOWED_MIME:
         return False
-    if width and width < min_width:
-        return False
-    if height and height < min_height:
-        return False
+    # ARASAAC PICTOGRAMS ARE SERVED AT 500 PX AT MOST, SO THE PHOTO SIZE LIMITS NEVER APPLY TO THEM.
+    # FOR EVERY OTHER PROVIDER 0 MEANS "UNKNOWN" (CHECKED BY --probe OR THE DOWNLOAD), NOT "TOO SMALL".
+    if provider != "arasaac":
+        if width and width < min_width:
+            return False
+        if height and height < min_height:
+            return False
 
     if not require_free_license:
         return True
@@ -1023,11 +2721,74 @@ def _load_json(path: Path) -> Dict[str, Any]:
     return json.loads(path.read_text(encoding="utf-8"))
 
 
+def _atomic_write_text(path: Path, text: str) -> None:
+    _atomic_write_bytes(path, text.encode("utf-8"))
+
+
+def _atomic_write_bytes(path: Path, data: bytes) -> None:
+    # WRITE A SIBLING TEMP FILE AND RENAME IT: READERS SEE THE OLD OR THE NEW FILE, NEVER HALF OF ONE.
+    handle, temp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=str(path.parent))
+    try:
+        with os.fdopen(handle, "wb") as output:
+            output.write(data)
+            output.flush()
+            os.fsync(output.fileno())
+        mode = stat.S_IMODE(path.stat().st_mode) if path.exists() else 0o644
+        os.chmod(temp_name, mode)
+        os.replace(temp_name, path)
+    except BaseException:
+        Path(temp_name).unlink(missing_ok=True)
+        raise
+
+
 def _save_json(path: Path, payload: Dict[str, Any]) -> None:
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    _atomic_write_text(path, json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+
+
+def _item_fingerprint(item: Dict[str, Any]) -> str:
+    # ONLY THE FIELDS THAT FEED THE SEARCH: EDITING ANYTHING ELSE NEVER TRIGGERS A NEW DOWNLOAD.
+    words = item.get("words") or []
+    payload = {
+        "word": str(item.get("word") or "").strip(),
+        "words": [str(word).strip() for word in words] if isinstance(words, list) else [],
+        "category": str(item.get("category") or "").strip(),
+    }
+    raw = json.dumps(payload, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def _fingerprint_changed(item: Dict[str, Any], source_record: Optional[Dict[str, Any]]) -> bool:
+    # A RECORD THAT NO LONGER DESCRIBES THE CURRENT ASSET (IMAGE CHOSEN BY HAND) IS NOT COMPARED.
+    if not source_record or not source_record.get("fingerprint"):
+        return False
+    if source_record.get("storedAs") != str(item.get("imageAsset") or "").strip():
+        return False
+    return source_record["fingerprint"] != _item_fingerprint(item)
+
+
+def _backfill_fingerprints(items: Iterable[Dict[str, Any]], source_map: Dict[str, Dict[str, Any]]) -> int:
+    # RECORDS WRITTEN BEFORE FINGERPRINTS EXISTED ARE TAKEN AS UP TO DATE INSTEAD OF RE-SEARCHED.
+    added = 0
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        record = source_map.get(str(item.get("id", "")).strip())
+        if record is None or record.get("fingerprint"):
+            continue
+        if record.get("storedAs") != str(item.get("imageAsset") or "").strip():
+            continue
+        record["fingerprint"] = _item_fingerprint(item)
+        added += 1
+    return added
 
 
-def _should_process_item(item: Dict[str, Any], root: Path, refresh_existing: bool, replace_svg: bool) -> bool:
+def _should_process_item(
+    item: Dict[str, Any],
+    root: Path,
+    refresh_existing: bool,
+    replace_svg: bool,
+    source_record: Optional[Dict[str, Any]] = None,
+) -> bool:
     image_asset = str(item.get("imageAsset") or "").strip()
     if not image_asset:
         return True
@@ -1040,7 +2801,10 @@ def _should_process_item(item: Dict[str, Any], root: Path, refresh_existing: boo
     if replace_svg and image_asset.lower().endswith(".svg"):
         return True
 
-    return not asset_path.exists()
+    if not asset_path.exists():
+        return True
+
+    return _fingerprint_changed(item, source_record)
 
 
 def _load_sources(path: Path) -> Dict[str, Dict[str, Any]]:
@@ -1065,290 +2829,2450 @@ def _save_sources(path: Path, source_map: Dict[str, Dict[str, Any]]) -> None:
         "generatedAt": dt.datetime.now(dt.timezone.utc).isoformat(),
         "sources": [source_map[key] for key in sorted(source_map.keys())],
     }
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+    _atomic_write_text(path, json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+
+
+class ItemJournal:
+    # APPEND-ONLY LOG OF COMMITTED ITEMS. EACH LINE IS FSYNCED BEFORE THE ITEM COUNTS AS SAVED, SO THE
+    # FULL DATASET/SOURCES FILES ONLY NEED REWRITING EVERY compact_every ITEMS (AND AT EXIT).
+    def __init__(self, path: Path, compact_every: int = DEFAULT_JOURNAL_COMPACT_EVERY) -> None:
+        self.path = path
+        self.compact_every = max(1, compact_every)
+        self.pending = 0
+        self._handle: Optional[Any] = None
+
+    def replay(self) -> List[Dict[str, Any]]:
+        if not self.path.exists():
+            return []
+        records: List[Dict[str, Any]] = []
+        with self.path.open("r", encoding="utf-8") as handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # A CRASH MID-APPEND LEAVES AT MOST ONE TRUNCATED LINE AT THE END.
+                    continue
+                if isinstance(record, dict) and record.get("itemId"):
+                    records.append(record)
+        self.pending = len(records)
+        return records
+
+    def append(self, record: Dict[str, Any]) -> bool:
+        if self._handle is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._handle = self.path.open("a", encoding="utf-8")
+        self._handle.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._handle.flush()
+        os.fsync(self._handle.fileno())
+        self.pending += 1
+        return self.pending >= self.compact_every
+
+    def reset(self) -> None:
+        # ONLY CALLED ONCE THE DATASET AND SOURCES FILES HOLD EVERY JOURNALED RECORD.
+        self.close()
+        self.path.unlink(missing_ok=True)
+        self.pending = 0
+
+    def close(self) -> None:
+        if self._handle is not None:
+            self._handle.close()
+            self._handle = None
+
+
+def _journal_path(root: Path, cache_dir: str, dataset_path: Path, suffix: str = "") -> Path:
+    return root / cache_dir / "journal" / f"{_slug(dataset_path.stem)}{suffix}.jsonl"
+
+
+def _apply_journal_record(
+    record: Dict[str, Any],
+    items_by_id: Dict[str, Dict[str, Any]],
+    source_map: Dict[str, Dict[str, Any]],
+) -> bool:
+    item = items_by_id.get(str(record.get("itemId", "")))
+    if item is None:
+        return False
+    item["imageAsset"] = record.get("imageAsset", item.get("imageAsset"))
+    if isinstance(record.get("source"), dict):
+        source_map[str(record["itemId"])] = record["source"]
+    return True
+
+
+def _compact_outputs(
+    journal: Optional[ItemJournal],
+    dataset_path: Path,
+    dataset: Dict[str, Any],
+    sources_path: Path,
+    source_map: Dict[str, Dict[str, Any]],
+    shard_output: Optional["ShardOutput"] = None,
+    stale_paths: Iterable[Path] = (),
+) -> None:
+    # A SHARD NEVER WRITES THE SHARED FILES: ITS RESULTS WAIT IN THE PARTIAL OUTPUT UNTIL merge.
+    if shard_output is not None:
+        shard_output.save()
+    else:
+        _save_json(dataset_path, dataset)
+        _save_sources(sources_path, source_map)
+    # SAVE FIRST: REPLACED FILES GO ONLY ONCE THE DATASET ON DISK NO LONGER POINTS AT THEM.
+    for path in stale_paths:
+        path.unlink(missing_ok=True)
+    if journal is not None:
+        journal.reset()
+
+
+def _take_stale_assets(session: Dict[str, Any]) -> List[Path]:
+    # A QUEUED FILE THAT AN ITEM POINTED AT AGAIN SINCE (E.G. THE SAME BLOB RE-DOWNLOADED) STAYS.
+    asset_refs: Counter = session["asset_refs"]
+    stale_assets: set = session["stale_assets"]
+    paths = [session["root"] / image_asset for image_asset in sorted(stale_assets) if asset_refs[image_asset] <= 0]
+    stale_assets.clear()
+    return paths
+
+
+def _recover_journal(
+    journal: ItemJournal,
+    dataset_path: Path,
+    dataset: Dict[str, Any],
+    sources_path: Path,
+    source_map: Dict[str, Dict[str, Any]],
+    persist: bool,
+    shard_output: Optional["ShardOutput"] = None,
+) -> List[str]:
+    records = journal.replay()
+    if not records:
+        return []
+    items_by_id = {str(item.get("id", "")).strip(): item for item in dataset.get("items", []) if isinstance(item, dict)}
+    applied: List[str] = []
+    for record in records:
+        item = items_by_id.get(str(record.get("itemId", "")))
+        base_asset = str(item.get("imageAsset") or "") if item is not None else ""
+        if not _apply_journal_record(record, items_by_id, source_map):
+            continue
+        applied.append(str(record["itemId"]))
+        if shard_output is not None:
+            shard_output.add(record, base_asset)
+    _log(f"[JOURNAL] {len(applied)} ÍTEMS RECUPERADOS DE UNA EJECUCIÓN INTERRUMPIDA")
+    if persist:
+        _compact_outputs(journal, dataset_path, dataset, sources_path, source_map, shard_output)
+    return applied
+
+
+def _parse_shard(text: str) -> Tuple[int, int]:
+    # "K/N" WITH 1 <= K <= N.
+    index_text, _, count_text = text.partition("/")
+    index, count = int(index_text), int(count_text)
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(text)
+    return index, count
+
+
+def _item_shard(item_id: str, count: int) -> int:
+    # STABLE ACROSS MACHINES AND PYTHON VERSIONS (UNLIKE hash()), AND INDEPENDENT OF DATASET ORDER.
+    digest = hashlib.sha256(item_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % count + 1
+
+
+def _shard_suffix(shard: Optional[Tuple[int, int]]) -> str:
+    return f".shard-{shard[0]}-of-{shard[1]}" if shard else ""
+
+
+def _shard_output_dir(root: Path, cache_dir: str) -> Path:
+    return root / cache_dir / "shards"
+
+
+class ShardOutput:
+    # PARTIAL RESULT OF ONE --shard RUN: THE NEW imageAsset AND SOURCE RECORD OF EACH ITEM, PLUS THE
+    # imageAsset IT HAD WHEN THE SHARD STARTED, WHICH merge USES TO DETECT CONFLICTING CHANGES.
+    def __init__(self, path: Path, shard: Tuple[int, int], dataset_name: str) -> None:
+        self.path = path
+        self.shard = shard
+        self.dataset_name = dataset_name
+        self.records: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> List[Dict[str, Any]]:
+        # A RE-RUN OF THE SAME SHARD KEEPS ADDING TO ITS EARLIER PARTIAL OUTPUT.
+        if not self.path.exists():
+            return []
+        payload = _load_json(self.path)
+        if payload.get("dataset") != self.dataset_name or payload.get("shardCount") != self.shard[1]:
+            _log(f"[WARN] SALIDA PARCIAL DE OTRO DATASET O REPARTO, SE IGNORA: {self.path}")
+            return []
+        self.records = {
+            str(record["itemId"]): record
+            for record in payload.get("items", [])
+            if isinstance(record, dict) and record.get("itemId")
+        }
+        return list(self.records.values())
+
+    def add(self, record: Dict[str, Any], base_asset: str) -> None:
+        item_id = str(record["itemId"])
+        previous = self.records.get(item_id)
+        self.records[item_id] = {
+            "itemId": item_id,
+            "baseImageAsset": previous["baseImageAsset"] if previous is not None else base_asset,
+            "imageAsset": record.get("imageAsset", ""),
+            "source": record.get("source", {}),
+        }
+
+    def save(self) -> None:
+        payload = {
+            "generatedAt": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "dataset": self.dataset_name,
+            "shard": self.shard[0],
+            "shardCount": self.shard[1],
+            "items": [self.records[key] for key in sorted(self.records)],
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write_text(self.path, json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+
+
+class RunState:
+    # PER-ITEM MEMORY ACROSS RUNS: WHAT WAS TRIED (QUERIES, PROVIDERS, REJECTED URLS), WHY IT FAILED
+    # AND WHEN IT MAY BE RETRIED. ENTRIES CARRY THE runId THAT WROTE THEM SO --resume CAN TELL
+    # "DONE IN THIS RUN" FROM "DONE IN SOME EARLIER RUN".
+    def __init__(self, path: Path, backoff_seconds: float, max_backoff_seconds: float) -> None:
+        self.path = path
+        self.backoff_seconds = max(0.0, backoff_seconds)
+        self.max_backoff_seconds = max(self.backoff_seconds, max_backoff_seconds)
+        self.run_id = ""
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.unsaved = 0
+        if not path.exists():
+            return
+        try:
+            raw = json.loads(path.read_text(encoding="utf-8"))
+        except json.JSONDecodeError:
+            _log(f"[WARN] ESTADO DE EJECUCIÓN ILEGIBLE, SE IGNORA: {path}")
+            return
+        if isinstance(raw, dict):
+            self.run_id = str(raw.get("runId", ""))
+            items = raw.get("items")
+            if isinstance(items, dict):
+                self.items = {str(key): value for key, value in items.items() if isinstance(value, dict)}
+
+    def start_run(self) -> None:
+        self.run_id = dt.datetime.now(dt.timezone.utc).isoformat()
+        self.unsaved += 1
+
+    def rejected_urls(self, item_id: str) -> List[str]:
+        return list(self.items.get(item_id, {}).get("rejectedUrls", []))
+
+    def is_failed(self, item_id: str) -> bool:
+        return self.items.get(item_id, {}).get("status") == "failed"
+
+    def _backoff(self, failures: int) -> dt.timedelta:
+        return dt.timedelta(seconds=min(self.max_backoff_seconds, self.backoff_seconds * (2 ** max(0, failures - 1))))
+
+    def retry_due(self, item_id: str, now: dt.datetime) -> bool:
+        # RECOMPUTED FROM THE CURRENT BACKOFF SETTINGS, SO A SHORTER --retry-backoff-minutes APPLIES AT ONCE.
+        entry = self.items.get(item_id, {})
+        try:
+            last_attempt = dt.datetime.fromisoformat(str(entry.get("lastAttemptAt", "")))
+        except ValueError:
+            return True
+        return now >= last_attempt + self._backoff(int(entry.get("failures", 0) or 0))
+
+    def skip_on_resume(self, item_id: str, now: dt.datetime) -> bool:
+        entry = self.items.get(item_id)
+        if not entry:
+            return False
+        if entry.get("status") in {"completed", "skipped"}:
+            return entry.get("runId") == self.run_id
+        return entry.get("status") == "failed" and not self.retry_due(item_id, now)
+
+    def record(self, item_id: str, status: str, attempt: Dict[str, Any], now: dt.datetime) -> None:
+        entry = self.items.setdefault(item_id, {})
+        entry.update(
+            runId=self.run_id,
+            status="completed" if status == "updated" else status,
+            attempts=int(entry.get("attempts", 0) or 0) + 1,
+            lastAttemptAt=now.isoformat(),
+            queries=list(attempt.get("queries", [])),
+            providers=list(attempt.get("providers", [])),
+        )
+        if status != "failed":
+            for key in ("failures", "reason", "message", "nextRetryAt", "rejectedUrls"):
+                entry.pop(key, None)
+            self.unsaved += 1
+            return
+
+        failures = int(entry.get("failures", 0) or 0) + 1
+        rejected = list(dict.fromkeys(list(entry.get("rejectedUrls", [])) + list(attempt.get("rejectedUrls", []))))
+        entry.update(
+            failures=failures,
+            reason=str(attempt.get("reason", "")),
+            message=str(attempt.get("message", "")),
+            nextRetryAt=(now + self._backoff(failures)).isoformat(),
+            rejectedUrls=rejected[-RUN_STATE_MAX_REJECTED_URLS:],
+        )
+        self.unsaved += 1
+
+    def mark_completed(self, item_id: str, now: dt.datetime) -> None:
+        self.record(item_id, "updated", self.items.get(item_id, {}), now)
+
+    def failure_queue(self, now: dt.datetime) -> Tuple[int, int]:
+        failed = [item_id for item_id in self.items if self.is_failed(item_id)]
+        return len(failed), sum(1 for item_id in failed if self.retry_due(item_id, now))
+
+    def save(self) -> None:
+        if not self.unsaved:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {"runId": self.run_id, "items": {key: self.items[key] for key in sorted(self.items)}}
+        _atomic_write_text(self.path, json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+        self.unsaved = 0
+
+
+def _run_state_path(root: Path, cache_dir: str, dataset_path: Path, suffix: str = "") -> Path:
+    return root / cache_dir / "run_state" / f"{_slug(dataset_path.stem)}{suffix}.json"
+
+
+def _provider_request_key(provider: str, query: str) -> str:
+    # WHAT THE PROVIDER'S ANSWER ACTUALLY DEPENDS ON: "mesa photo" AND "mesa cocina" ARE ONE ARASAAC SEARCH.
+    if provider.strip().lower() == "arasaac":
+        search_terms = _arasaac_search_terms(query)
+        return search_terms[0] if search_terms else ""
+    return query
+
+
+def _provider_cache_key(session: Dict[str, Any], provider: str, query: str) -> str:
+    return f"{provider}|{_provider_request_key(provider, query)}|{session['per_provider_limit']}"
+
+
+def _plan_searches(
+    items: Iterable[Dict[str, Any]],
+    providers: List[str],
+    offline_providers: Iterable[str] = (),
+) -> Tuple[List[Tuple[str, str]], Dict[str, Dict[str, int]]]:
+    # EVERY (PROVIDER, QUERY) THE ITEMS WOULD ASK FOR, DEDUPED BY REQUEST KEY, IN FIRST-USE ORDER. THE
+    # STATS COUNT HTTP REQUESTS: "naive" WITH NO DEDUPING AT ALL, "exact" DEDUPING IDENTICAL QUERIES ONLY
+    # (THE IN-MEMORY QUERY CACHE ON ITS OWN) AND "planned" FOR THE DEDUPED PLAN. OFFLINE PROVIDERS
+    # (ARASAAC WITH A LOCAL CATALOG) PLAN NO REQUESTS AT ALL.
+    offline = set(offline_providers)
+    searches: Dict[Tuple[str, str], str] = {}
+    exact_queries = set()
+    http_keys: Dict[str, set] = {}
+    stats = {provider: {"naive": 0, "exact": 0, "planned": 0, "searches": 0} for provider in providers}
+    for item in items:
+        for query in _build_query_variants(item):
+            for provider in providers:
+                name = provider.strip().lower()
+                request_keys = _arasaac_search_terms(query) if name == "arasaac" else [query]
+                stats[provider]["naive"] += len(request_keys)
+                if (provider, query) not in exact_queries:
+                    exact_queries.add((provider, query))
+                    stats[provider]["exact"] += len(request_keys)
+                key = (provider, _provider_request_key(provider, query))
+                if key in searches:
+                    continue
+                searches[key] = query
+                stats[provider]["searches"] += 1
+                if name not in offline:
+                    http_keys.setdefault(provider, set()).update(request_keys)
+    for provider in providers:
+        stats[provider]["planned"] = len(http_keys.get(provider, ()))
+    return [(provider, query) for (provider, _), query in searches.items()], stats
 
 
-def main() -> int:
-    parser = argparse.ArgumentParser(description="SYNC ONLINE IMAGES INTO OFFLINE DATASET ASSETS")
-    parser.add_argument("--dataset", default="assets/data/lectoescritura_dataset.json")
-    parser.add_argument("--sources", default="assets/data/image_sources.json")
-    parser.add_argument(
-        "--providers",
-        default="arasaac,pexels,openverse,wikimedia,google_cse",
-        help="ORDERED LIST: arasaac,pexels,openverse,wikimedia,google_cse",
-    )
-    parser.add_argument("--per-provider-limit", type=int, default=10)
-    parser.add_argument("--min-width", type=int, default=DEFAULT_MIN_WIDTH)
-    parser.add_argument("--min-height", type=int, default=DEFAULT_MIN_HEIGHT)
-    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
-    parser.add_argument("--refresh-existing", action="store_true")
-    parser.add_argument("--replace-svg", action="store_true", default=True)
-    parser.add_argument("--no-replace-svg", dest="replace_svg", action="store_false")
-    parser.add_argument("--require-free-license", action="store_true", default=True)
-    parser.add_argument("--allow-any-license", dest="require_free_license", action="store_false")
-    parser.add_argument("--accept-google-rights-filter", action="store_true", default=True)
-    parser.add_argument("--strict-google-license", dest="accept_google_rights_filter", action="store_false")
-    parser.add_argument("--limit", type=int, default=0, help="0 = SIN LÍMITE")
-    parser.add_argument("--level", action="append", type=int, default=[])
+def _log_plan(stats: Dict[str, Dict[str, int]]) -> None:
+    for provider, values in stats.items():
+        _log(
+            f"[PLAN] {provider}: {values['planned']} PETICIONES "
+            f"(SIN PLAN {values['exact']}, SIN NINGUNA CACHÉ {values['naive']})"
+        )
+    planned = sum(values["planned"] for values in stats.values())
+    exact = sum(values["exact"] for values in stats.values())
+    _log(f"[PLAN] TOTAL: {planned} PETICIONES, {exact - planned} MENOS QUE SIN PLAN")
+
+
+def _prefetch_plan(session: Dict[str, Any], searches: List[Tuple[str, str]]) -> None:
+    # ONE BATCH BEFORE ANY ITEM IS SCORED; THE PROVIDER POOLS BOUND THE CONCURRENCY.
+    futures = [_provider_search_future(session, provider, query) for provider, query in searches]
+    for future in futures:
+        future.result()
+
+
+def _search_provider_cached(session: Dict[str, Any], provider: str, query: str) -> List[Dict[str, Any]]:
+    cache_key = _provider_cache_key(session, provider, query)
+    query_cache: Dict[str, List[Dict[str, Any]]] = session["query_cache"]
+    with session["lock"]:
+        cached = query_cache.get(cache_key)
+    metrics = _METRICS
+    if metrics is not None:
+        metrics.cache_lookup("query", provider, cached is not None)
+    if cached is not None:
+        return cached
+
+    requests_before = getattr(_FETCH_STATE, "requests", 0)
+    with _timed("search", provider):
+        candidates = _search_provider(
+            provider,
+            query,
+            session["pexels_api_key"],
+            session["google_api_key"],
+            session["google_cx"],
+            session["per_provider_limit"],
+        )
+    candidate_store: Optional[CandidateStore] = session.get("candidate_store")
+    if candidate_store is not None and candidates:
+        candidate_store.add(provider.strip().lower(), query, candidates)
+    with session["lock"]:
+        if getattr(_FETCH_STATE, "requests", 0) > requests_before:
+            session["network_searches"].add(cache_key)
+        # ANOTHER WORKER MAY HAVE FILLED THE SAME KEY MEANWHILE; KEEP THE FIRST RESULT.
+        return query_cache.setdefault(cache_key, candidates)
+
+
+def _provider_search_future(session: Dict[str, Any], provider: str, query: str) -> Future:
+    # ONE FUTURE PER (PROVIDER, QUERY): ITEMS ASKING FOR THE SAME SEARCH WAIT ON THE SAME REQUEST.
+    cache_key = _provider_cache_key(session, provider, query)
+    with session["lock"]:
+        future = session["inflight"].get(cache_key)
+        if future is None:
+            executor: ThreadPoolExecutor = session["provider_executors"][provider]
+            future = executor.submit(_search_provider_cached, session, provider, query)
+            session["inflight"][cache_key] = future
+    return future
+
+
+def _prefetch_queries(session: Dict[str, Any], queries: Iterable[str]) -> None:
+    if not session.get("provider_executors"):
+        return
+    for query in queries:
+        for provider in session["providers"]:
+            _provider_search_future(session, provider, query)
+
+
+def _iter_query_responses(
+    session: Dict[str, Any],
+    queries: Iterable[str],
+    result: Optional[Dict[str, Any]] = None,
+) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    # LAZY: A QUERY IS ONLY SEARCHED WHEN THE CONSUMER ASKS FOR IT (WITH PROVIDER POOLS, ALL PROVIDERS OF
+    # THAT QUERY AT ONCE). RESPONSES COME IN PROVIDER ORDER REGARDLESS OF COMPLETION ORDER, SO THE
+    # STABLE SORT IN _process_item KEEPS PROVIDER ORDER AS THE TIE-BREAKER FOR EQUAL SCORES.
+    # result["searched"] IS SET ONCE A RESPONSE THAT HAD TO ASK A PROVIDER OVER THE NETWORK IS CONSUMED.
+    def consumed(provider: str, query: str) -> None:
+        network_searches = session["network_searches"]
+        if result is None or result.get("searched") or not network_searches:
+            return
+        if _provider_cache_key(session, provider, query) in network_searches:
+            result["searched"] = True
+
+    for query in queries:
+        if session.get("provider_executors"):
+            futures = [_provider_search_future(session, provider, query) for provider in session["providers"]]
+            for provider, future in zip(session["providers"], futures):
+                candidates = future.result()
+                consumed(provider, query)
+                yield query, candidates
+        else:
+            for provider in session["providers"]:
+                candidates = _search_provider_cached(session, provider, query)
+                consumed(provider, query)
+                yield query, candidates
+
+
+def _iter_local_responses(session: Dict[str, Any], queries: Iterable[str]) -> Iterator[Tuple[str, List[Dict[str, Any]]]]:
+    candidate_store: CandidateStore = session["candidate_store"]
+    for query in queries:
+        with _timed("local_search"):
+            candidates = candidate_store.search(query, session["providers"])
+        yield query, candidates
+
+
+def _collect_candidates(
+    responses: Iterator[Tuple[str, List[Dict[str, Any]]]],
+    context: ItemContext,
+    seen_urls: set,
+    args: argparse.Namespace,
+    scored_candidates: List[Candidate],
+    confidence_threshold: Optional[float] = None,
+    scorer: Optional[BatchScorer] = None,
+) -> bool:
+    # SCORES CANDIDATES AS THEIR RESPONSES ARRIVE (ONE BATCH PER RESPONSE WITH A BatchScorer). WITH A
+    # THRESHOLD IT STOPS AFTER THE FIRST RESPONSE HOLDING A CONFIDENT, CLEAN CANDIDATE. RETURNS True
+    # ONCE EVERY RESPONSE HAS BEEN CONSUMED.
+    score_seconds = 0.0
+    try:
+        for query, raw_candidates in responses:
+            batch: List[Candidate] = []
+            for raw_candidate in raw_candidates:
+                image_url = str(raw_candidate.get("image_url", "")).strip()
+                if not image_url or image_url in seen_urls:
+                    continue
+                seen_urls.add(image_url)
+
+                if not _candidate_is_valid(
+                    raw_candidate,
+                    min_width=args.min_width,
+                    min_height=args.min_height,
+                    require_free_license=args.require_free_license,
+                    accept_google_rights_filter=args.accept_google_rights_filter,
+                ):
+                    continue
+                # THE RAW DICT IS SHARED THROUGH THE QUERY CACHE; PER-ITEM STATE LIVES ON THE Candidate.
+                batch.append(Candidate(raw_candidate, query))
+
+            started = time.perf_counter()
+            if scorer is not None and batch:
+                scores = scorer.score((candidate, context, query) for candidate in batch)
+                for candidate, score in zip(batch, scores.tolist()):
+                    candidate.score = score
+            else:
+                for candidate in batch:
+                    candidate.score = _score_candidate(candidate, context, query)
+            score_seconds += time.perf_counter() - started
+            scored_candidates.extend(batch)
+            if confidence_threshold is not None and any(
+                candidate.score >= confidence_threshold and not _candidate_metadata_is_bad(context, candidate)
+                for candidate in batch
+            ):
+                return False
+        return True
+    finally:
+        # SCORING IS TIMED AS ONE OBSERVATION PER PASS; SEARCH TIME IS RECORDED BY _search_provider_cached.
+        if _METRICS is not None and score_seconds:
+            _METRICS.observe("score", score_seconds)
+
+
+def _probe_candidates(
+    session: Dict[str, Any],
+    context: ItemContext,
+    probe_pool: List[Candidate],
+    scored_candidates: List[Candidate],
+    rejected_urls: List[str],
+) -> bool:
+    # PROBES THE CANDIDATES ABOUT TO BE DOWNLOADED. THOSE WHOSE REAL FORMAT OR SIZE FAILS THE FILTERS ARE
+    # REMOVED FROM scored_candidates; THE REST ARE RE-SCORED WITH THEIR REAL SIZE. EACH URL IS PROBED ONCE
+    # PER RUN. RETURNS True WHEN SOMETHING WAS PROBED, I.E. THE RANKING MAY HAVE CHANGED.
+    args = session["args"]
+    probes: Dict[str, Optional[Dict[str, Any]]] = session["probes"]
+    scorer: Optional[BatchScorer] = session.get("scorer")
+    probed_any = False
+    rejected = set()
+    for candidate in probe_pool:
+        if candidate.get("probed"):
+            continue
+        probed_any = True
+        image_url = candidate["image_url"]
+        with session["lock"]:
+            known = image_url in probes
+            probe = probes.get(image_url)
+        if not known:
+            try:
+                probe = _probe_image(image_url, candidate.provider.strip().lower())
+            except HTTPError as err:
+                # GONE FOR GOOD; ANY OTHER ERROR IS LEFT FOR THE DOWNLOAD (AND ITS RETRIES) TO DECIDE.
+                probe = {"error": f"HTTP {err.code}"} if err.code in (404, 410) else None
+            except (URLError, TimeoutError, OSError):
+                probe = None
+            with session["lock"]:
+                probes[image_url] = probe
+        if probe is None:
+            # NOTHING LEARNED: MARK IT SO THE SAME ITEM DOES NOT ASK AGAIN.
+            candidate.data = {**candidate.data, "probed": True}
+            continue
+        if "error" in probe:
+            reason = probe["error"]
+        else:
+            # A PER-ITEM COPY: THE RAW DICT IS SHARED THROUGH THE QUERY CACHE.
+            candidate.data = {**candidate.data, **probe, "probed": True}
+            valid = _candidate_is_valid(
+                candidate.data,
+                min_width=args.min_width,
+                min_height=args.min_height,
+                require_free_license=args.require_free_license,
+                accept_google_rights_filter=args.accept_google_rights_filter,
+            )
+            if valid:
+                if scorer is not None:
+                    candidate.score = scorer.score([(candidate, context, candidate.query)]).tolist()[0]
+                else:
+                    candidate.score = _score_candidate(candidate, context, candidate.query)
+                continue
+            reason = f"{probe['width']}x{probe['height']} {probe['mime']}"
+        rejected.add(image_url)
+        rejected_urls.append(image_url)
+        _log(f"[PROBE] DESCARTADA ANTES DE DESCARGAR ({reason}): {image_url}")
+    if rejected:
+        scored_candidates[:] = [candidate for candidate in scored_candidates if candidate["image_url"] not in rejected]
+    return probed_any
+
+
+# SEARCH, SCORE AND DOWNLOAD ONE ITEM WITHOUT TOUCHING SHARED FILES. THE RESULT IS
+# APPLIED LATER BY _commit_item_result ON THE MAIN THREAD, SO WORKERS CAN RUN IT IN PARALLEL.
+def _process_item(item: Dict[str, Any], session: Dict[str, Any]) -> Dict[str, Any]:
+    args = session["args"]
+    item_id = str(item.get("id", "")).strip()
+    result: Dict[str, Any] = {"status": "failed", "item": item, "item_id": item_id}
+
+    with _timed("query_build"):
+        queries = _build_query_variants(item)
+    rejected_urls: List[str] = []
+    attempt: Dict[str, Any] = {
+        "queries": queries,
+        "providers": list(session["providers"]),
+        "rejectedUrls": rejected_urls,
+        "reason": "",
+        "message": "",
+    }
+    result["attempt"] = attempt
+    category = str(item.get("category", "GENERAL"))
+    category_slug = _slug(category)
+
+    _log(f"[SEARCH] {item_id} -> {queries[0] if queries else item_id}")
+    context = ItemContext(item)
+    scored_candidates: List[Candidate] = []
+    # URLS THAT FAILED FOR THIS ITEM IN EARLIER RUNS ARE NOT TRIED AGAIN WHEN RESUMING.
+    seen_urls = set(session["known_rejected"].get(item_id, ()))
+    responses = _iter_query_responses(session, queries, result)
+
+    # WITH --search-local THE NETWORK IS ONLY ASKED WHEN THE LOCAL CORPUS HAS NO CONFIDENT CANDIDATE.
+    # IF THE LOCAL PICKS FAIL TO DOWNLOAD, THE RETRY BELOW FALLS BACK TO THE NETWORK SEARCHES.
+    local_hit = False
+    if args.search_local and session.get("candidate_store") is not None:
+        local_hit = not _collect_candidates(
+            _iter_local_responses(session, queries),
+            context,
+            seen_urls,
+            args,
+            scored_candidates,
+            confidence_threshold=args.local_threshold,
+            scorer=session.get("scorer"),
+        )
+    result["local_hit"] = local_hit
+
+    if local_hit:
+        exhausted = False
+    else:
+        # EARLY EXIT NEEDS THE LAZY ORDER; OTHERWISE EVERY VARIANT IS QUEUED ON THE PROVIDER POOLS AT ONCE.
+        early_exit = args.early_exit and not args.interactive
+        if not early_exit:
+            _prefetch_queries(session, queries)
+        exhausted = _collect_candidates(
+            responses,
+            context,
+            seen_urls,
+            args,
+            scored_candidates,
+            confidence_threshold=args.confidence_threshold if early_exit else None,
+            scorer=session.get("scorer"),
+        )
+        result["early_exit"] = not exhausted
+
+    selected_download: Optional[Dict[str, Any]] = None
+    selected_hash: Optional[int] = None
+    download_error: Optional[str] = None
+    tried_urls = set()
+    while True:
+        if not scored_candidates and not exhausted:
+            # EVERY CANDIDATE FOUND SO FAR WAS DROPPED BY THE PROBE: SEARCH THE REMAINING VARIANTS.
+            exhausted = _collect_candidates(
+                responses, context, seen_urls, args, scored_candidates, scorer=session.get("scorer")
+            )
+            continue
+        if not scored_candidates:
+            _log(f"[MISS] SIN CANDIDATOS VÁLIDOS PARA {item_id}")
+            attempt["reason"] = "no_candidates"
+            return result
+
+        scored_candidates.sort(key=lambda value: value.score, reverse=True)
+        with _timed("metadata_filter"):
+            filtered_candidates = [
+                candidate
+                for candidate in scored_candidates
+                if not _candidate_metadata_is_bad(context, candidate)
+            ]
+
+        if not filtered_candidates:
+            _log(f"[MISS] {item_id}: SOLO HUBO CANDIDATOS SOSPECHOSOS, SE REINTENTARÁ MÁS TARDE")
+            attempt["reason"] = "suspicious_candidates"
+            return result
+
+        ranked_candidates = filtered_candidates
+
+        if args.probe:
+            # ARASAAC PICTOGRAMS ARE NOT PROBED: THEY SKIP THE SIZE FILTER AND ARE SMALL ENOUGH THAT A
+            # PROBE COSTS ABOUT AS MUCH AS THE DOWNLOAD, WHICH RECORDS THEIR REAL SIZE ANYWAY.
+            probe_pool = [
+                candidate
+                for candidate in ranked_candidates[: max(1, args.auto_retry_candidates) + len(tried_urls)]
+                if candidate["image_url"] not in tried_urls and candidate.provider.strip().lower() != "arasaac"
+            ]
+            if _probe_candidates(session, context, probe_pool, scored_candidates, rejected_urls):
+                # REAL SIZES CAN MOVE CANDIDATES OR DROP THEM: RANK AGAIN BEFORE PICKING.
+                continue
+
+        chosen = ranked_candidates[0]
+
+        if args.interactive:
+            preview_count = max(1, min(args.preview_candidates, len(ranked_candidates)))
+            _log(f"[REVIEW] TOP {preview_count} CANDIDATOS PARA {item_id}:")
+            for idx, cand in enumerate(ranked_candidates[:preview_count], start=1):
+                _log(
+                    f"  {idx}) SCORE={cand.score:.2f} | {cand.get('provider')} | "
+                    f"LIC={cand.get('license')} | {cand.get('title')}"
+                )
+                _log(f"     {cand.get('image_url')}")
+            choice = input("ELIGE NÚMERO (ENTER=1, 0=OMITIR): ").strip()
+            if choice == "0":
+                _log(f"[SKIP] OMITIDO POR USUARIO: {item_id}")
+                result["status"] = "skipped"
+                return result
+            if choice:
+                try:
+                    selected_index = int(choice) - 1
+                    if 0 <= selected_index < preview_count:
+                        chosen = ranked_candidates[selected_index]
+                except ValueError:
+                    pass
+
+        if args.dry_run:
+            result.update(
+                status="updated",
+                chosen=chosen,
+                relative_path=_candidate_relative_path(chosen, item_id, category_slug),
+            )
+            return result
+
+        retry_pool = [
+            candidate for candidate in ranked_candidates if candidate["image_url"] not in tried_urls
+        ][: max(1, args.auto_retry_candidates)]
+
+        for ranked_candidate in retry_pool:
+            tried_urls.add(ranked_candidate["image_url"])
+            provider = str(ranked_candidate.get("provider", "")).strip().lower()
+            try:
+                with _timed("download", provider):
+                    download = _download_to_temp(ranked_candidate["image_url"], session["download_dir"], args.max_bytes)
+            except (HTTPError, URLError, TimeoutError, OSError) as err:
+                download_error = str(err)
+                rejected_urls.append(ranked_candidate["image_url"])
+                continue
+            if _METRICS is not None:
+                _METRICS.add_bytes("image", provider, download["size"])
+
+            if provider != "arasaac":
+                with _timed("document_check"):
+                    looks_like_document = _looks_like_text_document(download["path"])
+            else:
+                looks_like_document = False
+            if looks_like_document:
+                download["path"].unlink(missing_ok=True)
+                rejected_urls.append(ranked_candidate["image_url"])
+                _log(
+                    f"[RETRY] {item_id} DESCARTADA POR PARECER DOCUMENTO/TEXTO: "
+                    f"{ranked_candidate.get('title', '')}"
+                )
+                continue
+
+            image_hash = None
+            if session.get("hash_index") is not None:
+                with _timed("hash"):
+                    image_hash = _dhash(download["path"])
+            duplicate = _duplicate_of(session, item_id, image_hash)
+            if duplicate is not None:
+                download["path"].unlink(missing_ok=True)
+                rejected_urls.append(ranked_candidate["image_url"])
+                _log(
+                    f"[RETRY] {item_id} DESCARTADA POR REPETIR LA IMAGEN DE {duplicate[0]} "
+                    f"(DISTANCIA {duplicate[1]})"
+                )
+                continue
+
+            chosen = ranked_candidate
+            selected_download = download
+            selected_hash = image_hash
+            break
+
+        if selected_download is not None or exhausted:
+            break
+        # THE EARLY PICKS ALL FAILED TO DOWNLOAD: SEARCH THE REMAINING VARIANTS AND RANK EVERYTHING AGAIN.
+        _log(f"[RETRY] {item_id}: BUSCANDO EN EL RESTO DE VARIANTES")
+        exhausted = _collect_candidates(
+            responses, context, seen_urls, args, scored_candidates, scorer=session.get("scorer")
+        )
+
+    if selected_download is None:
+        _log(f"[ERROR] {item_id}: NO SE ENCONTRÓ UNA IMAGEN VÁLIDA. {download_error or ''}".strip())
+        attempt.update(reason="download_failed", message=download_error or "")
+        return result
+
+    result.update(
+        status="updated",
+        chosen=chosen,
+        temp_path=selected_download["path"],
+        image_hash=selected_hash,
+        sha256=selected_download["sha256"],
+        width=selected_download["width"],
+        height=selected_download["height"],
+        relative_path=_candidate_relative_path(
+            chosen, item_id, category_slug, selected_download["mime"], selected_download["sha256"]
+        ),
+    )
+    return result
+
+
+def _candidate_mime(candidate: Candidate, served_mime: str = "") -> str:
+    # THE TYPE THE SERVER ACTUALLY SENT WINS OVER THE ONE ANNOUNCED IN THE SEARCH METADATA.
+    return served_mime or candidate.get("mime") or _infer_mime_from_url(candidate.get("image_url", "")) or "image/jpeg"
+
+
+def _candidate_relative_path(
+    candidate: Candidate,
+    item_id: str,
+    category_slug: str,
+    served_mime: str = "",
+    sha256: str = "",
+) -> Path:
+    # DOWNLOADED FILES ARE NAMED BY CONTENT; WITHOUT A DIGEST (DRY RUN) THE ITEM ID IS SHOWN INSTEAD.
+    mime = _candidate_mime(candidate, served_mime)
+    stem = sha256[:BLOB_NAME_LENGTH] if sha256 else _slug(item_id)
+    return Path("assets") / "images" / category_slug / f"{stem}{_mime_to_ext(mime)}"
+
+
+def _commit_item_result(
+    result: Dict[str, Any],
+    session: Dict[str, Any],
+    dataset: Dict[str, Any],
+    source_map: Dict[str, Dict[str, Any]],
+) -> str:
+    status = str(result.get("status", "failed"))
+    if status != "updated":
+        return status
+
+    item = result["item"]
+    item_id = result["item_id"]
+    chosen = result["chosen"]
+    relative_path: Path = result["relative_path"]
+
+    if session["args"].dry_run:
+        _log(f"[DRY] {item_id} -> {relative_path.as_posix()} ({chosen.get('provider')})")
+        return status
+
+    # PARALLEL WORKERS CHECKED AGAINST THE INDEX BEFORE EARLIER RESULTS WERE COMMITTED: CHECK AGAIN.
+    duplicate = _duplicate_of(session, item_id, result.get("image_hash"))
+    if duplicate is not None:
+        _discard_item_result(result)
+        result.setdefault("attempt", {}).update(reason="duplicate_image", message=duplicate[0])
+        _log(f"[ERROR] {item_id}: LA IMAGEN ELEGIDA REPITE LA DE {duplicate[0]} (DISTANCIA {duplicate[1]})")
+        return "failed"
+
+    root: Path = session["root"]
+    sha256 = str(result.get("sha256") or "")
+    blobs: Dict[str, str] = session["blobs"]
+    shared_asset = blobs.get(sha256, "") if sha256 else ""
+    if shared_asset and (root / shared_asset).is_file():
+        # SAME BYTES ALREADY STORED (UNCHANGED REFRESH OR ANOTHER ITEM'S BLOB): POINT AT IT, WRITE NOTHING.
+        relative_path = Path(shared_asset)
+        _discard_item_result(result)
+    elif _is_blob_path(relative_path) and (root / relative_path).is_file():
+        _discard_item_result(result)
+    else:
+        _move_into_place(result.pop("temp_path"), root / relative_path)
+    mime = _infer_mime_from_url(relative_path.as_posix()) or _candidate_mime(chosen)
+    stored_sha256 = sha256
+    if sha256 and relative_path.stem != sha256[:BLOB_NAME_LENGTH]:
+        # THE SHARED FILE WAS RE-ENCODED OR PREDATES BLOB NAMES, SO ITS OWN DIGEST DIFFERS.
+        stored_sha256 = _file_sha256(root / relative_path)
+    previous_record = source_map.get(item_id) or {}
+    if sha256:
+        blobs[sha256] = relative_path.as_posix()
+        blobs.setdefault(stored_sha256, relative_path.as_posix())
+
+    if session.get("hash_index") is not None and result.get("image_hash") is not None:
+        session["hash_index"].add(item_id, result["image_hash"], relative_path.as_posix())
+
+    previous_asset = str(item.get("imageAsset") or "")
+    item["imageAsset"] = relative_path.as_posix()
+    asset_refs: Counter = session["asset_refs"]
+    if previous_asset != item["imageAsset"]:
+        asset_refs[item["imageAsset"]] += 1
+        asset_refs[previous_asset] -= 1
+        # ONLY FILES THIS SCRIPT STORED ARE REMOVED, AND ONLY ONCE NO ITEM POINTS AT THEM ANY MORE: THEY
+        # WAIT FOR THE NEXT COMPACTION, WHEN THE DATASET ON DISK STOPS POINTING AT THEM.
+        # A SHARD LEAVES THEM IN PLACE: THE SHARED DATASET STILL POINTS AT THEM UNTIL merge.
+        if (
+            previous_asset
+            and previous_asset == previous_record.get("storedAs")
+            and asset_refs[previous_asset] <= 0
+            and session.get("shard_output") is None
+        ):
+            session["stale_assets"].add(previous_asset)
+
+    source_map[item_id] = {
+        "itemId": item_id,
+        "query": chosen.query,
+        "provider": chosen.get("provider", ""),
+        "imageUrl": chosen.get("image_url", ""),
+        "sourcePage": chosen.get("source_page", ""),
+        "title": chosen.get("title", ""),
+        "license": chosen.get("license", ""),
+        "attribution": chosen.get("attribution", ""),
+        "mime": mime,
+        # THE SIZE READ FROM THE DOWNLOADED FILE WINS OVER THE ONE IN THE SEARCH METADATA.
+        "width": int(result.get("width") or chosen.get("width", 0) or 0),
+        "height": int(result.get("height") or chosen.get("height", 0) or 0),
+        "downloadedAt": dt.datetime.now(dt.timezone.utc).isoformat(),
+        "storedAs": relative_path.as_posix(),
+        "fingerprint": _item_fingerprint(item),
+    }
+    if sha256:
+        source_map[item_id].update(sha256=stored_sha256, sourceSha256=sha256)
+    if previous_record.get("storedAs") == relative_path.as_posix():
+        # THE STORED FILE IS UNCHANGED, SO IS ITS OPTIMIZATION.
+        source_map[item_id].update(
+            {key: previous_record[key] for key in OPTIMIZE_RECORD_FIELDS if key in previous_record}
+        )
+
+    # SAVE INCREMENTALLY TO AVOID LOSING PROGRESS IF THE PROCESS STOPS: ONE JOURNAL LINE PER ITEM,
+    # FULL REWRITES ONLY WHEN THE JOURNAL IS COMPACTED.
+    journal: ItemJournal = session["journal"]
+    record = {"itemId": item_id, "imageAsset": item["imageAsset"], "source": source_map[item_id]}
+    shard_output: Optional[ShardOutput] = session.get("shard_output")
+    if shard_output is not None:
+        shard_output.add(record, previous_asset)
+    with _timed("save"):
+        if journal.append(record):
+            _compact_outputs(
+                journal,
+                session["dataset_path"],
+                dataset,
+                session["sources_path"],
+                source_map,
+                shard_output,
+                _take_stale_assets(session),
+            )
+
+    _log(f"[OK] {item_id} -> {relative_path.as_posix()} ({chosen.get('provider')})")
+    return status
+
+
+def _discard_item_result(result: Dict[str, Any]) -> None:
+    temp_path = result.pop("temp_path", None)
+    if temp_path is not None:
+        Path(temp_path).unlink(missing_ok=True)
+
+
+def _duplicate_of(session: Dict[str, Any], item_id: str, image_hash: Optional[int]) -> Optional[Tuple[str, int]]:
+    # ITEMS SHARING THE SAME MAIN WORD (E.G. ONE WORD ACROSS LEVELS) MAY REUSE A PICTURE.
+    index: Optional[PerceptualHashIndex] = session.get("hash_index")
+    if index is None or image_hash is None:
+        return None
+    item_words: Dict[str, str] = session["item_words"]
+    word = item_words.get(item_id, "")
+    for other_id, distance in index.find(image_hash, exclude=item_id):
+        if item_words.get(other_id) != word:
+            return other_id, distance
+    return None
+
+
+def _process_item_paced(item: Dict[str, Any], session: Dict[str, Any]) -> Dict[str, Any]:
+    with _timed("item"):
+        result = _process_item(item, session)
+    # EACH WORKER KEEPS ITS OWN PAUSE AFTER ITEMS THAT ASKED THE PROVIDERS, LIKE THE SEQUENTIAL LOOP.
+    sleep_seconds = session["args"].sleep
+    if sleep_seconds > 0 and result.get("searched"):
+        time.sleep(sleep_seconds)
+    return result
+
+
+def _optimize_image_file(
+    source: str,
+    destination: str,
+    max_size: int,
+    image_format: str,
+    quality: int,
+    force: bool,
+) -> Dict[str, Any]:
+    # RUNS IN A WORKER PROCESS: ONLY PLAIN VALUES GO IN AND OUT.
+    source_path = Path(source)
+    destination_path = Path(destination)
+    original_bytes = source_path.stat().st_size
+    with Image.open(source_path) as opened:
+        original_format = str(opened.format or "").upper()
+        original_width, original_height = opened.size
+        image = opened.convert("RGBA") if _image_has_alpha(opened) else opened.convert("RGB")
+
+    target_format = OPTIMIZE_FORMATS.get(image_format) or original_format or "JPEG"
+    resized = max(original_width, original_height) > max_size
+    if resized:
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    if target_format == "JPEG" and image.mode == "RGBA":
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    # NO exif/icc/pnginfo ARGUMENTS: THE RE-ENCODED FILE CARRIES NO METADATA.
+    save_options: Dict[str, Any] = {"format": target_format}
+    if target_format == "WEBP":
+        save_options.update(quality=quality, method=4)
+    elif target_format == "JPEG":
+        save_options.update(quality=quality, optimize=True, progressive=True)
+    elif target_format == "PNG":
+        save_options.update(optimize=True)
+
+    staging = destination_path.with_name(f".{destination_path.name}.part")
+    image.save(staging, **save_options)
+    optimized_bytes = staging.stat().st_size
+
+    result = {
+        "source": source,
+        "destination": destination,
+        "mime": OPTIMIZE_FORMAT_MIME.get(target_format, "image/jpeg"),
+        "originalWidth": original_width,
+        "originalHeight": original_height,
+        "originalBytes": original_bytes,
+        "width": image.size[0],
+        "height": image.size[1],
+        "bytes": optimized_bytes,
+        "kept": False,
+    }
+    if not force and not resized and optimized_bytes >= original_bytes:
+        # NOTHING GAINED (WHATEVER THE TARGET FORMAT): KEEP THE ORIGINAL FILE UNTOUCHED.
+        staging.unlink()
+        result.update(destination=source, kept=True, bytes=original_bytes, mime=_mime_for_format(original_format))
+        return result
+
+    os.replace(staging, destination_path)
+    return result
+
+
+def _image_has_alpha(image: Any) -> bool:
+    return image.mode in {"RGBA", "LA", "PA"} or (image.mode == "P" and "transparency" in image.info)
+
+
+def _mime_for_format(image_format: str) -> str:
+    return OPTIMIZE_FORMAT_MIME.get(image_format.upper(), "image/jpeg")
+
+
+def _optimize_assets(
+    root: Path,
+    items: List[Dict[str, Any]],
+    source_map: Dict[str, Dict[str, Any]],
+    args: argparse.Namespace,
+    all_items: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[Dict[str, int], List[str]]:
+    # RETURNS THE COUNTERS AND THE REPLACED ORIGINALS. THE CALLER DELETES THOSE ONLY AFTER SAVING
+    # THE DATASET AND THE SOURCES, SO A CRASH NEVER LEAVES ITEMS POINTING AT A DELETED FILE.
+    counters = {"optimized": 0, "kept": 0, "skipped": 0, "failed": 0, "savedBytes": 0}
+    stale_assets: List[str] = []
+    if Image is None:
+        _log("[ERROR] LA OPTIMIZACIÓN NECESITA PILLOW (pip install pillow)")
+        counters["failed"] = len(items)
+        return counters, stale_assets
+
+    image_format = args.optimize_format
+    if image_format == "webp" and not _pil_supports_webp():
+        _log("[WARN] PILLOW SIN SOPORTE WEBP. SE USA JPEG.")
+        image_format = "jpeg"
+
+    # ITEMS THAT SHARE ONE FILE ARE OPTIMIZED ONCE AND ALL OF THEM FOLLOW THE NEW PATH.
+    jobs: Dict[str, List[Dict[str, Any]]] = {}
+    for item in items:
+        item_id = str(item.get("id", "")).strip()
+        image_asset = str(item.get("imageAsset") or "").strip()
+        source = source_map.get(item_id)
+        if not image_asset or image_asset.lower().endswith(".svg") or not (root / image_asset).exists():
+            counters["skipped"] += 1
+            continue
+        if source is None:
+            _log(f"[SKIP] {item_id}: SIN REGISTRO DE FUENTE, NO SE OPTIMIZA")
+            counters["skipped"] += 1
+            continue
+        already_done = source.get("optimizedAt") and source.get("optimizedBytes") == (root / image_asset).stat().st_size
+        if already_done and not args.force_optimize:
+            counters["skipped"] += 1
+            continue
+        jobs.setdefault(image_asset, []).append(item)
+
+    if not jobs:
+        return counters, stale_assets
+
+    # A BLOB CAN BE SHARED WITH ITEMS OUTSIDE THE SELECTION: THEY MUST FOLLOW THE NEW PATH TOO.
+    for item in all_items or []:
+        image_asset = str(item.get("imageAsset") or "").strip()
+        if image_asset in jobs and all(item is not member for member in jobs[image_asset]):
+            jobs[image_asset].append(item)
+
+    extension = OPTIMIZE_FORMAT_EXT.get(image_format)
+    workers = max(1, args.optimize_workers or os.cpu_count() or 1)
+    _log(f"[OPTIMIZE] {len(jobs)} IMÁGENES CON {workers} PROCESOS ({image_format}, MÁX {args.optimize_max_size}px)")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        claimed: set = set()
+        for image_asset in sorted(jobs):
+            source_path = root / image_asset
+            destination = _optimize_destination(source_path, extension, claimed)
+            claimed.add(destination)
+            if args.dry_run:
+                _log(f"[DRY] OPTIMIZAR {image_asset} -> {destination.relative_to(root).as_posix()}")
+                continue
+            future = pool.submit(
+                _optimize_image_file,
+                str(source_path),
+                str(destination),
+                args.optimize_max_size,
+                image_format,
+                args.optimize_quality,
+                args.force_optimize,
+            )
+            futures[future] = image_asset
+
+        for future in as_completed(futures):
+            image_asset = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as err:
+                _log(f"[WARN] NO SE PUDO OPTIMIZAR {image_asset}: {err}")
+                counters["failed"] += 1
+                continue
+
+            destination_path = Path(outcome["destination"])
+            sha256 = _file_sha256(destination_path)
+            blob_path = destination_path.with_name(f"{sha256[:BLOB_NAME_LENGTH]}{destination_path.suffix}")
+            if not outcome["kept"] and _is_blob_path(destination_path) and blob_path != destination_path:
+                # RE-ENCODED BYTES GET THEIR OWN CONTENT NAME. THE SOURCE PATH ITSELF STAYS UNTIL SAVED.
+                in_place = destination_path == root / image_asset
+                if blob_path.exists():
+                    if not in_place:
+                        destination_path.unlink()
+                elif in_place:
+                    shutil.copyfile(destination_path, blob_path)
+                else:
+                    os.replace(destination_path, blob_path)
+                destination_path = blob_path
+            new_asset = destination_path.relative_to(root).as_posix()
+            optimized_at = dt.datetime.now(dt.timezone.utc).isoformat()
+            for item in jobs[image_asset]:
+                item["imageAsset"] = new_asset
+                record = source_map.get(str(item.get("id", "")).strip())
+                if record is None:
+                    continue
+                record.update(
+                    sha256=sha256,
+                    storedAs=new_asset,
+                    mime=outcome["mime"],
+                    originalWidth=record.get("originalWidth", outcome["originalWidth"]),
+                    originalHeight=record.get("originalHeight", outcome["originalHeight"]),
+                    originalBytes=record.get("originalBytes", outcome["originalBytes"]),
+                    optimizedWidth=outcome["width"],
+                    optimizedHeight=outcome["height"],
+                    optimizedBytes=outcome["bytes"],
+                    optimizedAt=optimized_at,
+                )
+            if new_asset != image_asset:
+                stale_assets.append(image_asset)
+
+            if outcome["kept"]:
+                counters["kept"] += 1
+            else:
+                counters["optimized"] += 1
+                counters["savedBytes"] += outcome["originalBytes"] - outcome["bytes"]
+                _log(
+                    f"[OPTIMIZED] {image_asset} -> {new_asset} "
+                    f"({outcome['originalBytes']} -> {outcome['bytes']} bytes)"
+                )
+
+    return counters, stale_assets
+
+
+def _optimize_destination(source_path: Path, extension: Optional[str], claimed: set) -> Path:
+    # foo.jpg AND foo.png WOULD BOTH BECOME foo.webp (AND SHARE ONE STAGING FILE IN PARALLEL WORKERS),
+    # AND AN EXISTING foo.webp BELONGS TO ANOTHER ITEM: NUMBER THE NAME UNTIL IT IS FREE.
+    destination = source_path.with_suffix(extension) if extension else source_path
+    if destination == source_path:
+        return destination
+    suffix = 2
+    while destination in claimed or destination.exists():
+        destination = source_path.with_name(f"{source_path.stem}-{suffix}{extension}")
+        suffix += 1
+    return destination
+
+
+def _remove_assets(root: Path, image_assets: Iterable[str]) -> None:
+    for image_asset in image_assets:
+        (root / image_asset).unlink(missing_ok=True)
+
+
+def _pil_supports_webp() -> bool:
+    try:
+        from PIL import features
+
+        return bool(features.check("webp"))
+    except Exception:
+        return False
+
+
+def _add_optimize_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--optimize-max-size", type=int, default=DEFAULT_OPTIMIZE_MAX_SIZE, help="LADO MAYOR EN PX")
+    parser.add_argument("--optimize-format", choices=sorted(OPTIMIZE_FORMATS), default=DEFAULT_OPTIMIZE_FORMAT)
+    parser.add_argument("--optimize-quality", type=int, default=DEFAULT_OPTIMIZE_QUALITY)
+    parser.add_argument("--optimize-workers", type=int, default=0, help="0 = UN PROCESO POR NÚCLEO")
+    parser.add_argument("--force-optimize", action="store_true", help="REPROCESA AUNQUE YA ESTÉ OPTIMIZADA")
+
+
+def _main_optimize(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sync_offline_images.py optimize",
+        description="RESIZE AND RE-ENCODE EXISTING OFFLINE IMAGE ASSETS",
+    )
+    parser.add_argument("--root", default="", help="RAÍZ DEL PROYECTO (POR DEFECTO, LA DE ESTE SCRIPT)")
+    parser.add_argument("--dataset", default="assets/data/lectoescritura_dataset.json")
+    parser.add_argument("--sources", default="assets/data/image_sources.json")
+    parser.add_argument("--level", action="append", type=int, default=[])
     parser.add_argument("--item-id", action="append", default=[])
-    parser.add_argument("--interactive", action="store_true")
-    parser.add_argument("--preview-candidates", type=int, default=5)
-    parser.add_argument("--auto-retry-candidates", type=int, default=6)
     parser.add_argument("--dry-run", action="store_true")
-    parser.add_argument("--sleep", type=float, default=0.15)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    _add_optimize_arguments(parser)
+    args = parser.parse_args(argv)
 
-    args = parser.parse_args()
-
-    root = Path(__file__).resolve().parents[1]
+    root = _project_root(args.root)
     dataset_path = root / args.dataset
     sources_path = root / args.sources
-
     if not dataset_path.exists():
         _log(f"[ERROR] DATASET NO ENCONTRADO: {dataset_path}")
         return 1
 
-    pexels_api_key = os.getenv("PEXELS_API_KEY", "").strip()
-    google_api_key = os.getenv("GOOGLE_CSE_API_KEY", "").strip()
-    google_cx = os.getenv("GOOGLE_CSE_CX", "").strip()
-
     dataset = _load_json(dataset_path)
     items = dataset.get("items")
     if not isinstance(items, list):
         _log("[ERROR] FORMATO DE DATASET INVÁLIDO: FALTA LISTA 'items'")
         return 1
-
     source_map = _load_sources(sources_path)
+    # ITEMS JOURNALED BY AN INTERRUPTED SYNC MUST BE IN PLACE BEFORE THEIR PATHS CAN CHANGE.
+    journal = ItemJournal(_journal_path(root, args.cache_dir, dataset_path))
+    _recover_journal(journal, dataset_path, dataset, sources_path, source_map, persist=not args.dry_run)
 
     target_item_ids = {value.strip() for value in args.item_id if value.strip()}
     target_levels = {int(value) for value in args.level if int(value) > 0}
-    providers = [token.strip() for token in args.providers.split(",") if token.strip()]
+    selected = [
+        item
+        for item in items
+        if (not target_item_ids or str(item.get("id", "")).strip() in target_item_ids)
+        and (not target_levels or int(item.get("level", 0) or 0) in target_levels)
+    ]
 
-    if any(provider.lower() == "pexels" for provider in providers) and not pexels_api_key:
-        _log("[INFO] PEXELS DESACTIVADO (FALTA PEXELS_API_KEY).")
-        providers = [provider for provider in providers if provider.lower() != "pexels"]
+    counters, stale_assets = _optimize_assets(root, selected, source_map, args, items)
+    if not args.dry_run and counters["optimized"] + counters["kept"]:
+        # SAVE FIRST: A CRASH MUST NEVER LEAVE ITEMS POINTING AT A DELETED ORIGINAL.
+        _save_json(dataset_path, dataset)
+        _save_sources(sources_path, source_map)
+        _remove_assets(root, stale_assets)
 
-    if any(provider.lower() == "google_cse" for provider in providers) and (not google_api_key or not google_cx):
-        _log("[INFO] GOOGLE_CSE DESACTIVADO (FALTA GOOGLE_CSE_API_KEY/GOOGLE_CSE_CX).")
-        providers = [provider for provider in providers if provider.lower() != "google_cse"]
+    _log("\nRESUMEN OPTIMIZACIÓN")
+    _log(f"- OPTIMIZADAS: {counters['optimized']}")
+    _log(f"- SIN MEJORA (SE MANTIENEN): {counters['kept']}")
+    _log(f"- OMITIDAS: {counters['skipped']}")
+    _log(f"- FALLIDAS: {counters['failed']}")
+    _log(f"- AHORRO: {counters['savedBytes'] / 1024:.1f} KB")
+    return 1 if counters["failed"] else 0
 
-    query_cache: Dict[str, List[Dict[str, Any]]] = {}
 
-    updated = 0
-    skipped = 0
-    failed = 0
+def _main_dedupe(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sync_offline_images.py dedupe",
+        description="POINT ITEMS WITH BYTE-IDENTICAL IMAGES AT ONE SHARED FILE AND DROP THE COPIES",
+    )
+    parser.add_argument("--root", default="", help="RAÍZ DEL PROYECTO (POR DEFECTO, LA DE ESTE SCRIPT)")
+    parser.add_argument("--dataset", default="assets/data/lectoescritura_dataset.json")
+    parser.add_argument("--sources", default="assets/data/image_sources.json")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args(argv)
+
+    root = _project_root(args.root)
+    dataset_path = root / args.dataset
+    sources_path = root / args.sources
+    if not dataset_path.exists():
+        _log(f"[ERROR] DATASET NO ENCONTRADO: {dataset_path}")
+        return 1
+
+    dataset = _load_json(dataset_path)
+    items = dataset.get("items")
+    if not isinstance(items, list):
+        _log("[ERROR] FORMATO DE DATASET INVÁLIDO: FALTA LISTA 'items'")
+        return 1
+    source_map = _load_sources(sources_path)
+    journal = ItemJournal(_journal_path(root, args.cache_dir, dataset_path))
+    _recover_journal(journal, dataset_path, dataset, sources_path, source_map, persist=not args.dry_run)
+
+    # THE FIRST FILE IN DATASET ORDER BECOMES THE SHARED COPY OF ITS CONTENT.
+    digests: Dict[str, str] = {}
+    canonical: Dict[str, str] = {}
+    for item in items:
+        image_asset = str(item.get("imageAsset") or "").strip()
+        if not image_asset or not (root / image_asset).is_file():
+            continue
+        if image_asset not in digests:
+            digests[image_asset] = _file_sha256(root / image_asset)
+        canonical.setdefault(digests[image_asset], image_asset)
+
+    repointed = 0
+    duplicates = set()
+    for item in items:
+        image_asset = str(item.get("imageAsset") or "").strip()
+        if image_asset not in digests:
+            continue
+        sha256 = digests[image_asset]
+        target = canonical[sha256]
+        record = source_map.get(str(item.get("id", "")).strip())
+        if record is not None and record.get("storedAs") == image_asset:
+            record.update(sha256=sha256, storedAs=target)
+            if not record.get("optimizedAt"):
+                record.setdefault("sourceSha256", sha256)
+        if target == image_asset:
+            continue
+        _log(f"[DEDUPE] {item.get('id')}: {image_asset} -> {target}")
+        item["imageAsset"] = target
+        duplicates.add(image_asset)
+        repointed += 1
+
+    saved_bytes = sum((root / image_asset).stat().st_size for image_asset in duplicates)
+    if not args.dry_run:
+        # SAVE FIRST: A CRASH MUST NEVER LEAVE ITEMS POINTING AT A DELETED COPY.
+        _save_json(dataset_path, dataset)
+        _save_sources(sources_path, source_map)
+        for image_asset in sorted(duplicates):
+            (root / image_asset).unlink(missing_ok=True)
+
+    _log("\nRESUMEN DEDUPLICACIÓN")
+    _log(f"- ÍTEMS REDIRIGIDOS: {repointed}")
+    _log(f"- COPIAS ELIMINADAS: {len(duplicates)}")
+    _log(f"- AHORRO: {saved_bytes / 1024:.1f} KB")
+    return 0
+
+
+def _main_arasaac_catalog(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sync_offline_images.py arasaac-catalog",
+        description="DOWNLOAD THE SPANISH ARASAAC CATALOG INTO A LOCAL KEYWORD INDEX FOR OFFLINE SEARCHES",
+    )
+    parser.add_argument("--root", default="", help="RAÍZ DEL PROYECTO (POR DEFECTO, LA DE ESTE SCRIPT)")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--output", default="", help=f"POR DEFECTO <cache-dir>/{ARASAAC_CATALOG_NAME}")
+    parser.add_argument(
+        "--input",
+        default="",
+        help="CONSTRUYE EL ÍNDICE DESDE UN JSON DEL CATÁLOGO YA DESCARGADO, SIN RED",
+    )
+    parser.add_argument(
+        "--max-age-hours",
+        type=float,
+        default=0.0,
+        help="NO DESCARGA SI EL ÍNDICE ACTUAL ES MÁS RECIENTE (0 = SIEMPRE)",
+    )
+    parser.add_argument("--timeout", type=float, default=ARASAAC_CATALOG_TIMEOUT)
+    args = parser.parse_args(argv)
+
+    root = _project_root(args.root)
+    output_path = Path(args.output) if args.output else _arasaac_catalog_path(root, args.cache_dir)
+    output_path = output_path if output_path.is_absolute() else root / output_path
+
+    if not args.input and args.max_age_hours > 0:
+        current = ArasaacCatalog.load(output_path)
+        if current is not None and current.age_hours() < args.max_age_hours:
+            _log(f"[SKIP] EL ÍNDICE TIENE {current.age_hours():.1f} HORAS: {output_path}")
+            return 0
+
+    if args.input:
+        try:
+            payload = Path(args.input).read_text(encoding="utf-8")
+        except OSError as err:
+            _log(f"[ERROR] NO SE PUDO LEER {args.input}: {err}")
+            return 1
+    else:
+        _log(f"[CATALOG] DESCARGANDO {PROVIDER_ENDPOINTS['arasaac_catalog']}")
+        try:
+            payload = _fetch_text("arasaac", PROVIDER_ENDPOINTS["arasaac_catalog"], timeout=args.timeout)
+        except (HTTPError, URLError, TimeoutError, OSError) as err:
+            _log(f"[ERROR] NO SE PUDO DESCARGAR EL CATÁLOGO DE ARASAAC: {err}")
+            return 1
+        finally:
+            global _HTTP_CLIENT
+            with _HTTP_CLIENT_LOCK:
+                http_client, _HTTP_CLIENT = _HTTP_CLIENT, None
+            if http_client is not None:
+                http_client.close()
 
     try:
-        for item in items:
-            item_id = str(item.get("id", "")).strip()
-            if not item_id:
-                skipped += 1
-                continue
+        entries = json.loads(payload or "[]")
+    except json.JSONDecodeError:
+        entries = None
+    if not isinstance(entries, list) or not entries:
+        _log("[ERROR] EL CATÁLOGO DE ARASAAC NO ES UNA LISTA DE PICTOGRAMAS")
+        return 1
 
-            if target_item_ids and item_id not in target_item_ids:
-                skipped += 1
-                continue
+    catalog = ArasaacCatalog.from_entries(entries)
+    catalog.save(output_path)
 
-            level_value = int(item.get("level", 0) or 0)
-            if target_levels and level_value not in target_levels:
-                skipped += 1
-                continue
+    _log("\nRESUMEN CATÁLOGO ARASAAC")
+    _log(f"- PICTOGRAMAS: {len(catalog.keywords)}")
+    _log(f"- PALABRAS INDEXADAS: {len(catalog.index)}")
+    _log(f"- ÍNDICE: {output_path} ({output_path.stat().st_size / 1024:.1f} KB)")
+    return 0
 
-            if not _should_process_item(item, root, args.refresh_existing, args.replace_svg):
-                skipped += 1
-                continue
 
-            queries = _build_query_variants(item)
-            category = str(item.get("category", "GENERAL"))
-            category_slug = _slug(category)
+def _main_rescore(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sync_offline_images.py rescore",
+        description="RE-RANK THE CANDIDATES OF THE LOCAL CORPUS FOR MANY ITEMS AT ONCE, E.G. TO TRY OTHER WEIGHTS",
+    )
+    parser.add_argument("--root", default="", help="RAÍZ DEL PROYECTO (POR DEFECTO, LA DE ESTE SCRIPT)")
+    parser.add_argument("--dataset", default="assets/data/lectoescritura_dataset.json")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--providers", default="arasaac,pexels,openverse,wikimedia,google_cse")
+    parser.add_argument("--level", action="append", type=int, default=[])
+    parser.add_argument("--item-id", action="append", default=[])
+    parser.add_argument("--min-width", type=int, default=DEFAULT_MIN_WIDTH)
+    parser.add_argument("--min-height", type=int, default=DEFAULT_MIN_HEIGHT)
+    parser.add_argument(
+        "--scoring-weights",
+        default="",
+        metavar="JSON",
+        help="PESOS A COMPARAR CON LOS ACTUALES (SIN ÉL SOLO SE PUNTÚA CON LOS ACTUALES)",
+    )
+    parser.add_argument("--output", default="", help="INFORME JSON CON EL MEJOR CANDIDATO DE CADA ÍTEM")
+    parser.add_argument(
+        "--verify",
+        action="store_true",
+        help="COMPRUEBA QUE LOS PESOS ACTUALES DAN LO MISMO QUE _score_candidate",
+    )
+    args = parser.parse_args(argv)
 
-            _log(f"[SEARCH] {item_id} -> {queries[0] if queries else item_id}")
+    root = _project_root(args.root)
+    dataset_path = root / args.dataset
+    store_path = root / args.cache_dir / CANDIDATE_STORE_NAME
+    if np is None:
+        _log("[ERROR] rescore NECESITA NUMPY (pip install numpy)")
+        return 1
+    if not dataset_path.exists():
+        _log(f"[ERROR] DATASET NO ENCONTRADO: {dataset_path}")
+        return 1
+    if not store_path.exists():
+        _log(f"[ERROR] NO HAY ÍNDICE DE CANDIDATOS EN {store_path} (SE LLENA AL SINCRONIZAR)")
+        return 1
+    weights: Optional[Dict[str, float]] = None
+    if args.scoring_weights:
+        try:
+            weights = _load_scoring_weights(Path(args.scoring_weights))
+        except (OSError, ValueError) as err:
+            _log(f"[ERROR] --scoring-weights: {err}")
+            return 1
 
-            scored_candidates: List[Dict[str, Any]] = []
-            seen_urls = set()
-            for query in queries:
-                cache_key = (
-                    f"{query}|{','.join(providers)}|{args.per_provider_limit}|"
-                    f"{pexels_api_key != ''}|{google_api_key != ''}|{google_cx != ''}"
-                )
-                if cache_key in query_cache:
-                    query_candidates = query_cache[cache_key]
-                else:
-                    query_candidates = list(
-                        _iter_candidates(
-                            providers=providers,
-                            query=query,
-                            pexels_api_key=pexels_api_key,
-                            google_api_key=google_api_key,
-                            google_cx=google_cx,
-                            per_provider_limit=args.per_provider_limit,
-                        )
-                    )
-                    query_cache[cache_key] = query_candidates
+    dataset = _load_json(dataset_path)
+    items = dataset.get("items")
+    if not isinstance(items, list):
+        _log("[ERROR] FORMATO DE DATASET INVÁLIDO: FALTA LISTA 'items'")
+        return 1
+    target_item_ids = {value.strip() for value in args.item_id if value.strip()}
+    target_levels = {int(value) for value in args.level if int(value) > 0}
+    providers = [token.strip() for token in args.providers.split(",") if token.strip()]
 
-                for candidate in query_candidates:
-                    image_url = str(candidate.get("image_url", "")).strip()
+    # ONE ROW PER (ITEM, CANDIDATE), IN THE ORDER A SYNC WOULD SEE THEM, SO TIES BREAK THE SAME WAY.
+    triples: List[Tuple[Candidate, ItemContext, str]] = []
+    owners: List[str] = []
+    try:
+        candidate_store = CandidateStore(store_path)
+    except sqlite3.OperationalError as err:
+        _log(f"[ERROR] NO SE PUEDE ABRIR EL ÍNDICE DE CANDIDATOS (¿SQLITE SIN FTS5?): {err}")
+        return 1
+    try:
+        for item in items:
+            item_id = str(item.get("id", "")).strip()
+            if not item_id or (target_item_ids and item_id not in target_item_ids):
+                continue
+            if target_levels and int(item.get("level", 0) or 0) not in target_levels:
+                continue
+            context = ItemContext(item)
+            seen_urls = set()
+            for query in _build_query_variants(item):
+                for raw_candidate in candidate_store.search(query, providers):
+                    image_url = str(raw_candidate.get("image_url", "")).strip()
                     if not image_url or image_url in seen_urls:
                         continue
                     seen_urls.add(image_url)
-
                     if not _candidate_is_valid(
-                        candidate,
+                        raw_candidate,
                         min_width=args.min_width,
                         min_height=args.min_height,
-                        require_free_license=args.require_free_license,
-                        accept_google_rights_filter=args.accept_google_rights_filter,
+                        require_free_license=True,
+                        accept_google_rights_filter=True,
                     ):
                         continue
-                    candidate["_query"] = query
-                    candidate["_score"] = _score_candidate(candidate, item, query)
-                    scored_candidates.append(candidate)
+                    triples.append((Candidate(raw_candidate, query), context, query))
+                    owners.append(item_id)
+    finally:
+        candidate_store.close()
+
+    baseline = BatchScorer()
+    started = time.perf_counter()
+    matrix = baseline.features(triples)
+    features_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    baseline_scores = baseline.score_matrix(matrix).tolist()
+    weighted_scores = BatchScorer(weights).score_matrix(matrix).tolist() if weights else baseline_scores
+    score_seconds = time.perf_counter() - started
+
+    mismatches = 0
+    if args.verify:
+        for (candidate, context, query), value in zip(triples, baseline_scores):
+            if _score_candidate(candidate, context, query) != value:
+                mismatches += 1
+                _log(f"[ERROR] PUNTUACIÓN DISTINTA: {candidate.get('image_url')}")
+
+    # BEST CLEAN CANDIDATE PER ITEM; A STRICTLY HIGHER SCORE IS NEEDED TO REPLACE AN EARLIER ROW.
+    best: Dict[str, Dict[str, Tuple[float, int]]] = {}
+    for row, ((candidate, context, _), item_id) in enumerate(zip(triples, owners)):
+        if _candidate_metadata_is_bad(context, candidate):
+            continue
+        picks = best.setdefault(item_id, {})
+        for name, scores in (("baseline", baseline_scores), ("weighted", weighted_scores)):
+            if name not in picks or scores[row] > picks[name][0]:
+                picks[name] = (scores[row], row)
+
+    report_items = []
+    changed = 0
+    for item_id, picks in best.items():
+        baseline_row = picks["baseline"][1]
+        weighted_row = picks["weighted"][1]
+        if baseline_row != weighted_row:
+            changed += 1
+            _log(
+                f"[RANK] {item_id}: {triples[baseline_row][0].get('title', '')} -> "
+                f"{triples[weighted_row][0].get('title', '')}"
+            )
+        report_items.append(
+            {
+                "itemId": item_id,
+                "baseline": {"imageUrl": triples[baseline_row][0]["image_url"], "score": picks["baseline"][0]},
+                "weighted": {"imageUrl": triples[weighted_row][0]["image_url"], "score": picks["weighted"][0]},
+                "changed": baseline_row != weighted_row,
+            }
+        )
+
+    if args.output:
+        output_path = Path(args.output)
+        output_path = output_path if output_path.is_absolute() else root / output_path
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        payload = {
+            "generatedAt": dt.datetime.now(dt.timezone.utc).isoformat(),
+            "weights": BatchScorer(weights).weights,
+            "candidates": len(triples),
+            "items": report_items,
+        }
+        _atomic_write_text(output_path, json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+
+    _log("\nRESUMEN REPUNTUACIÓN")
+    _log(f"- ÍTEMS CON CANDIDATOS: {len(best)}")
+    _log(f"- CANDIDATOS PUNTUADOS: {len(triples)}")
+    _log(f"- MEJOR CANDIDATO DISTINTO CON LOS NUEVOS PESOS: {changed}")
+    _log(f"- TIEMPOS: CARACTERÍSTICAS {features_seconds * 1000:.1f}ms, PUNTUACIÓN {score_seconds * 1000:.2f}ms")
+    if args.verify:
+        _log(f"- DIFERENCIAS CON _score_candidate: {mismatches}")
+    if args.output:
+        _log(f"- INFORME: {output_path}")
+    return 1 if mismatches else 0
+
+
+def _shard_record_conflict(
+    record: Dict[str, Any],
+    item: Optional[Dict[str, Any]],
+    shard: Tuple[int, int],
+    root: Path,
+) -> str:
+    item_id = str(record.get("itemId", ""))
+    if item is None:
+        return "EL ÍTEM YA NO EXISTE EN EL DATASET"
+    if _item_shard(item_id, shard[1]) != shard[0]:
+        return f"NO PERTENECE AL SHARD {shard[0]}/{shard[1]}"
+    current_asset = str(item.get("imageAsset") or "")
+    if current_asset != str(record.get("baseImageAsset") or ""):
+        return f"SU IMAGEN CAMBIÓ DESDE QUE EMPEZÓ EL SHARD ({record.get('baseImageAsset') or '-'} -> {current_asset})"
+    source = record.get("source") if isinstance(record.get("source"), dict) else {}
+    if source.get("fingerprint") and source["fingerprint"] != _item_fingerprint(item):
+        return "CAMBIÓ LA PALABRA O LA CATEGORÍA DESDE QUE EMPEZÓ EL SHARD"
+    image_asset = str(record.get("imageAsset") or "")
+    if not image_asset or not (root / image_asset).is_file():
+        return f"FALTA EL ARCHIVO {image_asset or '-'} (COPIA TAMBIÉN assets/images DEL SHARD)"
+    if source.get("sha256") and _file_sha256(root / image_asset) != source["sha256"]:
+        return f"EL ARCHIVO {image_asset} NO COINCIDE CON SU SHA-256"
+    return ""
+
+
+def _main_merge(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="sync_offline_images.py merge",
+        description="APPLY THE PARTIAL OUTPUTS OF --shard RUNS TO THE DATASET AND SOURCES FILES",
+    )
+    parser.add_argument("--root", default="", help="RAÍZ DEL PROYECTO (POR DEFECTO, LA DE ESTE SCRIPT)")
+    parser.add_argument("partials", nargs="*", help="SALIDAS PARCIALES (POR DEFECTO, TODAS LAS DE <cache-dir>/shards)")
+    parser.add_argument("--dataset", default="assets/data/lectoescritura_dataset.json")
+    parser.add_argument("--sources", default="assets/data/image_sources.json")
+    parser.add_argument("--hashes", default="", help=f"ÍNDICE dHASH (POR DEFECTO <cache-dir>/{HASH_INDEX_NAME})")
+    parser.add_argument("--duplicate-distance", type=int, default=DEFAULT_DUPLICATE_DISTANCE)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--skip-conflicts",
+        action="store_true",
+        help="APLICA LOS ÍTEMS SIN CONFLICTO Y DEJA FUERA EL RESTO (POR DEFECTO NO SE APLICA NADA)",
+    )
+    parser.add_argument("--keep-partials", action="store_true", help="NO BORRA LAS SALIDAS PARCIALES APLICADAS")
+    args = parser.parse_args(argv)
+
+    root = _project_root(args.root)
+    dataset_path = root / args.dataset
+    sources_path = root / args.sources
+    if not dataset_path.exists():
+        _log(f"[ERROR] DATASET NO ENCONTRADO: {dataset_path}")
+        return 1
+
+    dataset = _load_json(dataset_path)
+    items = dataset.get("items")
+    if not isinstance(items, list):
+        _log("[ERROR] FORMATO DE DATASET INVÁLIDO: FALTA LISTA 'items'")
+        return 1
+    source_map = _load_sources(sources_path)
+    journal = ItemJournal(_journal_path(root, args.cache_dir, dataset_path))
+    _recover_journal(journal, dataset_path, dataset, sources_path, source_map, persist=not args.dry_run)
 
-            if not scored_candidates:
-                _log(f"[MISS] SIN CANDIDATOS VÁLIDOS PARA {item_id}")
-                failed += 1
+    partial_paths = [Path(value).resolve() for value in args.partials] or sorted(
+        _shard_output_dir(root, args.cache_dir).glob(f"{_slug(dataset_path.stem)}.shard-*.json")
+    )
+    if not partial_paths:
+        _log(f"[ERROR] NO HAY SALIDAS PARCIALES EN {_shard_output_dir(root, args.cache_dir)}")
+        return 1
+
+    items_by_id = {str(item.get("id", "")).strip(): item for item in items if isinstance(item, dict)}
+    accepted: Dict[str, Dict[str, Any]] = {}
+    first_records: Dict[str, Dict[str, Any]] = {}
+    origins: Dict[str, Path] = {}
+    conflicts: Dict[str, List[str]] = {}
+    conflicted_paths = set()
+    already_applied = 0
+    shard_counts = set()
+    seen_shards = set()
+
+    def conflict(item_id: str, path: Path, reason: str) -> None:
+        conflicts.setdefault(item_id, []).append(f"{path.name}: {reason}")
+        conflicted_paths.add(path)
+
+    for path in partial_paths:
+        payload = _load_json(path) if path.exists() else {}
+        shard = (int(payload.get("shard") or 0), int(payload.get("shardCount") or 0))
+        if payload.get("dataset") != dataset_path.name or not 1 <= shard[0] <= shard[1]:
+            _log(f"[ERROR] {path} NO ES UNA SALIDA PARCIAL DE {dataset_path.name}")
+            return 1
+        shard_counts.add(shard[1])
+        seen_shards.add(shard[0])
+        for record in payload.get("items", []):
+            if not isinstance(record, dict) or not record.get("itemId"):
+                continue
+            item_id = str(record["itemId"])
+            item = items_by_id.get(item_id)
+            source = record.get("source") if isinstance(record.get("source"), dict) else {}
+            if item_id in origins:
+                # THE SAME ITEM FROM TWO PARTIAL OUTPUTS IS ONLY FINE WHEN BOTH AGREE.
+                if first_records[item_id].get("imageAsset") != record.get("imageAsset"):
+                    conflict(item_id, path, f"TAMBIÉN LO TRAE {origins[item_id].name} CON OTRA IMAGEN")
+                    conflicted_paths.add(origins[item_id])
+                    accepted.pop(item_id, None)
                 continue
+            origins[item_id] = path
+            first_records[item_id] = record
+            if (
+                item is not None
+                and str(item.get("imageAsset") or "") == record.get("imageAsset")
+                and source_map.get(item_id) == source
+            ):
+                already_applied += 1
+                continue
+            reason = _shard_record_conflict(record, item, shard, root)
+            if reason:
+                conflict(item_id, path, reason)
+                continue
+            accepted[item_id] = record
 
-            scored_candidates.sort(key=lambda value: float(value.get("_score", 0)), reverse=True)
-            filtered_candidates = [
-                candidate
-                for candidate in scored_candidates
-                if not _candidate_metadata_is_bad(item, candidate)
-            ]
+    if len(shard_counts) > 1:
+        _log(f"[ERROR] LAS SALIDAS PARCIALES SON DE REPARTOS DISTINTOS: {sorted(shard_counts)} SHARDS")
+        return 1
+    shard_count = next(iter(shard_counts))
+    missing = sorted(set(range(1, shard_count + 1)) - seen_shards)
+    if missing:
+        _log(f"[WARN] FALTAN LOS SHARDS {', '.join(str(index) for index in missing)} DE {shard_count}")
+
+    for item_id in sorted(conflicts):
+        for reason in conflicts[item_id]:
+            _log(f"[CONFLICT] {item_id}: {reason}")
+    if conflicts and not args.skip_conflicts:
+        _log(f"[ERROR] {len(conflicts)} ÍTEMS EN CONFLICTO: NO SE APLICA NADA (--skip-conflicts APLICA EL RESTO)")
+        return 1
 
-            if not filtered_candidates:
-                _log(f"[MISS] {item_id}: SOLO HUBO CANDIDATOS SOSPECHOSOS, SE REINTENTARÁ MÁS TARDE")
-                failed += 1
+    asset_refs = Counter(str(item.get("imageAsset") or "") for item in items if isinstance(item, dict))
+    orphaned = set()
+    merged_items: List[Dict[str, Any]] = []
+    for item in items:
+        record = accepted.get(str(item.get("id", "")).strip()) if isinstance(item, dict) else None
+        if record is None:
+            continue
+        item_id = str(record["itemId"])
+        previous_asset = str(item.get("imageAsset") or "")
+        previous_record = source_map.get(item_id) or {}
+        item["imageAsset"] = record["imageAsset"]
+        source_map[item_id] = record["source"]
+        asset_refs[record["imageAsset"]] += 1
+        asset_refs[previous_asset] -= 1
+        if previous_asset and previous_asset != record["imageAsset"] and previous_asset == previous_record.get("storedAs"):
+            orphaned.add(previous_asset)
+        merged_items.append(item)
+        _log(f"[MERGE] {item_id} -> {record['imageAsset']} ({origins[item_id].name})")
+    # SAME RULE AS A NORMAL SYNC: A FILE THIS SCRIPT STORED GOES ONCE NO ITEM POINTS AT IT.
+    orphaned = {image_asset for image_asset in orphaned if asset_refs[image_asset] <= 0 and (root / image_asset).is_file()}
+    _backfill_fingerprints(items, source_map)
+
+    if not args.dry_run and merged_items:
+        # SAVE FIRST: A CRASH MUST NEVER LEAVE ITEMS POINTING AT A DELETED FILE.
+        _save_json(dataset_path, dataset)
+        _save_sources(sources_path, source_map)
+        for image_asset in sorted(orphaned):
+            (root / image_asset).unlink(missing_ok=True)
+
+    if merged_items and Image is not None:
+        hash_index = PerceptualHashIndex.load(_hash_index_path(root, args), args.duplicate_distance)
+        _backfill_image_hashes(hash_index, root, merged_items)
+        item_words = {item_id: _normalized_text(_item_main_word(item)) for item_id, item in items_by_id.items()}
+        # SHARDS CANNOT SEE EACH OTHER'S DOWNLOADS, SO REPEATS ACROSS SHARDS ONLY SHOW UP HERE.
+        for item in merged_items:
+            item_id = str(item.get("id", "")).strip()
+            entry = hash_index.entries.get(item_id)
+            if entry is None:
                 continue
+            for other_id, distance in hash_index.find(entry["hash"], exclude=item_id):
+                if item_words.get(other_id) != item_words.get(item_id):
+                    _log(f"[WARN] {item_id} REPITE LA IMAGEN DE {other_id} (DISTANCIA {distance})")
+                    break
+        if not args.dry_run:
+            hash_index.save(_hash_index_path(root, args))
+
+    if not args.dry_run and not args.keep_partials:
+        for path in partial_paths:
+            if path not in conflicted_paths:
+                path.unlink(missing_ok=True)
+
+    _log("\nRESUMEN MERGE")
+    _log(f"- SALIDAS PARCIALES: {len(partial_paths)}")
+    _log(f"- ÍTEMS APLICADOS: {len(merged_items)}")
+    _log(f"- YA APLICADOS ANTES: {already_applied}")
+    _log(f"- EN CONFLICTO: {len(conflicts)}")
+    _log(f"- ARCHIVOS ANTERIORES ELIMINADOS: {0 if args.dry_run else len(orphaned)}")
+    return 0
 
-            scored_candidates = filtered_candidates
 
-            chosen = scored_candidates[0]
-            chosen_query = str(chosen.get("_query", ""))
+def main(argv: Optional[List[str]] = None) -> int:
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv and argv[0] in SUBCOMMANDS:
+        return SUBCOMMANDS[argv[0]](argv[1:])
+    return _main_sync(argv)
 
-            if args.interactive:
-                preview_count = max(1, min(args.preview_candidates, len(scored_candidates)))
-                _log(f"[REVIEW] TOP {preview_count} CANDIDATOS PARA {item_id}:")
-                for idx, cand in enumerate(scored_candidates[:preview_count], start=1):
-                    _log(
-                        f"  {idx}) SCORE={cand.get('_score'):.2f} | {cand.get('provider')} | "
-                        f"LIC={cand.get('license')} | {cand.get('title')}"
-                    )
-                    _log(f"     {cand.get('image_url')}")
-                choice = input("ELIGE NÚMERO (ENTER=1, 0=OMITIR): ").strip()
-                if choice == "0":
-                    _log(f"[SKIP] OMITIDO POR USUARIO: {item_id}")
-                    skipped += 1
-                    continue
-                if choice:
-                    try:
-                        selected_index = int(choice) - 1
-                        if 0 <= selected_index < preview_count:
-                            chosen = scored_candidates[selected_index]
-                            chosen_query = str(chosen.get("_query", ""))
-                    except ValueError:
-                        pass
-
-            mime = chosen.get("mime") or _infer_mime_from_url(chosen.get("image_url", "")) or "image/jpeg"
-            ext = _mime_to_ext(mime)
-            file_name = f"{_slug(item_id)}{ext}"
-
-            relative_path = Path("assets") / "images" / category_slug / file_name
-            absolute_path = root / relative_path
 
-            if args.dry_run:
-                _log(f"[DRY] {item_id} -> {relative_path.as_posix()} ({chosen.get('provider')})")
-                updated += 1
-            else:
-                selected_content: Optional[bytes] = None
-                retry_pool = scored_candidates[: max(1, args.auto_retry_candidates)]
-                download_error: Optional[str] = None
-
-                for ranked_candidate in retry_pool:
-                    try:
-                        content = _download_binary(ranked_candidate["image_url"])
-                    except (HTTPError, URLError, TimeoutError, OSError) as err:
-                        download_error = str(err)
-                        continue
+def _project_root(value: str) -> Path:
+    return Path(value).resolve() if value else Path(__file__).resolve().parents[1]
 
-                    if len(content) > args.max_bytes:
-                        download_error = f"IMAGEN DEMASIADO GRANDE ({len(content)} bytes)"
-                        continue
 
-                    if (
-                        str(ranked_candidate.get("provider", "")).strip().lower() != "arasaac"
-                        and _looks_like_text_document(content)
-                    ):
-                        _log(
-                            f"[RETRY] {item_id} DESCARTADA POR PARECER DOCUMENTO/TEXTO: "
-                            f"{ranked_candidate.get('title', '')}"
-                        )
-                        continue
+def _hash_index_path(root: Path, args: argparse.Namespace) -> Path:
+    return root / (args.hashes or Path(args.cache_dir) / HASH_INDEX_NAME)
 
-                    chosen = ranked_candidate
-                    chosen_query = str(chosen.get("_query", ""))
-                    mime = chosen.get("mime") or _infer_mime_from_url(chosen.get("image_url", "")) or "image/jpeg"
-                    ext = _mime_to_ext(mime)
-                    file_name = f"{_slug(item_id)}{ext}"
-                    relative_path = Path("assets") / "images" / category_slug / file_name
-                    absolute_path = root / relative_path
-                    selected_content = content
-                    break
 
-                if selected_content is None:
-                    _log(f"[ERROR] {item_id}: NO SE ENCONTRÓ UNA IMAGEN VÁLIDA. {download_error or ''}".strip())
-                    failed += 1
-                    continue
+def _main_sync(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="SYNC ONLINE IMAGES INTO OFFLINE DATASET ASSETS")
+    parser.add_argument("--root", default="", help="RAÍZ DEL PROYECTO (POR DEFECTO, LA DE ESTE SCRIPT)")
+    parser.add_argument("--dataset", default="assets/data/lectoescritura_dataset.json")
+    parser.add_argument("--sources", default="assets/data/image_sources.json")
+    parser.add_argument("--hashes", default="", help=f"ÍNDICE dHASH (POR DEFECTO <cache-dir>/{HASH_INDEX_NAME})")
+    parser.add_argument(
+        "--duplicate-distance",
+        type=int,
+        default=DEFAULT_DUPLICATE_DISTANCE,
+        help="BITS DE DIFERENCIA (DE 64) POR DEBAJO DE LOS QUE DOS IMÁGENES SE CONSIDERAN IGUALES",
+    )
+    parser.add_argument(
+        "--allow-duplicate-images",
+        action="store_true",
+        help="NO RECHAZA IMÁGENES REPETIDAS ENTRE ÍTEMS DISTINTOS",
+    )
+    parser.add_argument(
+        "--providers",
+        default="arasaac,pexels,openverse,wikimedia,google_cse",
+        help="ORDERED LIST: arasaac,pexels,openverse,wikimedia,google_cse",
+    )
+    parser.add_argument("--per-provider-limit", type=int, default=10)
+    parser.add_argument("--min-width", type=int, default=DEFAULT_MIN_WIDTH)
+    parser.add_argument("--min-height", type=int, default=DEFAULT_MIN_HEIGHT)
+    parser.add_argument("--max-bytes", type=int, default=DEFAULT_MAX_BYTES)
+    parser.add_argument("--refresh-existing", action="store_true")
+    parser.add_argument("--replace-svg", action="store_true", default=True)
+    parser.add_argument("--no-replace-svg", dest="replace_svg", action="store_false")
+    parser.add_argument("--require-free-license", action="store_true", default=True)
+    parser.add_argument("--allow-any-license", dest="require_free_license", action="store_false")
+    parser.add_argument("--accept-google-rights-filter", action="store_true", default=True)
+    parser.add_argument("--strict-google-license", dest="accept_google_rights_filter", action="store_false")
+    parser.add_argument("--limit", type=int, default=0, help="0 = SIN LÍMITE")
+    parser.add_argument("--level", action="append", type=int, default=[])
+    parser.add_argument("--item-id", action="append", default=[])
+    parser.add_argument("--interactive", action="store_true")
+    parser.add_argument("--preview-candidates", type=int, default=5)
+    parser.add_argument("--auto-retry-candidates", type=int, default=6)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument(
+        "--sleep",
+        type=float,
+        default=0.0,
+        help="PAUSA ENTRE ÍTEMS; EL RITMO DE LAS APIS LO MARCA --rate-limit",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        action="append",
+        default=[],
+        metavar="PROVEEDOR=RPS[:RÁFAGA]",
+        help="PETICIONES/S Y RÁFAGA POR PROVEEDOR (P. EJ. pexels=0.5:2; 0 = SIN LÍMITE PROPIO)",
+    )
+    parser.add_argument(
+        "--breaker-failures",
+        type=int,
+        default=DEFAULT_BREAKER_FAILURES,
+        help="FALLOS (O RESPUESTAS LENTAS) SEGUIDOS PARA PAUSAR UN PROVEEDOR",
+    )
+    parser.add_argument("--breaker-slow-seconds", type=float, default=DEFAULT_BREAKER_SLOW_SECONDS)
+    parser.add_argument(
+        "--breaker-cooldown",
+        type=float,
+        default=DEFAULT_BREAKER_COOLDOWN,
+        help="SEGUNDOS DE PAUSA ANTES DE VOLVER A PROBAR EL PROVEEDOR",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="ÍTEMS PROCESADOS EN PARALELO (BÚSQUEDA + DESCARGA). 1 = SECUENCIAL",
+    )
+    parser.add_argument(
+        "--parallel-providers",
+        action="store_true",
+        help="CONSULTA TODOS LOS PROVEEDORES Y VARIANTES DE UN ÍTEM A LA VEZ",
+    )
+    parser.add_argument(
+        "--provider-concurrency",
+        type=int,
+        default=DEFAULT_PROVIDER_CONCURRENCY,
+        help="PETICIONES SIMULTÁNEAS MÁXIMAS POR PROVEEDOR CON --parallel-providers",
+    )
+    parser.add_argument("--http-pool-size", type=int, default=DEFAULT_HTTP_POOL_SIZE, help="CONEXIONES POR HOST")
+    parser.add_argument("--timeout", type=float, default=DEFAULT_TIMEOUT, help="SEGUNDOS DE LECTURA POR PETICIÓN")
+    parser.add_argument("--connect-timeout", type=float, default=DEFAULT_CONNECT_TIMEOUT)
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--cache-ttl-hours", type=float, default=DEFAULT_CACHE_TTL_HOURS)
+    parser.add_argument("--cache-max-mb", type=float, default=DEFAULT_CACHE_MAX_MB)
+    parser.add_argument("--no-cache", action="store_true", help="NO LEE NI GUARDA RESPUESTAS EN CACHÉ")
+    parser.add_argument(
+        "--cache-only",
+        action="store_true",
+        help="SOLO RESPUESTAS EN CACHÉ: NINGUNA BÚSQUEDA SALE A LA RED",
+    )
+    parser.add_argument(
+        "--journal-compact-every",
+        type=int,
+        default=DEFAULT_JOURNAL_COMPACT_EVERY,
+        help="ÍTEMS ENTRE REESCRITURAS COMPLETAS DEL DATASET (EL DIARIO GUARDA CADA ÍTEM AL MOMENTO)",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="CONTINÚA LA EJECUCIÓN ANTERIOR: OMITE LO YA HECHO Y LOS FALLOS AÚN EN ESPERA",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="SOLO PROCESA LA COLA DE FALLOS CUYA ESPERA YA VENCIÓ",
+    )
+    parser.add_argument("--retry-backoff-minutes", type=float, default=DEFAULT_RETRY_BACKOFF_MINUTES)
+    parser.add_argument("--retry-backoff-max-hours", type=float, default=DEFAULT_RETRY_BACKOFF_MAX_HOURS)
+    parser.add_argument(
+        "--report",
+        default="",
+        help=f"INFORME JSON DE LA EJECUCIÓN (POR DEFECTO <cache-dir>/{DEFAULT_REPORT_NAME})",
+    )
+    parser.add_argument("--prometheus", default="", help="ESCRIBE TAMBIÉN LAS MÉTRICAS EN FORMATO TEXTO DE PROMETHEUS")
+    parser.add_argument(
+        "--plan",
+        action="store_true",
+        help="MUESTRA LAS PETICIONES POR PROVEEDOR QUE HARÍA LA EJECUCIÓN, SIN TOCAR LA RED NI LOS ARCHIVOS",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="LANZA TODAS LAS BÚSQUEDAS (SIN REPETIDAS) EN UN LOTE ANTES DE PUNTUAR",
+    )
+    parser.add_argument(
+        "--arasaac-catalog",
+        default="",
+        help=f"ÍNDICE LOCAL DE ARASAAC (POR DEFECTO <cache-dir>/{ARASAAC_CATALOG_NAME}; SE CREA CON arasaac-catalog)",
+    )
+    parser.add_argument(
+        "--no-arasaac-catalog",
+        action="store_true",
+        help="BUSCA EN LA API DE ARASAAC AUNQUE EXISTA EL ÍNDICE LOCAL",
+    )
+    parser.add_argument(
+        "--scoring-weights",
+        default="",
+        metavar="JSON",
+        help="PESOS DE PUNTUACIÓN {CARACTERÍSTICA: PESO} PARA EL PUNTUADOR POR LOTES (NECESITA NUMPY)",
+    )
+    parser.add_argument(
+        "--probe",
+        action="store_true",
+        help="LEE SOLO LA CABECERA (HTTP Range) DE LOS MEJORES CANDIDATOS PARA FILTRAR Y ORDENAR POR SU TAMAÑO REAL",
+    )
+    parser.add_argument(
+        "--search-local",
+        action="store_true",
+        help="PUNTÚA PRIMERO LOS CANDIDATOS YA VISTOS (ÍNDICE LOCAL) Y SOLO BUSCA EN LA RED SI NINGUNO LLEGA AL UMBRAL",
+    )
+    parser.add_argument(
+        "--local-threshold",
+        type=float,
+        default=DEFAULT_CONFIDENCE_THRESHOLD,
+        help="PUNTUACIÓN MÍNIMA DE UN CANDIDATO LOCAL PARA NO SALIR A LA RED CON --search-local",
+    )
+    parser.add_argument(
+        "--no-candidate-store",
+        action="store_true",
+        help=f"NO GUARDA LOS CANDIDATOS VISTOS EN <cache-dir>/{CANDIDATE_STORE_NAME}",
+    )
+    parser.add_argument(
+        "--early-exit",
+        action="store_true",
+        help="BUSCA VARIANTE A VARIANTE Y PARA AL ENCONTRAR UN CANDIDATO FIABLE (SIN EFECTO CON --interactive)",
+    )
+    parser.add_argument(
+        "--confidence-threshold",
+        type=float,
+        default=DEFAULT_CONFIDENCE_THRESHOLD,
+        help="PUNTUACIÓN MÍNIMA DE UN CANDIDATO PARA DEJAR DE BUSCAR CON --early-exit",
+    )
+    parser.add_argument(
+        "--shard",
+        default="",
+        metavar="K/N",
+        help="PROCESA SOLO LA PARTE K DE N (REPARTO ESTABLE POR ID) Y GUARDA UNA SALIDA PARCIAL PARA merge",
+    )
+
+    _add_optimize_arguments(parser)
+    parser.add_argument("--optimize", action="store_true", help="OPTIMIZA LAS IMÁGENES NUEVAS AL TERMINAR")
+
+    args = parser.parse_args(argv)
+
+    root = _project_root(args.root)
+    dataset_path = root / args.dataset
+    sources_path = root / args.sources
+
+    if not dataset_path.exists():
+        _log(f"[ERROR] DATASET NO ENCONTRADO: {dataset_path}")
+        return 1
+
+    if args.no_cache and args.cache_only:
+        _log("[ERROR] --no-cache Y --cache-only SON INCOMPATIBLES")
+        return 1
+    if args.search_local and args.no_candidate_store:
+        _log("[ERROR] --search-local Y --no-candidate-store SON INCOMPATIBLES")
+        return 1
+    scorer: Optional[BatchScorer] = None
+    if args.scoring_weights:
+        try:
+            scorer = BatchScorer(_load_scoring_weights(Path(args.scoring_weights)))
+        except (OSError, ValueError, RuntimeError) as err:
+            _log(f"[ERROR] --scoring-weights: {err}")
+            return 1
+
+    shard: Optional[Tuple[int, int]] = None
+    if args.shard:
+        try:
+            shard = _parse_shard(args.shard)
+        except ValueError:
+            _log(f"[ERROR] --shard INVÁLIDO: {args.shard}. FORMATO: K/N CON 1 <= K <= N")
+            return 1
+    shard_suffix = _shard_suffix(shard)
+
+    pexels_api_key = os.getenv("PEXELS_API_KEY", "").strip()
+    google_api_key = os.getenv("GOOGLE_CSE_API_KEY", "").strip()
+    google_cx = os.getenv("GOOGLE_CSE_CX", "").strip()
+
+    dataset = _load_json(dataset_path)
+    items = dataset.get("items")
+    if not isinstance(items, list):
+        _log("[ERROR] FORMATO DE DATASET INVÁLIDO: FALTA LISTA 'items'")
+        return 1
+
+    source_map = _load_sources(sources_path)
+    shard_output: Optional[ShardOutput] = None
+    if shard is not None:
+        shard_output = ShardOutput(
+            _shard_output_dir(root, args.cache_dir) / f"{_slug(dataset_path.stem)}{shard_suffix}.json",
+            shard,
+            dataset_path.name,
+        )
+        items_by_id = {str(item.get("id", "")).strip(): item for item in items if isinstance(item, dict)}
+        for record in shard_output.load():
+            _apply_journal_record(record, items_by_id, source_map)
+    journal = ItemJournal(
+        _journal_path(root, args.cache_dir, dataset_path, shard_suffix), args.journal_compact_every
+    )
+    recovered_ids = _recover_journal(
+        journal,
+        dataset_path,
+        dataset,
+        sources_path,
+        source_map,
+        persist=not (args.dry_run or args.plan),
+        shard_output=shard_output,
+    )
+    fingerprinted = _backfill_fingerprints(items, source_map)
+    if fingerprinted:
+        _log(f"[FINGERPRINT] {fingerprinted} FUENTES SIN HUELLA MARCADAS COMO AL DÍA (SIN VOLVER A BUSCAR)")
+
+    run_state = RunState(
+        _run_state_path(root, args.cache_dir, dataset_path, shard_suffix),
+        backoff_seconds=args.retry_backoff_minutes * 60,
+        max_backoff_seconds=args.retry_backoff_max_hours * 3600,
+    )
+    resuming = args.resume or args.retry_failed
+    if not resuming:
+        run_state.start_run()
+    started_at = dt.datetime.now(dt.timezone.utc)
+
+    hashes_path = _hash_index_path(root, args)
+    hash_index: Optional[PerceptualHashIndex] = None
+    # --plan NEITHER DOWNLOADS NOR COMMITS, SO IT SKIPS DECODING EVERY EXISTING IMAGE FOR THE INDEX.
+    if not args.allow_duplicate_images and not args.plan:
+        if Image is None:
+            _log("[INFO] SIN PILLOW NO SE DETECTAN IMÁGENES REPETIDAS ENTRE ÍTEMS.")
+        else:
+            hash_index = PerceptualHashIndex.load(hashes_path, args.duplicate_distance)
+            hashed = _backfill_image_hashes(hash_index, root, items)
+            if hashed:
+                _log(f"[HASH] {hashed} IMÁGENES AÑADIDAS AL ÍNDICE DE DUPLICADOS")
+    # ITEMS SAVED BY THE JOURNAL BUT NOT YET IN THE RUN STATE (CRASH BETWEEN THE TWO) ARE DONE.
+    for item_id in recovered_ids:
+        run_state.mark_completed(item_id, started_at)
+
+    target_item_ids = {value.strip() for value in args.item_id if value.strip()}
+    target_levels = {int(value) for value in args.level if int(value) > 0}
+    providers = [token.strip() for token in args.providers.split(",") if token.strip()]
+
+    if any(provider.lower() == "pexels" for provider in providers) and not pexels_api_key:
+        _log("[INFO] PEXELS DESACTIVADO (FALTA PEXELS_API_KEY).")
+        providers = [provider for provider in providers if provider.lower() != "pexels"]
+
+    if any(provider.lower() == "google_cse" for provider in providers) and (not google_api_key or not google_cx):
+        _log("[INFO] GOOGLE_CSE DESACTIVADO (FALTA GOOGLE_CSE_API_KEY/GOOGLE_CSE_CX).")
+        providers = [provider for provider in providers if provider.lower() != "google_cse"]
+
+    workers = max(1, args.workers)
+    if args.interactive and workers > 1:
+        _log("[INFO] --interactive REQUIERE UN SOLO WORKER. USANDO --workers 1.")
+        workers = 1
+    if args.early_exit and args.interactive:
+        _log("[INFO] --early-exit NO SE APLICA CON --interactive: SE MUESTRAN TODOS LOS CANDIDATOS.")
+    elif args.early_exit and args.prefetch:
+        _log("[INFO] CON --prefetch TODAS LAS BÚSQUEDAS SE HACEN ANTES; --early-exit SOLO AHORRA PUNTUACIÓN.")
+    if args.search_local and args.prefetch:
+        _log("[INFO] CON --prefetch TODAS LAS BÚSQUEDAS SE HACEN ANTES; --search-local NO AHORRA PETICIONES.")
+
+    counters = {"updated": 0, "skipped": 0, "failed": 0}
+    changed_items = 0
+    early_exits = 0
+    local_hits = 0
+    selected_items: List[Dict[str, Any]] = []
+    for item in items:
+        item_id = str(item.get("id", "")).strip()
+        if not item_id:
+            counters["skipped"] += 1
+            continue
+
+        if target_item_ids and item_id not in target_item_ids:
+            counters["skipped"] += 1
+            continue
+
+        if shard is not None and _item_shard(item_id, shard[1]) != shard[0]:
+            counters["skipped"] += 1
+            continue
+
+        level_value = int(item.get("level", 0) or 0)
+        if target_levels and level_value not in target_levels:
+            counters["skipped"] += 1
+            continue
+
+        if args.retry_failed:
+            if not run_state.is_failed(item_id) or not run_state.retry_due(item_id, started_at):
+                counters["skipped"] += 1
+                continue
+        elif args.resume and run_state.skip_on_resume(item_id, started_at):
+            counters["skipped"] += 1
+            continue
+
+        source_record = source_map.get(item_id)
+        if not _should_process_item(item, root, args.refresh_existing, args.replace_svg, source_record):
+            counters["skipped"] += 1
+            continue
+        if _fingerprint_changed(item, source_record):
+            changed_items += 1
+            _log(f"[CHANGED] {item_id}: CAMBIÓ LA PALABRA O LA CATEGORÍA DESDE LA ÚLTIMA BÚSQUEDA")
+        selected_items.append(item)
+
+    arasaac_catalog: Optional[ArasaacCatalog] = None
+    if "arasaac" in (provider.lower() for provider in providers) and not args.no_arasaac_catalog:
+        catalog_path = Path(args.arasaac_catalog) if args.arasaac_catalog else _arasaac_catalog_path(root, args.cache_dir)
+        catalog_path = catalog_path if catalog_path.is_absolute() else root / catalog_path
+        arasaac_catalog = ArasaacCatalog.load(catalog_path)
+        if arasaac_catalog is not None:
+            _log(
+                f"[CATALOG] ARASAAC DESDE EL ÍNDICE LOCAL ({len(arasaac_catalog.keywords)} PICTOGRAMAS, "
+                f"{arasaac_catalog.age_hours() / 24:.0f} DÍAS): {catalog_path}"
+            )
+        elif args.arasaac_catalog:
+            _log(f"[WARN] ÍNDICE ARASAAC NO VÁLIDO O INEXISTENTE: {catalog_path}. SE USA LA API.")
+
+    planned_searches: List[Tuple[str, str]] = []
+    plan_stats: Dict[str, Dict[str, int]] = {}
+    if args.plan or args.prefetch:
+        # WITH --limit ONLY THE FIRST ITEMS ARE PLANNED; ANY EXTRA ONES (AFTER FAILURES) SEARCH ON DEMAND.
+        plan_items = selected_items[: args.limit] if args.limit else selected_items
+        planned_searches, plan_stats = _plan_searches(
+            plan_items, providers, ["arasaac"] if arasaac_catalog is not None else []
+        )
+        _log(f"[PLAN] {len(plan_items)} ÍTEMS, {len(planned_searches)} BÚSQUEDAS DISTINTAS")
+        _log_plan(plan_stats)
+    if args.plan:
+        journal.close()
+        return 0
+
+    try:
+        rate_limits = _parse_rate_limits(args.rate_limit)
+    except ValueError as err:
+        _log(f"[ERROR] --rate-limit INVÁLIDO: {err}. FORMATO: PROVEEDOR=RPS[:RÁFAGA]")
+        return 1
+
+    candidate_store: Optional[CandidateStore] = None
+    if not args.no_candidate_store:
+        try:
+            candidate_store = CandidateStore(root / args.cache_dir / CANDIDATE_STORE_NAME)
+        except sqlite3.OperationalError as err:
+            if args.search_local:
+                _log(f"[ERROR] --search-local NECESITA SQLITE CON FTS5: {err}")
+                journal.close()
+                return 1
+            # THE STORE ONLY FEEDS --search-local AND rescore: THE SYNC ITSELF GOES ON WITHOUT IT.
+            _log(f"[WARN] ÍNDICE DE CANDIDATOS DESACTIVADO (¿SQLITE SIN FTS5?): {err}")
+
+    global _HTTP_CLIENT, _RESPONSE_CACHE, _METRICS, _ARASAAC_CATALOG
+    metrics = RunMetrics()
+    _METRICS = metrics
+    _ARASAAC_CATALOG = arasaac_catalog
+    _RATE_LIMITERS.clear()
+    for provider in providers:
+        rate, burst = rate_limits.get(provider.lower(), (0.0, 1.0))
+        _RATE_LIMITERS[provider.lower()] = RateLimiter(provider.lower(), rate, burst)
+    _CIRCUIT_BREAKERS.clear()
+    for provider in providers:
+        _CIRCUIT_BREAKERS[provider.lower()] = CircuitBreaker(
+            provider.lower(),
+            failure_threshold=args.breaker_failures,
+            slow_seconds=args.breaker_slow_seconds,
+            cooldown_seconds=args.breaker_cooldown,
+        )
+    with _HTTP_CLIENT_LOCK:
+        _HTTP_CLIENT = HttpClient(
+            pool_size=args.http_pool_size,
+            timeout=args.timeout,
+            connect_timeout=args.connect_timeout,
+        )
+    if not args.no_cache:
+        _RESPONSE_CACHE = ResponseCache(
+            root / args.cache_dir / "http_cache.sqlite",
+            ttl_seconds=args.cache_ttl_hours * 3600,
+            max_bytes=int(args.cache_max_mb * 1024 * 1024),
+            cache_only=args.cache_only,
+        )
+
+    session: Dict[str, Any] = {
+        "args": args,
+        "root": root,
+        "dataset_path": dataset_path,
+        "sources_path": sources_path,
+        "providers": providers,
+        "per_provider_limit": args.per_provider_limit,
+        "pexels_api_key": pexels_api_key,
+        "google_api_key": google_api_key,
+        "google_cx": google_cx,
+        "download_dir": root / args.cache_dir / "downloads",
+        "journal": journal,
+        "candidate_store": candidate_store,
+        "probes": {},
+        "scorer": scorer,
+        "shard_output": shard_output,
+        "hash_index": hash_index,
+        "blobs": _blob_locations(root, source_map),
+        "asset_refs": Counter(str(item.get("imageAsset") or "") for item in items if isinstance(item, dict)),
+        "stale_assets": set(),
+        "item_words": {
+            str(item.get("id", "")).strip(): _normalized_text(_item_main_word(item))
+            for item in items
+            if isinstance(item, dict)
+        },
+        "known_rejected": (
+            {item_id: run_state.rejected_urls(item_id) for item_id in run_state.items} if resuming else {}
+        ),
+        "query_cache": {},
+        "inflight": {},
+        "network_searches": set(),
+        "provider_executors": {},
+        "lock": threading.Lock(),
+    }
+    _clean_stale_downloads(session["download_dir"])
+    if args.parallel_providers or args.prefetch:
+        # ONE POOL PER PROVIDER: ITS SIZE IS THE CAP, AND A SLOW PROVIDER CANNOT STARVE THE OTHERS.
+        session["provider_executors"] = {
+            provider: ThreadPoolExecutor(
+                max_workers=max(1, args.provider_concurrency),
+                thread_name_prefix=f"sync-{_slug(provider)}",
+            )
+            for provider in providers
+        }
+
+    executor: Optional[ThreadPoolExecutor] = None
+    if workers > 1:
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sync-item")
+    # RESULTS ARE COMMITTED IN DATASET ORDER, SO OUTPUT FILES DO NOT DEPEND ON THREAD TIMING.
+    pending: Deque[Future] = deque()
+    max_in_flight = workers * 2
+
+    updated_items: List[Dict[str, Any]] = []
+
+    def commit(result: Dict[str, Any]) -> bool:
+        nonlocal early_exits, local_hits
+        status = _commit_item_result(result, session, dataset, source_map)
+        if result.get("early_exit"):
+            early_exits += 1
+        if result.get("local_hit"):
+            local_hits += 1
+        counters[status] = counters.get(status, 0) + 1
+        if not args.dry_run:
+            run_state.record(result["item_id"], status, result.get("attempt", {}), dt.datetime.now(dt.timezone.utc))
+            if run_state.unsaved >= journal.compact_every:
+                run_state.save()
+        if status == "updated":
+            updated_items.append(result["item"])
+        if args.limit and counters["updated"] >= args.limit:
+            _log(f"[STOP] LÍMITE ALCANZADO: {args.limit}")
+            return False
+        return True
+
+    def free_slots() -> int:
+        # WITH --limit, NO MORE ITEMS IN FLIGHT THAN UPDATES STILL MISSING: EACH ONE SPENDS API QUOTA.
+        # A FAILED OR SKIPPED ITEM FREES ITS SLOT FOR THE NEXT ONE.
+        slots = max_in_flight
+        if args.limit:
+            slots = min(slots, args.limit - counters["updated"])
+        return slots - len(pending)
+
+    try:
+        if args.prefetch:
+            with metrics.stage("prefetch"):
+                _prefetch_plan(session, planned_searches)
+
+        keep_going = True
+        for item in selected_items:
+            if executor is None:
+                with _timed("item"):
+                    result = _process_item(item, session)
+                keep_going = commit(result)
+                if not keep_going:
+                    break
+                # ONLY AFTER ITEMS THAT ASKED THE PROVIDERS: CACHED, LOCAL OR FAILED-BEFORE-SEARCH ITEMS GO ON.
+                if args.sleep > 0 and result.get("searched"):
+                    time.sleep(args.sleep)
+                continue
 
-                absolute_path.parent.mkdir(parents=True, exist_ok=True)
-                absolute_path.write_bytes(selected_content)
-
-                item["imageAsset"] = relative_path.as_posix()
-
-                source_map[item_id] = {
-                    "itemId": item_id,
-                    "query": chosen_query,
-                    "provider": chosen.get("provider", ""),
-                    "imageUrl": chosen.get("image_url", ""),
-                    "sourcePage": chosen.get("source_page", ""),
-                    "title": chosen.get("title", ""),
-                    "license": chosen.get("license", ""),
-                    "attribution": chosen.get("attribution", ""),
-                    "mime": mime,
-                    "width": int(chosen.get("width", 0) or 0),
-                    "height": int(chosen.get("height", 0) or 0),
-                    "downloadedAt": dt.datetime.now(dt.timezone.utc).isoformat(),
-                    "storedAs": relative_path.as_posix(),
-                }
-
-                # SAVE INCREMENTALLY TO AVOID LOSING PROGRESS IF THE PROCESS STOPS.
-                _save_json(dataset_path, dataset)
-                _save_sources(sources_path, source_map)
-
-                updated += 1
-                _log(f"[OK] {item_id} -> {relative_path.as_posix()} ({chosen.get('provider')})")
-
-            if args.limit and updated >= args.limit:
-                _log(f"[STOP] LÍMITE ALCANZADO: {args.limit}")
+            while pending and keep_going and free_slots() <= 0:
+                keep_going = commit(pending.popleft().result())
+            if not keep_going:
                 break
+            pending.append(executor.submit(_process_item_paced, item, session))
 
-            if args.sleep > 0:
-                time.sleep(args.sleep)
+        while pending and keep_going:
+            keep_going = commit(pending.popleft().result())
     except KeyboardInterrupt:
         _log("[INTERRUPTED] PROCESO DETENIDO POR USUARIO. PROGRESO GUARDADO.")
+    finally:
+        for future in pending:
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+        # RESULTS PAST --limit OR AN INTERRUPTION ARE NEVER COMMITTED: DROP THEIR TEMP FILES.
+        for future in pending:
+            if not future.cancelled() and future.exception() is None:
+                _discard_item_result(future.result())
+        for provider_executor in session["provider_executors"].values():
+            provider_executor.shutdown(wait=True, cancel_futures=True)
+        with _HTTP_CLIENT_LOCK:
+            http_client, _HTTP_CLIENT = _HTTP_CLIENT, None
+        if http_client is not None:
+            http_client.close()
+        response_cache = _RESPONSE_CACHE
+        _RESPONSE_CACHE = None
+        _ARASAAC_CATALOG = None
+        if candidate_store is not None:
+            corpus_size = candidate_store.count()
+            candidate_store.close()
+        if response_cache is not None:
+            response_cache.close()
 
     if not args.dry_run:
+        with metrics.stage("save"):
+            _compact_outputs(
+                journal, dataset_path, dataset, sources_path, source_map, shard_output, _take_stale_assets(session)
+            )
+            run_state.save()
+            # THE SHARED HASH INDEX IS REBUILT FROM THE MERGED ITEMS BY merge.
+            if hash_index is not None and shard_output is None:
+                hash_index.save(hashes_path)
+    journal.close()
+
+    if args.optimize and shard_output is not None:
+        _log("[INFO] CON --shard, --optimize SE OMITE: EJECUTA optimize DESPUÉS DE merge.")
+    elif args.optimize and updated_items and not args.dry_run:
+        with metrics.stage("optimize"):
+            optimize_counters, stale_assets = _optimize_assets(root, updated_items, source_map, args, items)
+        _log(
+            f"[OPTIMIZE] {optimize_counters['optimized']} OPTIMIZADAS, "
+            f"AHORRO {optimize_counters['savedBytes'] / 1024:.1f} KB"
+        )
         _save_json(dataset_path, dataset)
         _save_sources(sources_path, source_map)
+        _remove_assets(root, stale_assets)
+        if hash_index is not None:
+            _backfill_image_hashes(hash_index, root, updated_items)
+            hash_index.save(hashes_path)
 
     _log("\nRESUMEN")
-    _log(f"- ACTUALIZADOS: {updated}")
-    _log(f"- OMITIDOS: {skipped}")
-    _log(f"- FALLIDOS: {failed}")
-    _log(f"- DATASET: {dataset_path}")
-    _log(f"- FUENTES: {sources_path}")
+    _log(f"- ACTUALIZADOS: {counters['updated']}")
+    _log(f"- OMITIDOS: {counters['skipped']}")
+    _log(f"- FALLIDOS: {counters['failed']}")
+    if changed_items:
+        _log(f"- CON PALABRA O CATEGORÍA CAMBIADA: {changed_items}")
+    if early_exits:
+        _log(f"- RESUELTOS SIN AGOTAR LAS VARIANTES (--early-exit): {early_exits}")
+    if args.search_local:
+        _log(f"- RESUELTOS DESDE EL ÍNDICE LOCAL (--search-local): {local_hits}")
+    if candidate_store is not None:
+        _log(f"- ÍNDICE DE CANDIDATOS: {corpus_size} ({candidate_store.added} NUEVOS EN ESTA EJECUCIÓN)")
+    if shard_output is not None:
+        _log(f"- SHARD {shard[0]}/{shard[1]}: {len(shard_output.records)} ÍTEMS EN {shard_output.path}")
+    else:
+        _log(f"- DATASET: {dataset_path}")
+        _log(f"- FUENTES: {sources_path}")
+    if response_cache is not None:
+        _log(f"- CACHÉ HTTP: {response_cache.hits} ACIERTOS / {response_cache.misses} FALLOS")
+    cache_only_misses = metrics.cache_only_misses()
+    if cache_only_misses:
+        by_provider = ", ".join(f"{provider} {count}" for provider, count in cache_only_misses.items())
+        _log(
+            f"- BÚSQUEDAS SIN RESPUESTA EN CACHÉ (--cache-only): {sum(cache_only_misses.values())} ({by_provider})"
+        )
+    for limiter in _RATE_LIMITERS.values():
+        if limiter.waited_seconds >= 0.05 or limiter.throttled_responses:
+            _log(
+                f"- LÍMITE {limiter.provider}: {limiter.waited_seconds:.1f}s EN ESPERA, "
+                f"{limiter.throttled_responses} RESPUESTAS 429/503"
+            )
+    breakers = [breaker for breaker in _CIRCUIT_BREAKERS.values() if breaker.calls or breaker.skipped]
+    if breakers:
+        _log("- SALUD DE PROVEEDORES:")
+    for breaker in breakers:
+        _log(
+            f"  {breaker.provider}: {breaker.state.upper()} | {breaker.calls} LLAMADAS, "
+            f"{breaker.failures} FALLOS, {breaker.slow_calls} LENTAS, {breaker.skipped} OMITIDAS, "
+            f"{breaker.times_opened} PAUSAS | p50 {breaker.latency_percentile(0.5):.2f}s "
+            f"p95 {breaker.latency_percentile(0.95):.2f}s"
+        )
+    queued, due = run_state.failure_queue(dt.datetime.now(dt.timezone.utc))
+    if queued:
+        _log(f"- COLA DE REINTENTOS: {queued} ÍTEMS ({due} LISTOS PARA --retry-failed)")
+    _log(
+        f"- TIEMPOS: BÚSQUEDA {metrics.stage_seconds('search'):.1f}s, "
+        f"PUNTUACIÓN {metrics.stage_seconds('score'):.1f}s, DESCARGA {metrics.stage_seconds('download'):.1f}s, "
+        f"DOCUMENTOS {metrics.stage_seconds('document_check'):.1f}s, GUARDADO {metrics.stage_seconds('save'):.1f}s"
+    )
+
+    report_extra = {
+        "dataset": str(dataset_path),
+        "providers": providers,
+        "workers": workers,
+        "dryRun": args.dry_run,
+        "shard": args.shard,
+        "items": dict(counters),
+        "changedItems": changed_items,
+        "earlyExits": early_exits,
+        "localHits": local_hits,
+        "plan": plan_stats,
+        "failureQueue": {"queued": queued, "due": due},
+        "rateLimits": {
+            limiter.provider: {
+                "waitedSeconds": round(limiter.waited_seconds, 3),
+                "throttledResponses": limiter.throttled_responses,
+            }
+            for limiter in _RATE_LIMITERS.values()
+        },
+        "providerHealth": {
+            breaker.provider: {
+                "state": breaker.state,
+                "calls": breaker.calls,
+                "failures": breaker.failures,
+                "slowCalls": breaker.slow_calls,
+                "skipped": breaker.skipped,
+                "timesOpened": breaker.times_opened,
+            }
+            for breaker in _CIRCUIT_BREAKERS.values()
+        },
+    }
+    _RATE_LIMITERS.clear()
+    _CIRCUIT_BREAKERS.clear()
+    _METRICS = None
+    default_report = root / args.cache_dir / DEFAULT_REPORT_NAME.replace(".json", f"{shard_suffix}.json")
+    report_path = Path(args.report) if args.report else default_report
+    report_path = report_path if report_path.is_absolute() else root / report_path
+    report_path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write_text(report_path, json.dumps(metrics.report(report_extra), ensure_ascii=False, indent=2) + "\n")
+    _log(f"- INFORME: {report_path}")
+    if args.prometheus:
+        prometheus_path = Path(args.prometheus)
+        prometheus_path = prometheus_path if prometheus_path.is_absolute() else root / prometheus_path
+        prometheus_path.parent.mkdir(parents=True, exist_ok=True)
+        _atomic_write_text(prometheus_path, metrics.prometheus_text(report_extra))
 
     return 0
 
 
+SUBCOMMANDS = {
+    "optimize": _main_optimize,
+    "dedupe": _main_dedupe,
+    "merge": _main_merge,
+    "arasaac-catalog": _main_arasaac_catalog,
+    "rescore": _main_rescore,
+}
+
+
 if __name__ == "__main__":
     sys.exit(main())
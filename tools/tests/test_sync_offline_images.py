@@ -0,0 +1,1159 @@
+"""UNIT TESTS FOR tools/sync_offline_images.py.
+
+RUN FROM THE PROJECT ROOT: python -m unittest discover -s tools/tests
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import io
+import json
+import socket
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import sync_offline_images as sync  # noqa: E402
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover
+    Image = None
+
+DATASET = "assets/data/lectoescritura_dataset.json"
+
+
+def _item_ids_in_shard(shard: int, count: int, how_many: int) -> List[str]:
+    found = []
+    index = 0
+    while len(found) < how_many:
+        item_id = f"T_{index:03d}"
+        if sync._item_shard(item_id, count) == shard:
+            found.append(item_id)
+        index += 1
+    return found
+
+
+class ProjectSandbox:
+    # A THROWAWAY PROJECT ROOT WITH A DATASET, ITS SOURCES AND THE IMAGE FILES THE RECORDS POINT AT.
+    def __init__(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self._tmp.name)
+        (self.root / "assets/data").mkdir(parents=True)
+        (self.root / "assets/images").mkdir(parents=True)
+
+    def close(self) -> None:
+        self._tmp.cleanup()
+
+    def write_image(self, relative_path: str, content: bytes) -> str:
+        path = self.root / relative_path
+        path.write_bytes(content)
+        return hashlib.sha256(content).hexdigest()
+
+    def write_dataset(self, items: List[Dict[str, Any]]) -> None:
+        (self.root / DATASET).write_text(json.dumps({"items": items}, ensure_ascii=False), encoding="utf-8")
+
+    def dataset_items(self) -> Dict[str, Dict[str, Any]]:
+        payload = json.loads((self.root / DATASET).read_text(encoding="utf-8"))
+        return {item["id"]: item for item in payload["items"]}
+
+    def write_partial(self, name: str, shard: int, count: int, records: List[Dict[str, Any]]) -> Path:
+        path = self.root / name
+        payload = {
+            "dataset": Path(DATASET).name,
+            "shard": shard,
+            "shardCount": count,
+            "items": records,
+        }
+        path.write_text(json.dumps(payload, ensure_ascii=False), encoding="utf-8")
+        return path
+
+
+def _item(item_id: str, word: str, image_asset: str = "") -> Dict[str, Any]:
+    return {"id": item_id, "word": word, "category": "cosas", "level": 1, "imageAsset": image_asset}
+
+
+def _record(item: Dict[str, Any], image_asset: str, sha256: str, base_asset: str = "") -> Dict[str, Any]:
+    return {
+        "itemId": item["id"],
+        "baseImageAsset": base_asset,
+        "imageAsset": image_asset,
+        "source": {
+            "itemId": item["id"],
+            "storedAs": image_asset,
+            "sha256": sha256,
+            "fingerprint": sync._item_fingerprint(item),
+        },
+    }
+
+
+class ShardRecordConflictTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.item_id = _item_ids_in_shard(1, 2, 1)[0]
+        self.item = _item(self.item_id, "mesa", "assets/images/old.png")
+        self.sha256 = self.sandbox.write_image("assets/images/new.png", b"NEW IMAGE BYTES")
+
+    def conflict(self, record: Dict[str, Any], item: Any = "default", shard: tuple = (1, 2)) -> str:
+        return sync._shard_record_conflict(record, self.item if item == "default" else item, shard, self.sandbox.root)
+
+    def clean_record(self) -> Dict[str, Any]:
+        return _record(self.item, "assets/images/new.png", self.sha256, base_asset="assets/images/old.png")
+
+    def test_clean_record_has_no_conflict(self) -> None:
+        self.assertEqual(self.conflict(self.clean_record()), "")
+
+    def test_item_removed_from_dataset(self) -> None:
+        self.assertIn("YA NO EXISTE", self.conflict(self.clean_record(), item=None))
+
+    def test_item_from_another_shard(self) -> None:
+        self.assertIn("NO PERTENECE AL SHARD 2/2", self.conflict(self.clean_record(), shard=(2, 2)))
+
+    def test_base_asset_drift(self) -> None:
+        record = self.clean_record()
+        record["baseImageAsset"] = "assets/images/older.png"
+        self.assertIn("SU IMAGEN CAMBIÓ", self.conflict(record))
+
+    def test_fingerprint_drift(self) -> None:
+        record = self.clean_record()
+        self.item["word"] = "silla"
+        self.assertIn("CAMBIÓ LA PALABRA", self.conflict(record))
+
+    def test_missing_file(self) -> None:
+        record = self.clean_record()
+        record["imageAsset"] = "assets/images/missing.png"
+        self.assertIn("FALTA EL ARCHIVO assets/images/missing.png", self.conflict(record))
+
+    def test_sha256_mismatch(self) -> None:
+        record = self.clean_record()
+        record["source"]["sha256"] = "0" * 64
+        self.assertIn("NO COINCIDE CON SU SHA-256", self.conflict(record))
+
+
+class MergePartialsTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        first_id, second_id = _item_ids_in_shard(1, 2, 2)
+        self.first = _item(first_id, "mesa")
+        self.second = _item(second_id, "silla")
+        self.sandbox.write_dataset([self.first, self.second])
+        self.sha_a = self.sandbox.write_image("assets/images/a.png", b"IMAGE A")
+        self.sha_b = self.sandbox.write_image("assets/images/b.png", b"IMAGE B")
+        self.sha_c = self.sandbox.write_image("assets/images/c.png", b"IMAGE C")
+
+    def merge(self, partials: List[Path], *extra: str) -> int:
+        argv = ["merge", "--root", str(self.sandbox.root), "--keep-partials", *extra, *map(str, partials)]
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync.main(argv)
+
+    def test_agreeing_partials_are_applied(self) -> None:
+        record = _record(self.first, "assets/images/a.png", self.sha_a)
+        partials = [
+            self.sandbox.write_partial("one.json", 1, 2, [record]),
+            self.sandbox.write_partial("two.json", 1, 2, [record]),
+        ]
+        self.assertEqual(self.merge(partials), 0)
+        self.assertEqual(self.sandbox.dataset_items()[self.first["id"]]["imageAsset"], "assets/images/a.png")
+
+    def test_disagreeing_partials_block_the_merge(self) -> None:
+        partials = [
+            self.sandbox.write_partial(
+                "one.json",
+                1,
+                2,
+                [
+                    _record(self.first, "assets/images/a.png", self.sha_a),
+                    _record(self.second, "assets/images/c.png", self.sha_c),
+                ],
+            ),
+            self.sandbox.write_partial("two.json", 1, 2, [_record(self.first, "assets/images/b.png", self.sha_b)]),
+        ]
+        self.assertEqual(self.merge(partials), 1)
+        items = self.sandbox.dataset_items()
+        self.assertEqual(items[self.first["id"]]["imageAsset"], "")
+        self.assertEqual(items[self.second["id"]]["imageAsset"], "")
+
+    def test_skip_conflicts_applies_only_the_rest(self) -> None:
+        partials = [
+            self.sandbox.write_partial(
+                "one.json",
+                1,
+                2,
+                [
+                    _record(self.first, "assets/images/a.png", self.sha_a),
+                    _record(self.second, "assets/images/c.png", self.sha_c),
+                ],
+            ),
+            self.sandbox.write_partial("two.json", 1, 2, [_record(self.first, "assets/images/b.png", self.sha_b)]),
+        ]
+        self.assertEqual(self.merge(partials, "--skip-conflicts"), 0)
+        items = self.sandbox.dataset_items()
+        self.assertEqual(items[self.first["id"]]["imageAsset"], "")
+        self.assertEqual(items[self.second["id"]]["imageAsset"], "assets/images/c.png")
+
+    def test_partials_from_different_shard_counts_are_rejected(self) -> None:
+        partials = [
+            self.sandbox.write_partial("one.json", 1, 2, [_record(self.first, "assets/images/a.png", self.sha_a)]),
+            self.sandbox.write_partial("two.json", 1, 3, []),
+        ]
+        self.assertEqual(self.merge(partials), 1)
+
+
+def _encode(mode: str, size: Tuple[int, int], image_format: str, **options: Any) -> bytes:
+    buffer = io.BytesIO()
+    Image.new(mode, size, (200, 40, 40, 128) if mode == "RGBA" else (200, 40, 40)).save(
+        buffer, format=image_format, **options
+    )
+    return buffer.getvalue()
+
+
+def _exif_block() -> bytes:
+    exif = Image.Exif()
+    exif[0x010F] = "CAMARA DE PRUEBA"  # Make
+    exif[0x0110] = "X" * 2000  # Model: PUSHES THE FRAME HEADER WELL PAST THE FIRST SEGMENT
+    return exif.tobytes()
+
+
+@unittest.skipIf(Image is None, "NECESITA PILLOW")
+class ImageHeaderInfoTest(unittest.TestCase):
+    def cases(self) -> List[Tuple[str, bytes, Optional[bytes], Tuple[str, int, int]]]:
+        # (NAME, BYTES, EXPECTED WEBP CHUNK, EXPECTED RESULT). ODD, UNEQUAL SIZES CATCH SWAPPED FIELDS.
+        cases = [
+            ("png", _encode("RGB", (123, 45), "PNG"), None, ("image/png", 123, 45)),
+            ("png-alpha", _encode("RGBA", (7, 300), "PNG"), None, ("image/png", 7, 300)),
+            ("jpeg", _encode("RGB", (321, 17), "JPEG", quality=90), None, ("image/jpeg", 321, 17)),
+            (
+                "jpeg-exif",
+                _encode("RGB", (64, 999), "JPEG", exif=_exif_block()),
+                None,
+                ("image/jpeg", 64, 999),
+            ),
+            (
+                "jpeg-progressive",
+                _encode("RGB", (250, 130), "JPEG", progressive=True),
+                None,
+                ("image/jpeg", 250, 130),
+            ),
+        ]
+        if sync._pil_supports_webp():
+            cases += [
+                ("webp-lossy", _encode("RGB", (301, 77), "WEBP", quality=80), b"VP8 ", ("image/webp", 301, 77)),
+                ("webp-lossless", _encode("RGB", (77, 301), "WEBP", lossless=True), b"VP8L", ("image/webp", 77, 301)),
+                ("webp-vp8x", _encode("RGBA", (5000, 3), "WEBP", quality=80), b"VP8X", ("image/webp", 5000, 3)),
+            ]
+        return cases
+
+    def test_reads_format_and_size(self) -> None:
+        for name, data, chunk, expected in self.cases():
+            with self.subTest(name):
+                if chunk is not None:
+                    self.assertEqual(data[12:16], chunk)
+                self.assertEqual(sync._image_header_info(data), expected)
+
+    def test_reads_size_from_the_probe_prefix(self) -> None:
+        for name, data, _chunk, expected in self.cases():
+            with self.subTest(name):
+                self.assertEqual(sync._image_header_info(data[: sync.PROBE_BYTES]), expected)
+
+    def test_truncated_header_returns_none(self) -> None:
+        for name, data, _chunk, _expected in self.cases():
+            with self.subTest(name):
+                # NEITHER THE PNG IHDR, THE JPEG FRAME HEADER NOR THE WEBP SIZE FIELDS FIT IN 20 BYTES.
+                self.assertIsNone(sync._image_header_info(data[:20]))
+        jpeg = _encode("RGB", (64, 999), "JPEG", exif=_exif_block())
+        self.assertIsNone(sync._image_header_info(jpeg[:1024]))
+
+    def test_other_bytes_return_none(self) -> None:
+        others = {
+            "empty": b"",
+            "html": b"<!DOCTYPE html><html><body>NOT FOUND</body></html>",
+            "gif": _encode("RGB", (10, 10), "GIF"),
+            "riff-wave": b"RIFF\x24\x00\x00\x00WAVEfmt " + b"\x00" * 32,
+            "webp-unknown-chunk": b"RIFF\x24\x00\x00\x00WEBPABCD" + b"\x00" * 32,
+        }
+        for name, data in others.items():
+            with self.subTest(name):
+                self.assertIsNone(sync._image_header_info(data))
+
+
+class StaleAssetTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.item = _item("T_001", "mesa", "assets/images/new.png")
+        self.sandbox.write_dataset([self.item])
+        self.sandbox.write_image("assets/images/old.png", b"OLD")
+        self.sandbox.write_image("assets/images/back.png", b"POINTED AT AGAIN")
+        self.session: Dict[str, Any] = {
+            "root": self.sandbox.root,
+            "asset_refs": sync.Counter({"assets/images/new.png": 1, "assets/images/back.png": 1}),
+            "stale_assets": {"assets/images/old.png", "assets/images/back.png"},
+        }
+
+    def test_replaced_files_go_only_after_the_dataset_is_saved(self) -> None:
+        dataset_path = self.sandbox.root / DATASET
+        saved_before_unlink = []
+        original_unlink = Path.unlink
+
+        def unlink(path: Path, missing_ok: bool = False) -> None:
+            saved_before_unlink.append(json.loads(dataset_path.read_text(encoding="utf-8"))["items"][0]["imageAsset"])
+            original_unlink(path, missing_ok=missing_ok)
+
+        dataset = {"items": [dict(self.item, imageAsset="assets/images/new.png")]}
+        stale_paths = sync._take_stale_assets(self.session)
+        with mock.patch.object(Path, "unlink", autospec=True, side_effect=unlink):
+            sync._compact_outputs(
+                None, dataset_path, dataset, self.sandbox.root / "sources.json", {}, None, stale_paths
+            )
+
+        self.assertEqual(saved_before_unlink, ["assets/images/new.png"])
+        self.assertFalse((self.sandbox.root / "assets/images/old.png").exists())
+        self.assertTrue((self.sandbox.root / "assets/images/back.png").exists())
+        self.assertEqual(self.session["stale_assets"], set())
+
+
+class DedupeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.sandbox.write_image("assets/images/uno.png", b"SAME BYTES")
+        self.sandbox.write_image("assets/images/dos.png", b"SAME BYTES")
+        self.sandbox.write_image("assets/images/tres.png", b"OTHER BYTES")
+        self.sandbox.write_dataset(
+            [
+                _item("T_001", "mesa", "assets/images/uno.png"),
+                _item("T_002", "silla", "assets/images/dos.png"),
+                _item("T_003", "vaso", "assets/images/tres.png"),
+            ]
+        )
+
+    def dedupe(self, *extra: str) -> int:
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync.main(["dedupe", "--root", str(self.sandbox.root), *extra])
+
+    def test_copies_point_at_one_file(self) -> None:
+        self.assertEqual(self.dedupe(), 0)
+        items = self.sandbox.dataset_items()
+        self.assertEqual(items["T_002"]["imageAsset"], "assets/images/uno.png")
+        self.assertEqual(items["T_003"]["imageAsset"], "assets/images/tres.png")
+        self.assertFalse((self.sandbox.root / "assets/images/dos.png").exists())
+
+    def test_dry_run_changes_nothing(self) -> None:
+        self.assertEqual(self.dedupe("--dry-run"), 0)
+        self.assertEqual(self.sandbox.dataset_items()["T_002"]["imageAsset"], "assets/images/dos.png")
+        self.assertTrue((self.sandbox.root / "assets/images/dos.png").exists())
+
+
+@unittest.skipIf(Image is None, "NECESITA PILLOW")
+class OptimizeTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        noise = Image.effect_noise((300, 300), 80)
+        noise.convert("RGB").save(self.sandbox.root / "assets/images/foto.jpg", quality=95)
+        noise.convert("RGB").save(self.sandbox.root / "assets/images/foto.png")
+        # 1-BIT NOISE: TINY AS A PNG, MUCH LARGER ONCE RE-ENCODED.
+        Image.effect_noise((200, 200), 120).convert("1").save(self.sandbox.root / "assets/images/bn.png")
+        items = [
+            _item("T_001", "mesa", "assets/images/foto.jpg"),
+            _item("T_002", "silla", "assets/images/foto.png"),
+            _item("T_003", "vaso", "assets/images/bn.png"),
+        ]
+        self.sandbox.write_dataset(items)
+        sources = [{"itemId": item["id"], "storedAs": item["imageAsset"]} for item in items]
+        (self.sandbox.root / "assets/data/image_sources.json").write_text(
+            json.dumps({"sources": sources}), encoding="utf-8"
+        )
+
+    def optimize(self) -> int:
+        argv = ["optimize", "--root", str(self.sandbox.root), "--optimize-format", "jpeg", "--optimize-workers", "1"]
+        with contextlib.redirect_stdout(io.StringIO()):
+            return sync.main(argv)
+
+    def test_optimize_replaces_only_files_that_shrink(self) -> None:
+        self.assertEqual(self.optimize(), 0)
+        items = self.sandbox.dataset_items()
+        images = self.sandbox.root / "assets/images"
+        # foto.jpg IS RE-ENCODED IN PLACE; foto.png WOULD ALSO BECOME foto.jpg, SO IT GETS A NUMBERED NAME.
+        self.assertEqual(items["T_001"]["imageAsset"], "assets/images/foto.jpg")
+        self.assertEqual(items["T_002"]["imageAsset"], "assets/images/foto-2.jpg")
+        self.assertFalse((images / "foto.png").exists())
+        self.assertEqual(items["T_003"]["imageAsset"], "assets/images/bn.png")
+        self.assertTrue((images / "bn.png").exists())
+
+
+class ItemJournalTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.dataset_path = self.sandbox.root / DATASET
+        self.sources_path = self.sandbox.root / "assets/data/image_sources.json"
+        self.journal = sync.ItemJournal(self.sandbox.root / ".cache/journal/dataset.jsonl", compact_every=2)
+        self.addCleanup(self.journal.close)
+        self.sandbox.write_dataset([_item("T_001", "mesa"), _item("T_002", "silla")])
+
+    def record(self, item_id: str, image_asset: str) -> Dict[str, Any]:
+        return {"itemId": item_id, "imageAsset": image_asset, "source": {"itemId": item_id, "storedAs": image_asset}}
+
+    def recover(self, persist: bool = True) -> Tuple[List[str], Dict[str, Any], Dict[str, Dict[str, Any]]]:
+        dataset = sync._load_json(self.dataset_path)
+        source_map = sync._load_sources(self.sources_path)
+        journal = sync.ItemJournal(self.journal.path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            applied = sync._recover_journal(
+                journal, self.dataset_path, dataset, self.sources_path, source_map, persist=persist
+            )
+        return applied, dataset, source_map
+
+    def test_append_asks_for_compaction_every_n_records(self) -> None:
+        self.assertFalse(self.journal.append(self.record("T_001", "assets/images/a.png")))
+        self.assertTrue(self.journal.append(self.record("T_002", "assets/images/b.png")))
+        self.journal.reset()
+        self.assertFalse(self.journal.path.exists())
+        self.assertFalse(self.journal.append(self.record("T_001", "assets/images/c.png")))
+
+    def test_replay_applies_records_in_order_and_compacts(self) -> None:
+        self.journal.append(self.record("T_001", "assets/images/a.png"))
+        self.journal.append(self.record("T_001", "assets/images/b.png"))
+        self.journal.close()
+
+        applied, _dataset, source_map = self.recover()
+        self.assertEqual(applied, ["T_001", "T_001"])
+        self.assertEqual(self.sandbox.dataset_items()["T_001"]["imageAsset"], "assets/images/b.png")
+        self.assertEqual(source_map["T_001"]["storedAs"], "assets/images/b.png")
+        self.assertEqual(sync._load_sources(self.sources_path)["T_001"]["storedAs"], "assets/images/b.png")
+        self.assertFalse(self.journal.path.exists())
+
+    def test_truncated_last_line_and_unknown_items_are_skipped(self) -> None:
+        self.journal.append(self.record("T_002", "assets/images/b.png"))
+        self.journal.append(self.record("T_999", "assets/images/x.png"))
+        self.journal.close()
+        with self.journal.path.open("a", encoding="utf-8") as handle:
+            handle.write('{"itemId": "T_001", "imageAs')
+
+        applied, _dataset, _source_map = self.recover()
+        self.assertEqual(applied, ["T_002"])
+        items = self.sandbox.dataset_items()
+        self.assertEqual(items["T_001"]["imageAsset"], "")
+        self.assertEqual(items["T_002"]["imageAsset"], "assets/images/b.png")
+
+    def test_dry_run_recovery_leaves_files_alone(self) -> None:
+        self.journal.append(self.record("T_001", "assets/images/a.png"))
+        self.journal.close()
+
+        applied, dataset, _source_map = self.recover(persist=False)
+        self.assertEqual(applied, ["T_001"])
+        self.assertEqual(dataset["items"][0]["imageAsset"], "assets/images/a.png")
+        self.assertEqual(self.sandbox.dataset_items()["T_001"]["imageAsset"], "")
+        self.assertTrue(self.journal.path.exists())
+
+
+class RunStateTest(unittest.TestCase):
+    # EVERY CALL GETS ITS now EXPLICITLY, SO BACKOFF IS CHECKED AGAINST A FIXED CLOCK.
+    T0 = sync.dt.datetime(2026, 1, 1, tzinfo=sync.dt.timezone.utc)
+
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.path = self.sandbox.root / ".cache/run_state/dataset.json"
+
+    def state(self) -> "sync.RunState":
+        # 60s BASE BACKOFF, DOUBLING PER FAILURE, CAPPED AT 300s.
+        return sync.RunState(self.path, backoff_seconds=60, max_backoff_seconds=300)
+
+    def at(self, seconds: float) -> "sync.dt.datetime":
+        return self.T0 + sync.dt.timedelta(seconds=seconds)
+
+    def fail(self, state: "sync.RunState", seconds: float, *urls: str) -> None:
+        attempt = {"reason": "no_candidates", "queries": ["mesa"], "rejectedUrls": list(urls)}
+        state.record("T_001", "failed", attempt, self.at(seconds))
+
+    def fail_item(self, state: "sync.RunState", item_id: str, seconds: float) -> None:
+        state.record(item_id, "failed", {"reason": "download_failed"}, self.at(seconds))
+
+    def test_backoff_doubles_and_is_capped(self) -> None:
+        state = self.state()
+        state.start_run()
+        self.fail(state, 0)
+        self.assertFalse(state.retry_due("T_001", self.at(59)))
+        self.assertTrue(state.retry_due("T_001", self.at(60)))
+        self.fail(state, 100)
+        self.assertFalse(state.retry_due("T_001", self.at(219)))
+        self.assertTrue(state.retry_due("T_001", self.at(220)))
+        for seconds in (300, 400, 500):
+            self.fail(state, seconds)
+        self.assertEqual(state.items["T_001"]["failures"], 5)
+        self.assertTrue(state.retry_due("T_001", self.at(800)))
+        self.assertEqual(state.failure_queue(self.at(799)), (1, 0))
+        self.assertEqual(state.failure_queue(self.at(800)), (1, 1))
+
+    def test_rejected_urls_accumulate_until_a_success_clears_them(self) -> None:
+        state = self.state()
+        self.fail(state, 0, "https://a/1.png", "https://a/2.png")
+        self.fail(state, 100, "https://a/2.png", "https://a/3.png")
+        self.assertEqual(state.rejected_urls("T_001"), ["https://a/1.png", "https://a/2.png", "https://a/3.png"])
+        state.record("T_001", "updated", {"queries": ["mesa"]}, self.at(200))
+        self.assertEqual(state.items["T_001"]["status"], "completed")
+        self.assertEqual(state.rejected_urls("T_001"), [])
+        self.assertNotIn("failures", state.items["T_001"])
+
+    def test_resume_skips_only_work_done_in_the_same_run(self) -> None:
+        state = self.state()
+        state.start_run()
+        state.record("T_001", "updated", {}, self.at(0))
+        self.fail_item(state, "T_002", 0)
+        state.save()
+
+        resumed = self.state()
+        self.assertTrue(resumed.skip_on_resume("T_001", self.at(10)))
+        self.assertTrue(resumed.skip_on_resume("T_002", self.at(10)))
+        self.assertFalse(resumed.skip_on_resume("T_002", self.at(60)))
+        self.assertFalse(resumed.skip_on_resume("T_003", self.at(10)))
+
+        # A NEW RUN REDOES ITEMS COMPLETED IN AN EARLIER ONE.
+        resumed.run_id = "otra-ejecucion"
+        self.assertFalse(resumed.skip_on_resume("T_001", self.at(10)))
+
+    def test_unreadable_state_starts_empty(self) -> None:
+        self.path.parent.mkdir(parents=True)
+        self.path.write_text("{ROTO", encoding="utf-8")
+        with contextlib.redirect_stdout(io.StringIO()):
+            state = self.state()
+        self.assertEqual(state.items, {})
+
+
+class FakeClock:
+    # STANDS IN FOR time.monotonic AND time.sleep: SLEEPING ONLY MOVES THE CLOCK FORWARD.
+    def __init__(self) -> None:
+        self.now = 1000.0
+        self.slept: List[float] = []
+
+    def __call__(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float) -> None:
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+class RateLimiterTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+
+    def limiter(self, rate: float = 2.0, burst: float = 3.0) -> "sync.RateLimiter":
+        return sync.RateLimiter("pexels", rate, burst, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_burst_then_refill_at_the_rate(self) -> None:
+        limiter = self.limiter()
+        for _ in range(3):
+            limiter.acquire()
+        self.assertEqual(self.clock.slept, [])
+        limiter.acquire()
+        self.assertEqual(self.clock.slept, [0.5])
+        self.clock.now += 10
+        for _ in range(3):
+            limiter.acquire()
+        # TOKENS NEVER PILE UP BEYOND THE BURST, HOWEVER LONG THE PAUSE.
+        self.assertEqual(self.clock.slept, [0.5])
+        limiter.acquire()
+        self.assertEqual(self.clock.slept, [0.5, 0.5])
+        self.assertAlmostEqual(limiter.waited_seconds, 1.0)
+
+    def test_zero_rate_never_waits(self) -> None:
+        limiter = self.limiter(rate=0)
+        for _ in range(50):
+            limiter.acquire()
+        self.assertEqual(self.clock.slept, [])
+
+    def test_retry_after_blocks_every_caller_and_halves_the_rate(self) -> None:
+        limiter = self.limiter()
+        delay = limiter.on_throttled({"Retry-After": "30"})
+        self.assertGreaterEqual(delay, 30)
+        self.assertLessEqual(delay, 33)
+        self.assertEqual(limiter.rate, 1.0)
+        self.assertEqual(limiter.throttled_responses, 1)
+        limiter.acquire()
+        self.assertAlmostEqual(sum(self.clock.slept), delay)
+
+    def test_throttles_without_a_hint_back_off_exponentially(self) -> None:
+        limiter = self.limiter()
+        first = limiter.on_throttled({})
+        self.clock.now += first
+        second = limiter.on_throttled({})
+        base = sync.RATE_LIMIT_BASE_BACKOFF
+        self.assertTrue(base / 2 <= first <= base)
+        self.assertTrue(base <= second <= base * 2)
+        self.assertEqual(limiter.rate, 0.5)
+
+    def test_success_restores_the_rate_gradually(self) -> None:
+        limiter = self.limiter()
+        limiter.on_throttled({"Retry-After": "0"})
+        limiter.on_success({})
+        self.assertAlmostEqual(limiter.rate, 1.1)
+        for _ in range(40):
+            limiter.on_success({})
+        self.assertEqual(limiter.rate, 2.0)
+
+    def test_exhausted_quota_header_blocks(self) -> None:
+        limiter = self.limiter()
+        limiter.on_success({"X-Ratelimit-Remaining": "0", "X-Ratelimit-Reset": "12"})
+        limiter.acquire()
+        self.assertEqual(self.clock.slept, [12.0])
+
+    def test_retry_after_http_date(self) -> None:
+        when = sync.dt.datetime.now(sync.dt.timezone.utc) + sync.dt.timedelta(seconds=90)
+        delay = sync._retry_after_delay({"Retry-After": sync.email.utils.format_datetime(when)})
+        self.assertTrue(85 <= delay <= 90)
+        self.assertIsNone(sync._retry_after_delay({"Retry-After": "NUNCA"}))
+        self.assertIsNone(sync._retry_after_delay({}))
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.clock = FakeClock()
+        self.breaker = sync.CircuitBreaker(
+            "pexels", failure_threshold=3, slow_seconds=8.0, cooldown_seconds=60.0, clock=self.clock
+        )
+
+    def record(self, ok: bool, elapsed: float = 0.1) -> None:
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.breaker.record(elapsed, ok)
+
+    def open_circuit(self) -> None:
+        for _ in range(3):
+            self.assertTrue(self.breaker.allow())
+            self.record(ok=False)
+
+    def test_opens_after_consecutive_failures(self) -> None:
+        self.record(ok=False)
+        self.record(ok=False)
+        self.record(ok=True)
+        self.record(ok=False)
+        self.assertEqual(self.breaker.state, "closed")
+        self.record(ok=False)
+        self.record(ok=False)
+        self.assertEqual(self.breaker.state, "open")
+        self.assertFalse(self.breaker.allow())
+        self.assertEqual(self.breaker.skipped, 1)
+
+    def test_slow_calls_count_as_failures(self) -> None:
+        for _ in range(3):
+            self.record(ok=True, elapsed=9.0)
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.slow_calls, 3)
+
+    def test_half_open_lets_one_probe_through_and_closes_on_success(self) -> None:
+        self.open_circuit()
+        self.clock.now += 59
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, "half_open")
+        self.assertFalse(self.breaker.allow())
+        self.record(ok=True)
+        self.assertEqual(self.breaker.state, "closed")
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens_for_a_full_cooldown(self) -> None:
+        self.open_circuit()
+        self.clock.now += 60
+        self.assertTrue(self.breaker.allow())
+        self.record(ok=False)
+        self.assertEqual(self.breaker.state, "open")
+        self.assertEqual(self.breaker.times_opened, 2)
+        self.clock.now += 59
+        self.assertFalse(self.breaker.allow())
+        self.clock.now += 1
+        self.assertTrue(self.breaker.allow())
+
+    def test_latency_percentiles(self) -> None:
+        for elapsed in (0.1, 0.2, 0.3, 0.4, 2.0):
+            self.record(ok=True, elapsed=elapsed)
+        self.assertEqual(self.breaker.latency_percentile(0.5), 0.3)
+        self.assertEqual(self.breaker.latency_percentile(0.95), 2.0)
+
+
+def _reference_count(text: str, tokens: List[str]) -> int:
+    # THE PRE-TokenMatcher SCORER: ONE _contains_token PER TOKEN, DUPLICATES COUNTED AGAIN.
+    return sum(1 for token in tokens if sync._contains_token(text, token))
+
+
+class TokenMatcherTest(unittest.TestCase):
+    TOKENS = ["pan", "pan de molde", "pantalón", "cepillo de dientes", "Cepillo", "pan", "-logo", "3d", "t-shirt"]
+
+    def test_edge_cases_match_the_regex_scorer(self) -> None:
+        matcher = sync.TokenMatcher(self.TOKENS)
+        texts = [
+            "",
+            "pan",
+            "panadería",
+            "un pan de molde",
+            "pan de moldes",
+            "pantalon vaquero",
+            "cepillo de dientes azul",
+            "cepillo-de-dientes",
+            "company -logo vector",
+            "modelo 3d",
+            "3dmodel",
+            "t-shirt roja",
+            "pan,pan;pan",
+        ]
+        for text in texts:
+            normalized = sync._normalized_text(text)
+            with self.subTest(text):
+                self.assertEqual(matcher.count(normalized), _reference_count(normalized, self.TOKENS))
+                self.assertEqual(matcher.any(normalized), _reference_count(normalized, self.TOKENS) > 0)
+
+    def test_static_tables_match_the_regex_scorer_on_random_text(self) -> None:
+        rng = sync.random.Random(7)
+        tables = {
+            "noisy": (sync.NOISY_MATCHER, list(sync.NOISY_TOKENS)),
+            "hard_reject": (sync.HARD_REJECT_MATCHER, list(sync.HARD_REJECT_TOKENS)),
+            "place_like": (sync.PLACE_LIKE_MATCHER, list(sync.PLACE_LIKE_TOKENS)),
+            "inappropriate": (sync.INAPPROPRIATE_MATCHER, list(sync.INAPPROPRIATE_TOKENS)),
+        }
+        for category, tokens in sync.CATEGORY_KEYWORDS.items():
+            tables[category] = (sync.CATEGORY_KEYWORD_MATCHERS[category], list(tokens))
+        vocabulary = [token for _matcher, tokens in tables.values() for token in tokens]
+        vocabulary += ["foto", "de", "la", "casa", "x", "-", ",", "1"]
+        for _ in range(300):
+            words = [rng.choice(vocabulary) for _ in range(rng.randint(1, 8))]
+            # GLUE SOME WORDS TOGETHER SO PARTIAL-WORD HITS ARE TRIED TOO.
+            text = sync._normalized_text("".join(word + rng.choice([" ", "", "-", "_"]) for word in words))
+            for name, (matcher, tokens) in tables.items():
+                with self.subTest(table=name, text=text):
+                    self.assertEqual(matcher.count(text), _reference_count(text, tokens))
+
+
+class FingerprintTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.sandbox.write_image("assets/images/mesa.png", b"MESA")
+        self.item = dict(_item("T_001", "mesa", "assets/images/mesa.png"), words=["mesa", "madera"])
+        self.record = {"itemId": "T_001", "storedAs": "assets/images/mesa.png"}
+
+    def should_process(self) -> bool:
+        return sync._should_process_item(self.item, self.sandbox.root, False, False, self.record)
+
+    def test_only_search_fields_change_the_fingerprint(self) -> None:
+        fingerprint = sync._item_fingerprint(self.item)
+        self.assertEqual(sync._item_fingerprint(dict(self.item, level=3, imageAsset="otra.png")), fingerprint)
+        self.assertEqual(sync._item_fingerprint(dict(self.item, word=" mesa ")), fingerprint)
+        for changed in ({"word": "silla"}, {"category": "comida"}, {"words": ["mesa"]}):
+            with self.subTest(changed):
+                self.assertNotEqual(sync._item_fingerprint(dict(self.item, **changed)), fingerprint)
+
+    def test_changed_word_reprocesses_an_item_with_an_image(self) -> None:
+        self.record["fingerprint"] = sync._item_fingerprint(self.item)
+        self.assertFalse(self.should_process())
+        self.item["word"] = "silla"
+        self.assertTrue(self.should_process())
+
+    def test_hand_picked_images_are_not_compared(self) -> None:
+        self.record.update(fingerprint="0" * 16, storedAs="assets/images/anterior.png")
+        self.assertFalse(self.should_process())
+
+    def test_records_without_a_fingerprint_are_backfilled_as_current(self) -> None:
+        other = {"itemId": "T_002", "storedAs": "assets/images/anterior.png"}
+        items = [self.item, _item("T_002", "silla", "assets/images/silla.png")]
+        added = sync._backfill_fingerprints(items, {"T_001": self.record, "T_002": other})
+        self.assertEqual(added, 1)
+        self.assertEqual(self.record["fingerprint"], sync._item_fingerprint(self.item))
+        self.assertNotIn("fingerprint", other)
+        self.assertFalse(self.should_process())
+
+
+class PlanSearchesTest(unittest.TestCase):
+    PROVIDERS = ["arasaac", "pexels"]
+
+    def setUp(self) -> None:
+        self.mesa = _item("T_001", "mesa")
+        # SAME WORD IN ANOTHER LEVEL: EVERY QUERY REPEATS.
+        self.mesa_again = dict(_item("T_002", "mesa"), level=2)
+        self.silla = _item("T_003", "silla")
+
+    def test_each_request_is_planned_once_and_covers_every_item(self) -> None:
+        items = [self.mesa, self.mesa_again, self.silla]
+        searches, _stats = sync._plan_searches(items, self.PROVIDERS)
+        keys = [(provider, sync._provider_request_key(provider, query)) for provider, query in searches]
+        self.assertEqual(len(keys), len(set(keys)))
+        for item in items:
+            for query in sync._build_query_variants(item):
+                for provider in self.PROVIDERS:
+                    with self.subTest(item=item["id"], provider=provider, query=query):
+                        self.assertIn((provider, sync._provider_request_key(provider, query)), keys)
+        # ARASAAC ONLY SEES THE FIRST WORD, SO MOST VARIANTS COLLAPSE INTO A FEW SEARCHES.
+        arasaac_queries = [query for item in items for query in sync._build_query_variants(item)]
+        arasaac_keys = [key for provider, key in keys if provider == "arasaac"]
+        self.assertLess(len(arasaac_keys), len(set(arasaac_queries)))
+
+    def test_stats_count_naive_exact_and_planned_requests(self) -> None:
+        _searches, single = sync._plan_searches([self.mesa], self.PROVIDERS)
+        _searches, repeated = sync._plan_searches([self.mesa, self.mesa_again], self.PROVIDERS)
+        for provider in self.PROVIDERS:
+            with self.subTest(provider):
+                self.assertEqual(repeated[provider]["naive"], 2 * single[provider]["naive"])
+                self.assertEqual(repeated[provider]["exact"], single[provider]["exact"])
+                self.assertEqual(repeated[provider]["planned"], single[provider]["planned"])
+                self.assertLessEqual(single[provider]["planned"], single[provider]["exact"])
+        variants = sync._build_query_variants(self.mesa)
+        self.assertEqual(single["pexels"]["planned"], len(variants))
+        arasaac_terms = {term for query in variants for term in sync._arasaac_search_terms(query)}
+        self.assertEqual(single["arasaac"]["planned"], len(arasaac_terms))
+        self.assertLess(single["arasaac"]["planned"], single["arasaac"]["exact"])
+
+    def test_offline_providers_plan_no_requests(self) -> None:
+        searches, stats = sync._plan_searches([self.mesa, self.silla], self.PROVIDERS, ["arasaac"])
+        self.assertEqual(stats["arasaac"]["planned"], 0)
+        self.assertGreater(stats["arasaac"]["searches"], 0)
+        self.assertIn("arasaac", {provider for provider, _query in searches})
+
+
+def _raw_candidate(provider: str, title: str, **extra: Any) -> Dict[str, Any]:
+    return {
+        "provider": provider,
+        "image_url": f"https://{provider}.test/{title.replace(' ', '_')}.png",
+        "source_page": f"https://{provider}.test/",
+        "title": title,
+        "license": "CC BY-SA",
+        "width": 1000,
+        "height": 800,
+        "mime": "image/png",
+        **extra,
+    }
+
+
+class EarlyExitTest(unittest.TestCase):
+    # _process_item WITH CANNED SEARCH RESPONSES: ARASAAC ANSWERS THE FIRST VARIANT WITH A CONFIDENT
+    # PICTOGRAM (SCORE ABOVE THE DEFAULT THRESHOLD); PEXELS ONLY HAS A WEAKER PHOTO ON A LATER VARIANT.
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.item = _item("T_001", "mesa")
+        self.item["category"] = "COSAS DE CASA"
+        self.queries = sync._build_query_variants(self.item)
+        self.searched: List[Tuple[str, str]] = []
+        self.failing_urls: set = set()
+
+    def session(self, early_exit: bool) -> Dict[str, Any]:
+        args = sync.argparse.Namespace(
+            early_exit=early_exit,
+            confidence_threshold=sync.DEFAULT_CONFIDENCE_THRESHOLD,
+            interactive=False,
+            search_local=False,
+            probe=False,
+            dry_run=False,
+            min_width=200,
+            min_height=200,
+            require_free_license=False,
+            accept_google_rights_filter=False,
+            auto_retry_candidates=1,
+            max_bytes=10_000_000,
+        )
+        return {
+            "args": args,
+            "providers": ["arasaac", "pexels"],
+            "known_rejected": {},
+            "provider_executors": {},
+            "network_searches": set(),
+            "download_dir": self.sandbox.root,
+        }
+
+    def search(self, _session: Dict[str, Any], provider: str, query: str) -> List[Dict[str, Any]]:
+        self.searched.append((provider, query))
+        if provider == "arasaac" and query == self.queries[0]:
+            return [_raw_candidate("arasaac", "mesa", _relevance=1.0)]
+        if provider == "pexels" and query == self.queries[-1]:
+            return [_raw_candidate("pexels", "wooden table furniture")]
+        return []
+
+    def download(self, url: str, temp_dir: Path, _max_bytes: int, timeout: Optional[float] = None) -> Dict[str, Any]:
+        if url in self.failing_urls:
+            raise sync.URLError("connection refused")
+        path = temp_dir / f"{len(self.searched)}.part"
+        path.write_bytes(url.encode("utf-8"))
+        digest = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return {"path": path, "sha256": digest, "size": len(url), "mime": "image/png", "width": 1000, "height": 800}
+
+    def process(self, early_exit: bool) -> Dict[str, Any]:
+        with mock.patch.object(sync, "_search_provider_cached", self.search), mock.patch.object(
+            sync, "_download_to_temp", self.download
+        ), mock.patch.object(sync, "_looks_like_text_document", return_value=False), contextlib.redirect_stdout(
+            io.StringIO()
+        ):
+            return sync._process_item(self.item, self.session(early_exit))
+
+    def test_stops_after_the_first_confident_variant(self) -> None:
+        result = self.process(early_exit=True)
+        self.assertEqual(result["status"], "updated")
+        self.assertTrue(result["early_exit"])
+        self.assertEqual(result["chosen"]["provider"], "arasaac")
+        self.assertEqual({query for _provider, query in self.searched}, {self.queries[0]})
+
+    def test_without_early_exit_every_variant_is_searched(self) -> None:
+        result = self.process(early_exit=False)
+        self.assertEqual(result["status"], "updated")
+        self.assertFalse(result["early_exit"])
+        self.assertEqual(result["chosen"]["provider"], "arasaac")
+        self.assertEqual(len(self.searched), 2 * len(self.queries))
+
+    def test_failed_early_pick_falls_back_to_the_remaining_variants(self) -> None:
+        self.failing_urls.add(_raw_candidate("arasaac", "mesa")["image_url"])
+        result = self.process(early_exit=True)
+        self.assertEqual(result["status"], "updated")
+        self.assertEqual(result["chosen"]["provider"], "pexels")
+        self.assertEqual(len(self.searched), 2 * len(self.queries))
+        self.assertIn(_raw_candidate("arasaac", "mesa")["image_url"], result["attempt"]["rejectedUrls"])
+
+
+class ArasaacCatalogTest(unittest.TestCase):
+    ENTRIES = [
+        {"_id": 101, "keywords": [{"keyword": "mesa", "plural": "mesas"}]},
+        {"_id": 102, "keywords": [{"keyword": "mesa de noche"}, {"keyword": "mesilla"}]},
+        {"_id": 103, "keywords": [{"keyword": "Camión", "plural": "camiones"}]},
+        {"_id": 101, "keywords": [{"keyword": "duplicado"}]},
+        {"keywords": [{"keyword": "sin id"}]},
+        "ROTO",
+    ]
+
+    def setUp(self) -> None:
+        self.catalog = sync.ArasaacCatalog.from_entries(self.ENTRIES)
+
+    def ids(self, term: str) -> List[str]:
+        return [entry["_id"] for entry in self.catalog.lookup(term)]
+
+    def test_lookup_matches_every_word_deaccented(self) -> None:
+        self.assertEqual(self.ids("mesa"), ["101", "102"])
+        self.assertEqual(self.ids("MESA NOCHE"), ["102"])
+        self.assertEqual(self.ids("camion"), ["103"])
+        self.assertEqual(self.ids("CAMIÓN"), ["103"])
+        self.assertEqual(self.ids("mesa camion"), [])
+        self.assertEqual(self.ids(""), [])
+
+    def test_plurals_are_searchable_but_not_keywords(self) -> None:
+        self.assertEqual(self.ids("mesas"), ["101"])
+        self.assertEqual(self.catalog.lookup("mesas")[0]["keywords"], [{"keyword": "mesa"}])
+
+    def test_first_entry_wins_and_malformed_entries_are_skipped(self) -> None:
+        self.assertEqual(sorted(self.catalog.keywords), ["101", "102", "103"])
+        self.assertEqual(self.ids("duplicado"), [])
+
+    def test_save_and_load_round_trip(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "cache" / sync.ARASAAC_CATALOG_NAME
+            self.catalog.save(path)
+            loaded = sync.ArasaacCatalog.load(path)
+            self.assertIsNotNone(loaded)
+            self.assertEqual(loaded.lookup("mesa noche"), self.catalog.lookup("mesa noche"))
+            self.assertLess(loaded.age_hours(), 1)
+            path.write_bytes(b"NOT GZIP")
+            self.assertIsNone(sync.ArasaacCatalog.load(path))
+        self.assertIsNone(sync.ArasaacCatalog.load(Path(tmp) / "missing.json.gz"))
+
+    def test_search_answers_from_the_catalog_without_the_network(self) -> None:
+        with mock.patch.object(sync, "_ARASAAC_CATALOG", self.catalog), mock.patch.object(
+            sync, "_fetch_text", side_effect=AssertionError("NETWORK")
+        ):
+            results = sync._search_arasaac("mesa photo", 10)
+        # THE EXACT KEYWORD RANKS ABOVE "mesa de noche".
+        self.assertEqual(results[0]["source_page"], "https://arasaac.org/pictograms/101")
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(result["provider"] == "arasaac" for result in results))
+
+
+class CandidateStoreTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        try:
+            self.store = sync.CandidateStore(self.sandbox.root / ".cache" / sync.CANDIDATE_STORE_NAME)
+        except sync.sqlite3.OperationalError:
+            self.skipTest("SQLITE SIN FTS5")
+        self.addCleanup(self.store.close)
+
+    def titles(self, query: str, providers: List[str]) -> List[str]:
+        return [raw["title"] for raw in self.store.search(query, providers)]
+
+    def test_search_matches_any_word_deaccented_and_filters_providers(self) -> None:
+        self.store.add("pexels", "mesa photo", [_raw_candidate("pexels", "mesa de cocina")])
+        self.store.add("openverse", "table photo", [_raw_candidate("openverse", "wooden table")])
+        self.store.add("arasaac", "camion", [_raw_candidate("arasaac", "camión")])
+        self.assertEqual(self.titles("mesa", ["pexels", "openverse"]), ["mesa de cocina"])
+        self.assertEqual(sorted(self.titles("table mesa", ["pexels", "openverse"])), ["mesa de cocina", "wooden table"])
+        self.assertEqual(self.titles("table", ["pexels"]), [])
+        self.assertEqual(self.titles("CAMIÓN", ["arasaac"]), ["camión"])
+        self.assertEqual(self.titles("", ["pexels"]), [])
+        self.assertEqual(self.titles("mesa", []), [])
+
+    def test_best_match_comes_first(self) -> None:
+        self.store.add("pexels", "wooden", [_raw_candidate("pexels", "wooden chair")])
+        self.store.add("pexels", "wooden table", [_raw_candidate("pexels", "wooden table")])
+        self.assertEqual(self.titles("wooden table", ["pexels"]), ["wooden table", "wooden chair"])
+
+    def test_same_url_is_stored_once_and_remembers_every_query(self) -> None:
+        raw = _raw_candidate("arasaac", "mesa", _relevance=20.0)
+        self.store.add("arasaac", "mesa photo", [raw])
+        self.store.add("arasaac", "mesa cocina", [raw])
+        self.store.add("arasaac", "mesa cocina", [raw])
+        self.assertEqual((self.store.count(), self.store.added), (1, 1))
+        # THE QUERIES THAT FOUND IT ARE SEARCHABLE TOO.
+        self.assertEqual(self.titles("cocina", ["arasaac"]), ["mesa"])
+        # PER-QUERY KEYS ("_relevance") ARE NOT STORED.
+        self.assertNotIn("_relevance", self.store.search("mesa", ["arasaac"])[0])
+
+    def test_store_survives_reopening(self) -> None:
+        self.store.add("pexels", "mesa", [_raw_candidate("pexels", "mesa")])
+        self.store.close()
+        self.store = sync.CandidateStore(self.store.path)
+        self.assertEqual(self.titles("mesa", ["pexels"]), ["mesa"])
+
+
+class CandidateStoreWithoutFts5Test(unittest.TestCase):
+    # WITHOUT FTS5 THE STORE CANNOT BE OPENED: sync GOES ON WITHOUT IT AND --search-local IS REFUSED.
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.sandbox.write_dataset([_item("T_001", "mesa")])
+
+    def sync_run(self, *extra: str) -> Tuple[int, str]:
+        output = io.StringIO()
+        no_fts5 = sync.sqlite3.OperationalError("no such module: fts5")
+        argv = ["--root", str(self.sandbox.root), "--item-id", "NINGUNO", "--no-cache", *extra]
+        with mock.patch.object(sync.CandidateStore, "__init__", side_effect=no_fts5), contextlib.redirect_stdout(
+            output
+        ):
+            code = sync.main(argv)
+        return code, output.getvalue()
+
+    def test_sync_goes_on_without_the_store(self) -> None:
+        code, output = self.sync_run()
+        self.assertEqual(code, 0)
+        self.assertIn("[WARN] ÍNDICE DE CANDIDATOS DESACTIVADO", output)
+
+    def test_search_local_is_refused(self) -> None:
+        code, output = self.sync_run("--search-local")
+        self.assertEqual(code, 1)
+        self.assertIn("--search-local NECESITA SQLITE CON FTS5", output)
+
+
+class RawHttpServer:
+    # ANSWERS EVERY CONNECTION WITH THE SAME RAW BYTES, THEN HANGS UP.
+    def __init__(self, payload: bytes) -> None:
+        self.payload = payload
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen()
+        self.url = f"http://127.0.0.1:{self.listener.getsockname()[1]}/"
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self) -> None:
+        while True:
+            try:
+                conn, _ = self.listener.accept()
+            except OSError:
+                return
+            with conn:
+                conn.recv(65536)
+                conn.sendall(self.payload)
+
+    def close(self) -> None:
+        self.listener.close()
+
+
+class HttpClientErrorTest(unittest.TestCase):
+    def open_client(self, payload: bytes) -> Tuple[sync.HttpClient, str]:
+        server = RawHttpServer(payload)
+        self.addCleanup(server.close)
+        client = sync.HttpClient(pool_size=1, timeout=5, connect_timeout=5)
+        self.addCleanup(client.close)
+        return client, server.url
+
+    def assert_slot_free(self, client: sync.HttpClient) -> None:
+        # THE FAILED CONNECTION WAS DROPPED AND ITS SLOT HANDED BACK.
+        self.assertEqual(client._idle, {})
+        slot = next(iter(client._slots.values()))
+        self.assertTrue(slot.acquire(blocking=False))
+        slot.release()
+
+    def test_bad_status_line_is_a_url_error(self) -> None:
+        client, url = self.open_client(b"NOT HTTP AT ALL\r\n\r\n")
+        with self.assertRaises(sync.URLError) as caught:
+            client.get(url)
+        self.assertIsInstance(caught.exception.reason, sync.http.client.BadStatusLine)
+        self.assert_slot_free(client)
+
+    def test_truncated_body_is_a_url_error(self) -> None:
+        client, url = self.open_client(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nshort")
+        with self.assertRaises(sync.URLError) as caught:
+            client.get(url)
+        self.assertIsInstance(caught.exception.reason, sync.http.client.IncompleteRead)
+        self.assert_slot_free(client)
+
+    def test_streamed_truncated_body_is_a_url_error(self) -> None:
+        client, url = self.open_client(b"HTTP/1.1 200 OK\r\nContent-Length: 100\r\n\r\nshort")
+        with client.open(url) as response:
+            with self.assertRaises(sync.URLError):
+                while response.read(64):
+                    pass
+        self.assert_slot_free(client)
+
+
+class CacheOnlyMissTest(unittest.TestCase):
+    def test_misses_are_counted_and_summarised_once(self) -> None:
+        sandbox = ProjectSandbox()
+        self.addCleanup(sandbox.close)
+        sandbox.write_dataset([_item("T_001", "mesa"), _item("T_002", "silla")])
+        output = io.StringIO()
+        argv = ["--root", str(sandbox.root), "--cache-only", "--dry-run", "--force", "--providers", "arasaac,openverse"]
+        with contextlib.redirect_stdout(output):
+            sync.main(argv)
+        lines = output.getvalue().splitlines()
+
+        self.assertFalse([line for line in lines if "ERROR EN PROVEEDOR" in line])
+        summary = [line for line in lines if "SIN RESPUESTA EN CACHÉ (--cache-only)" in line]
+        self.assertEqual(len(summary), 1)
+        report_path = sandbox.root / sync.DEFAULT_CACHE_DIR / sync.DEFAULT_REPORT_NAME
+        misses = json.loads(report_path.read_text(encoding="utf-8"))["cacheOnlyMisses"]
+        self.assertEqual(set(misses), {"arasaac", "openverse"})
+        self.assertIn(f": {sum(misses.values())} (", summary[0])
+
+
+class SleepPacingTest(unittest.TestCase):
+    # --sleep ONLY FOLLOWS ITEMS THAT ASKED A PROVIDER OVER THE NETWORK.
+    def setUp(self) -> None:
+        self.sandbox = ProjectSandbox()
+        self.addCleanup(self.sandbox.close)
+        self.sandbox.write_dataset([_item("T_001", "mesa"), _item("T_002", "silla")])
+
+    def pauses(self, *extra: str) -> List[float]:
+        client = mock.Mock()
+        client.open.side_effect = sync.URLError("SIN RED")
+        argv = ["--root", str(self.sandbox.root), "--force", "--dry-run", "--providers", "openverse", "--sleep", "7"]
+        with mock.patch.object(sync, "_http_client", return_value=client), mock.patch.object(
+            sync.time, "sleep"
+        ) as sleep, contextlib.redirect_stdout(io.StringIO()):
+            sync.main([*argv, *extra])
+        return [call.args[0] for call in sleep.call_args_list if call.args == (7.0,)]
+
+    def test_items_that_searched_are_followed_by_the_pause(self) -> None:
+        self.assertEqual(len(self.pauses("--no-cache")), 2)
+        self.assertEqual(len(self.pauses("--no-cache", "--workers", "2")), 2)
+
+    def test_items_served_without_requests_skip_the_pause(self) -> None:
+        self.assertEqual(self.pauses("--cache-only"), [])
+        self.assertEqual(self.pauses("--cache-only", "--workers", "2"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()